@@ -0,0 +1,114 @@
+# batching.py
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import torch
+from loguru import logger
+
+
+class BackboneRequest:
+    """单个会话提交的骨干网络推理请求"""
+
+    def __init__(self, net, im_patches):
+        self.net = net
+        self.im_patches = im_patches
+        self.future = Future()
+
+    def group_key(self):
+        # 同一个权重文件加载出的网络参数相同, 因此不同会话各自持有的网络实例也可以合并为一个批次
+        net_key = getattr(self.net, 'net_path', None) or id(self.net)
+        return net_key, tuple(self.im_patches.shape[1:])
+
+
+class BatchedBackboneScheduler:
+    """
+    跨会话批量推理调度器
+
+    在 batch_window 时间窗口内收集各会话待处理的搜索区域图像块, 按网络和图像块尺寸分组,
+    拼接后只调用一次 net.extract_backbone, 再把特征按会话切分回去,
+    由各会话线程继续执行 DiMP.track_from_backbone.
+    """
+
+    def __init__(self, batch_window=0.002, max_batch_size=16):
+        """
+        Args:
+            batch_window: 收集同批请求的时间窗口 (秒)
+            max_batch_size: 每批最多合并的请求数
+        """
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.requests = queue.Queue()
+        self.stop_event = threading.Event()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def extract_backbone(self, net, im_patches):
+        """
+        提交图像块并阻塞等待批量推理结果, 可直接作为 PyTrackingWrapper.update 的 backbone_fn
+
+        Returns:
+            OrderedDict: 该会话图像块对应的骨干网络特征
+        """
+        request = BackboneRequest(net, im_patches)
+        self.requests.put(request)
+        return request.future.result()
+
+    def _collect_batch(self):
+        """阻塞等待第一个请求, 然后在时间窗口内继续收集请求"""
+        try:
+            batch = [self.requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0:
+                    batch.append(self.requests.get(timeout=timeout))
+                else:
+                    batch.append(self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            groups = OrderedDict()
+            for request in batch:
+                groups.setdefault(request.group_key(), []).append(request)
+
+            for requests in groups.values():
+                try:
+                    self._forward(requests)
+                except Exception as e:
+                    logger.error(f"批量骨干网络推理失败: {e}")
+                    for request in requests:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+
+    def _forward(self, requests):
+        net = requests[0].net
+        im_patches = torch.cat([request.im_patches for request in requests])
+        logger.debug(f"批量骨干网络推理: {len(requests)} 个会话, 输入 {tuple(im_patches.shape)}")
+
+        with torch.no_grad():
+            backbone_feat = net.extract_backbone(im_patches)
+
+        # 按会话切分特征
+        start = 0
+        for request in requests:
+            end = start + request.im_patches.shape[0]
+            request.future.set_result(OrderedDict((k, v[start:end]) for k, v in backbone_feat.items()))
+            start = end
+
+    def stop(self):
+        self.stop_event.set()
+        self.worker.join()
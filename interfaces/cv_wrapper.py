@@ -1,12 +1,15 @@
 import cv2
 import sys
 import os
+from collections import OrderedDict
 import numpy as np
 
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from pytracking.evaluation import Tracker as PyTracker
+from pytracking.evaluation.model_registry import model_registry
+from pytracking.evaluation.multi_object_wrapper import MultiObjectWrapper
 
 
 class PyTrackingWrapper:
@@ -14,19 +17,24 @@ class PyTrackingWrapper:
     将PyTracking封装成类似OpenCV Tracker的API
     """
     
-    def __init__(self, tracker_name="dimp", tracker_param="dimp50"):
+    def __init__(self, tracker_name="dimp", tracker_param="dimp50", shared_model=False):
         """
         初始化追踪器
         
         Args:
             tracker_name: 追踪器名称 (如: dimp, atom, kys等)
             tracker_param: 追踪器参数配置 (如: dimp50, dimp18, default等)
+            shared_model: 是否使用进程内共享的网络 (同一追踪器配置的网络只加载一次, 权重只读共享,
+                          每个实例只保存自己的跟踪状态)
         """
         self.tracker_name = tracker_name
         self.tracker_param = tracker_param
+        self.shared_model = shared_model
         self.tracker = PyTracker(tracker_name, tracker_param)
         self.tracker_instance = None
         self.initialized = False
+        self.multi_object = False
+        self.object_ids = []
         
     def init(self, image, bbox):
         """
@@ -41,7 +49,10 @@ class PyTrackingWrapper:
         """
         try:
             # 创建追踪器实例
-            self.tracker_instance = self.tracker.create_tracker(self.tracker.get_parameters())
+            if self.shared_model:
+                self.tracker_instance = model_registry.create_tracker(self.tracker)
+            else:
+                self.tracker_instance = self.tracker.create_tracker(self.tracker.get_parameters())
             
             # 初始化特征
             if hasattr(self.tracker_instance, 'initialize_features'):
@@ -52,18 +63,143 @@ class PyTrackingWrapper:
             
             # 初始化追踪器
             self.tracker_instance.initialize(image, init_info)
+            self.multi_object = False
             self.initialized = True
             return True
         except Exception as e:
             print(f"初始化失败: {e}")
             return False
+
+    def init_multi(self, image, bboxes):
+        """
+        初始化多目标追踪, 所有目标共用同一帧图像, 由 MultiObjectWrapper 跟踪
+        (追踪器支持时各目标的骨干网络、分类和滤波器优化合并为一次批量计算, 见 DiMP.track_multiple)
+
+        Args:
+            image: 输入图像 (numpy array)
+            bboxes: 以目标ID为键的边界框字典 {obj_id: [x, y, width, height]}
+
+        Returns:
+            bool: 初始化是否成功
+        """
+        try:
+            params = self.tracker.get_parameters()
+            if self.shared_model:
+                # 各目标的追踪器共享已加载的网络
+                tracker_factory = lambda: model_registry.create_tracker(self.tracker)
+                self.tracker_instance = MultiObjectWrapper(self.tracker.tracker_class, params,
+                                                           tracker_factory=tracker_factory, batched=True)
+            else:
+                self.tracker_instance = MultiObjectWrapper(self.tracker.tracker_class, params, fast_load=True,
+                                                           batched=True)
+
+            self.object_ids = list(bboxes.keys())
+            init_info = {'init_object_ids': list(self.object_ids),
+                         'object_ids': list(self.object_ids),
+                         'sequence_object_ids': self.object_ids,
+                         'init_bbox': OrderedDict(bboxes)}
+
+            self.tracker_instance.initialize(image, init_info)
+            self.multi_object = True
+            self.initialized = True
+            return True
+        except Exception as e:
+            print(f"初始化失败: {e}")
+            return False
+
+    def update_multi(self, image, image_offset=None, add_bboxes=None, remove_ids=None):
+        """
+        更新多目标追踪
+
+        Args:
+            image: 输入图像 (numpy array)
+            image_offset: 可选, image 为完整图像中一块区域时该区域左上角坐标 (x, y). 添加新目标时需为完整图像
+            add_bboxes: 可选, 在这一帧新加入的目标 {obj_id: [x, y, width, height]}
+            remove_ids: 可选, 不再跟踪的目标ID列表
+
+        Returns:
+            dict: {obj_id: bbox}, 跟踪失败的目标 bbox 为 None
+        """
+        if not self.initialized or not self.multi_object:
+            return {}
+
+        try:
+            if remove_ids:
+                self.tracker_instance.remove_objects(remove_ids)
+                self.object_ids = [obj_id for obj_id in self.object_ids if obj_id not in remove_ids]
+
+            info = {}
+            if image_offset is not None:
+                info['image_offset'] = image_offset
+            if add_bboxes:
+                new_ids = [obj_id for obj_id in add_bboxes.keys() if obj_id not in self.object_ids]
+                self.object_ids.extend(new_ids)
+                info['init_object_ids'] = new_ids
+                info['init_bbox'] = OrderedDict(add_bboxes)
+            info['sequence_object_ids'] = self.object_ids
+
+            if not self.object_ids:
+                return {}
+
+            output = self.tracker_instance.track(image, info)
+            boxes = output.get('target_bbox', {})
+            return {obj_id: self._to_int_bbox(boxes.get(obj_id)) for obj_id in self.object_ids}
+        except Exception as e:
+            print(f"追踪失败: {e}")
+            return {obj_id: None for obj_id in self.object_ids}
+
+    @staticmethod
+    def _to_int_bbox(bbox):
+        """确保bbox是正确的格式并转换为整数, 格式不对时返回 None"""
+        if isinstance(bbox, (list, tuple)) and len(bbox) == 4:
+            return [int(coord) for coord in bbox]
+        elif isinstance(bbox, np.ndarray) and bbox.shape[0] == 4:
+            return [int(coord) for coord in bbox.tolist()]
+        return None
     
-    def update(self, image):
+    def supports_external_backbone(self):
+        """追踪器是否支持在外部(例如跨会话批量)执行骨干网络推理"""
+        return self.tracker_instance is not None and hasattr(self.tracker_instance, 'track_from_backbone')
+
+    def search_region(self):
+        """
+        下一帧追踪所需的图像区域 [x, y, width, height], 多目标时为各目标区域的并集, 追踪器不支持时返回 None
+        """
+        if self.tracker_instance is None:
+            return None
+
+        if self.multi_object:
+            trackers = [self.tracker_instance.trackers[obj_id] for obj_id in self.tracker_instance.initialized_ids]
+        else:
+            trackers = [self.tracker_instance]
+        if not trackers or not all(hasattr(t, 'get_next_search_region') for t in trackers):
+            return None
+
+        regions = [t.get_next_search_region() for t in trackers]
+        x0 = min(r[0] for r in regions)
+        y0 = min(r[1] for r in regions)
+        x1 = max(r[0] + r[2] for r in regions)
+        y1 = max(r[1] + r[3] for r in regions)
+        return [x0, y0, x1 - x0, y1 - y0]
+
+    def _track_with_backbone_fn(self, image, info, backbone_fn):
+        """拆分执行一次追踪: 采样搜索区域 -> backbone_fn 提取骨干特征 -> 定位与模型更新"""
+        tracker = self.tracker_instance
+        im = tracker.prepare_frame(image, info)
+        im_patches, sample_coords = tracker.sample_search_patches(im)
+        backbone_feat = backbone_fn(tracker.net, im_patches)
+        return tracker.track_from_backbone(backbone_feat, sample_coords)
+
+    def update(self, image, backbone_fn=None, image_offset=None):
         """
         更新追踪器
         
         Args:
             image: 输入图像 (numpy array)
+            backbone_fn: 可选, 形如 backbone_fn(net, im_patches) -> backbone_feat 的函数,
+                         用于替代追踪器内部的骨干网络推理 (如跨会话批量推理)
+            image_offset: 可选, image 为完整图像中的一块区域时, 该区域左上角在完整图像中的坐标 (x, y).
+                          返回的边界框仍为完整图像坐标
             
         Returns:
             tuple: (success, bbox) 
@@ -74,20 +210,20 @@ class PyTrackingWrapper:
             return False, None
             
         try:
+            info = {}
+            if image_offset is not None:
+                info['image_offset'] = image_offset
+
             # 执行追踪
-            output = self.tracker_instance.track(image, {})
+            if backbone_fn is not None and self.supports_external_backbone():
+                output = self._track_with_backbone_fn(image, info, backbone_fn)
+            else:
+                output = self.tracker_instance.track(image, info)
             
             # 获取边界框
             if 'target_bbox' in output:
-                bbox = output['target_bbox']
-                # 确保bbox是正确的格式并转换为整数
-                if isinstance(bbox, (list, tuple)) and len(bbox) == 4:
-                    # 转换为整数并返回
-                    int_bbox = [int(coord) for coord in bbox]
-                    return True, int_bbox
-                elif isinstance(bbox, np.ndarray) and bbox.shape[0] == 4:
-                    # 转换为整数并返回
-                    int_bbox = [int(coord) for coord in bbox.tolist()]
+                int_bbox = self._to_int_bbox(output['target_bbox'])
+                if int_bbox is not None:
                     return True, int_bbox
             
             return False, None
@@ -96,34 +232,35 @@ class PyTrackingWrapper:
             return False, None
 
 
-def create_pytracker(tracker_name="dimp", tracker_param="dimp50"):
+def create_pytracker(tracker_name="dimp", tracker_param="dimp50", shared_model=False):
     """
     创建PyTracking追踪器的工厂函数，模仿OpenCV的create函数
     
     Args:
         tracker_name: 追踪器名称
         tracker_param: 追踪器参数
+        shared_model: 是否使用进程内共享的网络
         
     Returns:
         PyTrackingWrapper: 封装好的追踪器实例
     """
-    return PyTrackingWrapper(tracker_name, tracker_param)
+    return PyTrackingWrapper(tracker_name, tracker_param, shared_model)
 
 
 # 提供一些常用的追踪器创建函数，模仿OpenCV的API风格
-def TrackerDiMP_create():
+def TrackerDiMP_create(shared_model=False):
     """创建DiMP追踪器"""
-    return PyTrackingWrapper("dimp", "dimp50")
+    return PyTrackingWrapper("dimp", "dimp50", shared_model)
 
 
-def TrackerATOM_create():
+def TrackerATOM_create(shared_model=False):
     """创建ATOM追踪器"""
-    return PyTrackingWrapper("atom", "default")
+    return PyTrackingWrapper("atom", "default", shared_model)
 
 
-def TrackerKYS_create():
+def TrackerKYS_create(shared_model=False):
     """创建KYS追踪器"""
-    return PyTrackingWrapper("kys", "default")
+    return PyTrackingWrapper("kys", "default", shared_model)
 
 
 # 使用示例
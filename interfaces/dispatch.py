@@ -0,0 +1,57 @@
+# dispatch.py
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+
+class SessionDispatcher:
+    """
+    按会话分发请求的线程池
+
+    同一会话的请求按到达顺序串行执行 (保证帧顺序和跟踪器状态一致),
+    不同会话的请求在线程池中并行执行, 因此某个会话耗时的 init 不会阻塞其他会话的 update.
+    """
+
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-worker")
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def submit(self, session_id, fn):
+        """提交一个无参数的任务到指定会话的队列"""
+        with self.lock:
+            session_queue = self.queues.setdefault(session_id, deque())
+            session_queue.append(fn)
+            # 队列中已有任务时, 说明该会话已有线程在处理, 由其依次执行
+            if len(session_queue) > 1:
+                return
+        self.executor.submit(self._drain, session_id)
+
+    def pending(self, session_id=None):
+        """返回指定会话 (或所有会话) 排队中的任务数"""
+        with self.lock:
+            if session_id is not None:
+                return len(self.queues.get(session_id, ()))
+            return sum(len(q) for q in self.queues.values())
+
+    def _drain(self, session_id):
+        while True:
+            with self.lock:
+                fn = self.queues[session_id][0]
+
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"会话 {session_id} 任务执行失败: {e}")
+
+            with self.lock:
+                session_queue = self.queues[session_id]
+                session_queue.popleft()
+                if not session_queue:
+                    del self.queues[session_id]
+                    return
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,153 @@
+# frame_transport.py
+import threading
+from multiprocessing import shared_memory, resource_tracker
+
+import cv2
+import numpy as np
+from loguru import logger
+
+
+# 帧传输方式:
+#   jpeg: 帧编码为 JPEG 放在 multipart 第二部分 (默认, 适合远程客户端)
+#   raw:  原始像素放在 multipart 第二部分, 元数据中带 shape/dtype, 无编解码
+#   shm:  帧写入 POSIX 共享内存环形缓冲区, 消息中只带位置信息, 服务端直接构建 NumPy 视图 (仅限同机客户端)
+FRAME_ENCODINGS = ("jpeg", "raw", "shm")
+
+
+def encode_jpeg(frame, quality=80):
+    """编码图像为JPEG（二进制）"""
+    _, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buf.tobytes()
+
+
+def raw_frame_info(frame):
+    """raw 传输的帧元数据"""
+    return {"encoding": "raw", "shape": list(frame.shape), "dtype": str(frame.dtype)}
+
+
+class SharedMemoryRing:
+    """
+    客户端的共享内存环形缓冲区
+
+    每一帧写入下一个槽位, 槽位数需大于同时在途的帧数, 保证服务端读取时该槽位不会被覆盖.
+    """
+
+    def __init__(self, slot_size, num_slots):
+        self.slot_size = slot_size
+        self.num_slots = num_slots
+        self.next_slot = 0
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_size * num_slots)
+
+    def write(self, frame):
+        """把帧拷贝到下一个槽位, 返回服务端读取所需的帧元数据"""
+        offset = self.next_slot * self.slot_size
+        self.next_slot = (self.next_slot + 1) % self.num_slots
+
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf, offset=offset)
+        view[...] = frame
+
+        return {"encoding": "shm", "name": self.shm.name, "offset": offset,
+                "shape": list(frame.shape), "dtype": str(frame.dtype)}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _frame_nbytes(shape, dtype):
+    return int(np.prod(shape)) * dtype.itemsize
+
+
+class FrameDecoder:
+    """
+    服务端帧解码, 支持 jpeg / raw / shm 三种传输方式
+
+    共享内存段按会话缓存, 客户端更换缓冲区或释放会话时关闭.
+    """
+
+    def __init__(self):
+        self.segments = {}
+        self.lock = threading.Lock()
+
+    def decode(self, buf, frame_info=None, session_id=None):
+        """
+        Args:
+            buf: multipart 中的帧数据 (shm 方式为 None)
+            frame_info: 消息元数据中的 "frame" 字段, None 表示 JPEG
+            session_id: 会话ID, 用于缓存共享内存段
+
+        Returns:
+            np.ndarray: 图像, 解码失败时返回 None
+        """
+        encoding = (frame_info or {}).get("encoding", "jpeg")
+        try:
+            if encoding == "jpeg":
+                if buf is None:
+                    return None
+                np_arr = np.frombuffer(buf, dtype=np.uint8)
+                return cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+
+            shape = tuple(int(s) for s in frame_info["shape"])
+            dtype = np.dtype(frame_info.get("dtype", "uint8"))
+            nbytes = _frame_nbytes(shape, dtype)
+
+            if encoding == "raw":
+                if buf is None or len(buf) != nbytes:
+                    logger.error(f"raw 帧数据长度不匹配: {len(buf) if buf is not None else 0}, 期望: {nbytes}")
+                    return None
+                # 直接在接收缓冲区上构建只读视图, 不做拷贝
+                return np.frombuffer(buf, dtype=dtype).reshape(shape)
+
+            if encoding == "shm":
+                shm = self._attach(session_id, frame_info["name"])
+                offset = int(frame_info["offset"])
+                if offset < 0 or offset + nbytes > shm.size:
+                    logger.error(f"共享内存帧越界: offset={offset}, nbytes={nbytes}, size={shm.size}")
+                    return None
+                return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+        except Exception as e:
+            logger.error(f"帧解码失败 ({encoding}): {e}")
+            return None
+
+        logger.error(f"未知的帧传输方式: {encoding}")
+        return None
+
+    def _attach(self, session_id, name):
+        with self.lock:
+            shm = self.segments.get(session_id)
+            if shm is not None and shm.name.lstrip("/") == name.lstrip("/"):
+                return shm
+
+            if shm is not None:
+                _close_segment(shm)
+
+            shm = shared_memory.SharedMemory(name=name)
+            # 共享内存段由客户端创建和回收, 避免服务端进程退出时 resource_tracker 将其删除
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+            self.segments[session_id] = shm
+            return shm
+
+    def release(self, session_id):
+        with self.lock:
+            shm = self.segments.pop(session_id, None)
+        if shm is not None:
+            _close_segment(shm)
+
+    def close(self):
+        with self.lock:
+            segments = list(self.segments.values())
+            self.segments.clear()
+        for shm in segments:
+            _close_segment(shm)
+
+
+def _close_segment(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # 仍有 NumPy 视图引用该内存段, 交由垃圾回收处理
+        pass
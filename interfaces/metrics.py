@@ -0,0 +1,236 @@
+# metrics.py
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+from loguru import logger
+
+from pytracking.evaluation.profiler import PROFILED_STAGES
+
+
+# 延迟直方图的桶上界 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 跟踪器中按阶段计时的方法 -> 阶段名, 与 StageProfiler 共用同一张表
+TRACKER_STAGES = PROFILED_STAGES
+
+
+class Histogram:
+    """Prometheus 风格的累积直方图"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        result = []
+        for c in self.counts:
+            total += c
+            result.append(total)
+        return result
+
+    def quantile(self, q):
+        """按桶估计分位数 (返回所在桶的上界), 落在 +Inf 桶时返回最大有限上界"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for bound, c in zip(self.buckets, self.cumulative_counts()):
+            if c >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def summary(self):
+        return {"count": self.count, "sum": self.sum,
+                "mean": self.sum / self.count if self.count else None,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99)}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class ServerMetrics:
+    """
+    服务端指标
+
+    - 直方图: tracker_command_seconds (按命令), tracker_stage_seconds (按命令和阶段)
+    - 仪表: 通过 register_gauge 注册的回调, 在导出时取值 (队列深度、活动会话数、每会话内存等)
+
+    阶段计时默认不做 CUDA 同步, 此时 GPU 阶段只包含内核启动时间; sync_cuda=True 时在每个阶段结束时同步,
+    计时准确但会降低吞吐.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, sync_cuda=False):
+        self.buckets = buckets
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.histograms = OrderedDict()  # (name, labels) -> Histogram
+        self.gauges = OrderedDict()      # name -> (help, fn)
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def register_gauge(self, name, help_text, fn):
+        """
+        注册仪表, fn() 返回数值, 或者 [(labels_dict, value), ...] 表示带标签的多个值
+        """
+        self.gauges[name] = (help_text, fn)
+
+    @contextmanager
+    def command(self, cmd):
+        """对整个命令计时, 其中的 stage() 计时会带上该命令标签"""
+        self._local.command = cmd
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("tracker_command_seconds", time.perf_counter() - start, command=cmd)
+            self._local.command = None
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.sync_cuda:
+                torch.cuda.synchronize()
+            self.observe("tracker_stage_seconds", time.perf_counter() - start,
+                         command=getattr(self._local, "command", None) or "none", stage=stage)
+
+    def timed(self, stage, fn):
+        """
+        返回对 fn 按阶段计时的包装函数. 嵌套的阶段按独占时间记录 (例如 backbone 不包含其中的 sample_patches),
+        同一阶段的嵌套调用 (例如 refine_target_box 中的 optimize_boxes) 只记录一次
+        """
+        def wrapper(*args, **kwargs):
+            active = getattr(self._local, "active", None)
+            if active is None:
+                active = self._local.active = []
+            if active and active[-1][0] == stage:
+                return fn(*args, **kwargs)
+            active.append([stage, 0.0])
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if self.sync_cuda:
+                    torch.cuda.synchronize()
+                elapsed = time.perf_counter() - start
+                child_time = active.pop()[1]
+                if active:
+                    active[-1][1] += elapsed
+                self.observe("tracker_stage_seconds", elapsed - child_time,
+                             command=getattr(self._local, "command", None) or "none", stage=stage)
+        return wrapper
+
+    def instrument_tracker(self, tracker_instance):
+        """在跟踪器实例上包装 TRACKER_STAGES 中的方法 (只影响该实例, 共享的网络不受影响)"""
+        # 跳帧包装 (FrameSkippingTracker) 时包装其内部的跟踪器, 否则跟踪器内部的调用不会被计时
+        tracker_instance = getattr(tracker_instance, 'base_tracker', tracker_instance)
+        if getattr(tracker_instance, '_metrics_instrumented', False):
+            return
+        for method, stage in TRACKER_STAGES.items():
+            if hasattr(tracker_instance, method):
+                setattr(tracker_instance, method, self.timed(stage, getattr(tracker_instance, method)))
+        tracker_instance._metrics_instrumented = True
+        if hasattr(tracker_instance, 'add_instrumenter'):
+            # 通过 clone_state 复制出的跟踪器 (多目标 fast_load) 同样会被包装
+            tracker_instance.add_instrumenter(self.instrument_tracker)
+
+    def _gauge_values(self):
+        values = []
+        for name, (help_text, fn) in list(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                logger.error(f"读取指标 {name} 失败: {e}")
+                continue
+            if isinstance(value, list):
+                samples = [(tuple(sorted(labels.items())), v) for labels, v in value]
+            else:
+                samples = [((), value)]
+            values.append((name, help_text, samples))
+        return values
+
+    def snapshot(self):
+        """以字典形式返回当前指标, 用于 ZMQ stats 命令"""
+        with self.lock:
+            histograms = [(name, labels, h.summary()) for (name, labels), h in self.histograms.items()]
+
+        stats = {"histograms": [dict(name=name, labels=dict(labels), **summary) for name, labels, summary in histograms],
+                 "gauges": {}}
+        for name, _, samples in self._gauge_values():
+            if len(samples) == 1 and not samples[0][0]:
+                stats["gauges"][name] = samples[0][1]
+            else:
+                stats["gauges"][name] = [dict(labels=dict(labels), value=v) for labels, v in samples]
+        return stats
+
+    def render_prometheus(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self.lock:
+            histograms = [(name, labels, h.buckets, h.cumulative_counts(), h.sum, h.count)
+                          for (name, labels), h in self.histograms.items()]
+
+        declared = set()
+        for name, labels, buckets, cumulative, total, count in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            for bound, c in zip(list(buckets) + ["+Inf"], cumulative):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {c}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, help_text, samples in self._gauge_values():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def start_http_server(metrics, port, host="127.0.0.1"):
+    """在后台线程中启动 /metrics HTTP 端点, 返回 HTTPServer 实例 (调用 shutdown() 停止)"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"指标端点: http://{host}:{port}/metrics")
+    return server
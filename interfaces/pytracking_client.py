@@ -2,61 +2,167 @@
 import json
 import uuid
 import sys
+import os
+from collections import deque
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 import zmq
 import cv2
+import numpy as np
 from loguru import logger# 设置日志级别为DEBUG，这样就能看到debug信息了
 
+from interfaces.frame_transport import FRAME_ENCODINGS, SharedMemoryRing, encode_jpeg, raw_frame_info
+
 logger.remove()  # 移除默认的处理器
 logger.add(sys.stderr, level="INFO")  # 添加新的处理器，级别为DEBUG
 # logger.add(sys.stderr, level="DEBUG")  # 添加新的处理器，级别为DEBUG
 
 class RemoteTracker:
-    def __init__(self, address="tcp://127.0.0.1:5555"):
+    def __init__(self, address="tcp://127.0.0.1:5555", pipeline=False, max_in_flight=4, transport="jpeg",
+                 roi_upload=False):
+        """
+        Args:
+            address: 服务端地址
+            pipeline: 是否使用 DEALER 非阻塞模式 (需要服务端以 router 模式运行),
+                      此时可通过 submit/poll 让多帧同时在途
+            max_in_flight: 流水线模式下最多同时等待回复的帧数
+            transport: 帧传输方式, "jpeg" (默认, 适合远程), "raw" (原始像素, 无编解码)
+                       或 "shm" (共享内存环形缓冲区, 仅限与服务端同机)
+            roi_upload: 是否只上传服务端返回的搜索区域 (search_region) 而非完整帧.
+                        不能与流水线模式同时使用: 在途帧只能用几帧之前的搜索区域裁剪, 目标快速移动时会离开上传的区域
+        """
+        if transport not in FRAME_ENCODINGS:
+            raise ValueError(f"未知的帧传输方式: {transport}")
+        if roi_upload and pipeline:
+            raise ValueError("roi_upload 不能与 pipeline 同时使用 (在途帧的搜索区域已过期)")
+
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REQ)
+        self.pipeline = pipeline
+        self.socket = self.context.socket(zmq.DEALER if pipeline else zmq.REQ)
         self.socket.connect(address)
         self.initialized = False
         self.session_id = str(uuid.uuid4())  # 在客户端生成会话ID
 
+        # 流水线模式的请求序号和回复缓存
+        self.max_in_flight = max_in_flight
+        self.next_seq = 0
+        self.in_flight = deque()  # 尚未被 poll 取走结果的 update 请求序号 (按发送顺序)
+        self.replies = {}         # 已收到但尚未取走的回复, 以序号为键
+
+        self.transport = transport
+        self.shm_ring = None
+
+        self.roi_upload = roi_upload
+        self.search_region = None  # 服务端返回的下一帧搜索区域 [x, y, w, h]
+
+        self.multi_object = False  # 是否为多目标会话 (init_multi)
+
         logger.info(f"连接到 {address}")
         logger.info(f"任务 Session ID: {self.session_id}")
 
     def _encode_frame(self, frame):
         """编码图像为JPEG（二进制）"""
-        _, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-        return buf.tobytes()
+        return encode_jpeg(frame, 80)
 
-    def init(self, frame, bbox):
-        logger.info(f"frame.shape: {frame.shape}, bbox: {bbox}")
+    def _pack_frame(self, frame):
+        """
+        按传输方式打包帧
 
-        meta = {"cmd": "init", "bbox": bbox, "session_id": self.session_id}
-        frame_bytes = self._encode_frame(frame)
+        Returns:
+            tuple: (frame_info, frame_bytes), frame_info 为放入元数据的帧描述 (JPEG 为 None),
+                   frame_bytes 为 multipart 第二部分 (共享内存方式为 None)
+        """
+        if self.transport == "raw":
+            frame = np.ascontiguousarray(frame)
+            return raw_frame_info(frame), frame
+
+        if self.transport == "shm":
+            # 槽位数多于在途帧数, 保证服务端读取时槽位不会被覆盖
+            if self.shm_ring is None or frame.nbytes > self.shm_ring.slot_size:
+                self._close_ring()
+                num_slots = self.max_in_flight + 1 if self.pipeline else 2
+                self.shm_ring = SharedMemoryRing(frame.nbytes, num_slots)
+            return self.shm_ring.write(frame), None
+
+        return None, self._encode_frame(frame)
+
+    def _close_ring(self):
+        if self.shm_ring is not None:
+            self.shm_ring.close()
+            self.shm_ring = None
+
+    def _frame_meta(self, meta, frame_info, offset=None):
+        if frame_info is not None:
+            meta["frame"] = frame_info
+        if offset is not None:
+            meta["offset"] = offset
+        return meta
+
+    def _crop_search_region(self, frame, full_frame=False):
+        """ROI 上传: 裁剪出服务端所需的搜索区域, 返回 (图像, 区域左上角坐标), 不裁剪时坐标为 None"""
+        if full_frame or not self.roi_upload or self.search_region is None:
+            return frame, None
+        x, y, w, h = self.search_region
+        return frame[y:y + h, x:x + w], [x, y]
+
+    def _send(self, meta, frame_bytes=None):
+        """发送请求, 流水线模式下附带序号并返回该序号"""
+        seq = None
+        if self.pipeline:
+            seq = self.next_seq
+            self.next_seq += 1
+            meta = dict(meta, seq=seq)
 
         # multipart: [json, binary]
-        self.socket.send_multipart([json.dumps(meta).encode("utf-8"), frame_bytes])
-        reply = self.socket.recv_json()  # 接收回复
+        parts = [json.dumps(meta).encode("utf-8")]
+        if frame_bytes is not None:
+            parts.append(frame_bytes)
+        self.socket.send_multipart(parts)
+        return seq
 
-        # 确保reply是字典类型
-        if isinstance(reply, dict) and reply.get("status") == "ok":
-            self.initialized = True
-            logger.success(f"tracker 初始化成功: {reply}")
-            return True
-        else:
-            logger.error(f"tracker 初始化失败: {reply}")
+    def _receive_one(self, timeout=None):
+        """流水线模式: 接收一个回复并按序号缓存, timeout (毫秒) 内没有回复则返回 False"""
+        if timeout is not None and not self.socket.poll(timeout):
             return False
+        reply = self.socket.recv_json()
+        self.replies[reply.get("seq") if isinstance(reply, dict) else None] = reply
+        return True
 
-    def update(self, frame):
-        if not self.initialized:
-            raise RuntimeError("Tracker not initialized. Call init() first.")
+    def _request(self, meta, frame_bytes=None):
+        """发送请求并阻塞等待对应的回复"""
+        seq = self._send(meta, frame_bytes)
+        if not self.pipeline:
+            return self.socket.recv_json()
 
-        meta = {"cmd": "update", "session_id": self.session_id}
-        frame_bytes = self._encode_frame(frame)  # 编码帧
-        self.socket.send_multipart([json.dumps(meta).encode("utf-8"), frame_bytes])  # 发送帧
-        reply = self.socket.recv_json()  # 接收回复
-        
+        while seq not in self.replies:
+            self._receive_one()
+        return self.replies.pop(seq)
+
+    @staticmethod
+    def _objects_meta(bboxes):
+        """{obj_id: bbox} -> 消息中的目标列表 [{"id": obj_id, "bbox": [x, y, w, h]}, ...]"""
+        return [{"id": obj_id, "bbox": [int(v) for v in bbox]} for obj_id, bbox in bboxes.items()]
+
+    def _update_meta(self, frame, add_objects=None, remove_objects=None):
+        """构建 update 请求, 返回 (meta, frame_bytes). 添加新目标时上传完整帧"""
+        frame, offset = self._crop_search_region(frame, full_frame=bool(add_objects))
+        frame_info, frame_bytes = self._pack_frame(frame)
+        meta = self._frame_meta({"cmd": "update", "session_id": self.session_id}, frame_info, offset)
+        if add_objects:
+            meta["add_objects"] = self._objects_meta(add_objects)
+        if remove_objects:
+            meta["remove_objects"] = list(remove_objects)
+        return meta, frame_bytes
+
+    def _parse_update_reply(self, reply):
         # 确保reply是字典类型
         if isinstance(reply, dict) and reply.get("status") == "ok":
+            self.search_region = reply.get("search_region")
+            if "objects" in reply:
+                # 多目标会话: 返回 {obj_id: bbox}, 跟踪失败的目标为 None
+                bboxes = {obj["id"]: tuple(obj["bbox"]) if obj.get("bbox") is not None else None
+                          for obj in reply["objects"]}
+                return True, bboxes
             bbox = reply.get("bbox")  # 确保bbox可以转换为tuple类型
             if isinstance(bbox, (list, tuple)) and len(bbox) == 4:
                 logger.debug(f"任务 {self.session_id} 更新的 bbox {bbox}")
@@ -65,18 +171,142 @@ class RemoteTracker:
                 logger.error(f"任务 {self.session_id} bbox 格式错误: {bbox}")
                 return False, None
         else:
+            # 跟踪失败时下一帧上传完整图像
+            self.search_region = None
             return False, None
 
+    def init(self, frame, bbox):
+        logger.info(f"frame.shape: {frame.shape}, bbox: {bbox}")
+
+        frame_info, frame_bytes = self._pack_frame(frame)
+        meta = self._frame_meta({"cmd": "init", "bbox": bbox, "session_id": self.session_id}, frame_info)
+        reply = self._request(meta, frame_bytes)  # 接收回复
+
+        # 确保reply是字典类型
+        if isinstance(reply, dict) and reply.get("status") == "ok":
+            self.initialized = True
+            self.multi_object = False
+            self.search_region = reply.get("search_region")
+            logger.success(f"tracker 初始化成功: {reply}")
+            return True
+        else:
+            logger.error(f"tracker 初始化失败: {reply}")
+            return False
+
+    def init_multi(self, frame, bboxes):
+        """
+        初始化多目标会话, 所有目标共用每一帧的上传和解码
+
+        Args:
+            frame: 图像
+            bboxes: 以目标ID为键的边界框字典 {obj_id: (x, y, w, h)}, 目标ID需可 JSON 序列化
+
+        之后 update 返回 (success, {obj_id: bbox}), 跟踪失败的目标 bbox 为 None
+        """
+        logger.info(f"frame.shape: {frame.shape}, objects: {bboxes}")
+
+        frame_info, frame_bytes = self._pack_frame(frame)
+        meta = self._frame_meta({"cmd": "init", "objects": self._objects_meta(bboxes),
+                                 "session_id": self.session_id}, frame_info)
+        reply = self._request(meta, frame_bytes)
+
+        if isinstance(reply, dict) and reply.get("status") == "ok":
+            self.initialized = True
+            self.multi_object = True
+            self.search_region = reply.get("search_region")
+            logger.success(f"tracker 初始化成功: {reply}")
+            return True
+        else:
+            logger.error(f"tracker 初始化失败: {reply}")
+            return False
+
+    def update(self, frame, add_objects=None, remove_objects=None):
+        """
+        Args:
+            frame: 图像
+            add_objects: 多目标会话中在这一帧新加入的目标 {obj_id: (x, y, w, h)}
+            remove_objects: 多目标会话中不再跟踪的目标ID列表
+        """
+        if not self.initialized:
+            raise RuntimeError("Tracker not initialized. Call init() first.")
+
+        if self.pipeline:
+            # 同步更新: 提交后等待这一帧的结果, 之前提交的帧的结果仍可通过 poll 获取
+            seq = self.submit(frame, add_objects, remove_objects)
+            while seq not in self.replies:
+                self._receive_one()
+            self.in_flight.remove(seq)
+            return self._parse_update_reply(self.replies.pop(seq))
+
+        meta, frame_bytes = self._update_meta(frame, add_objects, remove_objects)  # 编码帧
+        reply = self._request(meta, frame_bytes)  # 发送帧并接收回复
+        return self._parse_update_reply(reply)
+
+    def submit(self, frame, add_objects=None, remove_objects=None):
+        """
+        流水线模式: 发送一帧但不等待结果
+
+        Returns:
+            int: 该帧的请求序号, 与 poll 返回的序号对应
+        """
+        if not self.pipeline:
+            raise RuntimeError("submit() requires pipeline=True.")
+        if not self.initialized:
+            raise RuntimeError("Tracker not initialized. Call init() first.")
+
+        # 在途帧数达到上限时, 等待服务端先返回一部分结果
+        while sum(1 for seq in self.in_flight if seq not in self.replies) >= self.max_in_flight:
+            self._receive_one()
+
+        meta, frame_bytes = self._update_meta(frame, add_objects, remove_objects)
+        seq = self._send(meta, frame_bytes)
+        self.in_flight.append(seq)
+        return seq
+
+    def poll(self, timeout=0):
+        """
+        流水线模式: 按提交顺序取回下一帧的结果
+
+        Args:
+            timeout: 等待时间 (毫秒), None 表示一直等待
+
+        Returns:
+            tuple: (seq, success, bbox), 若没有在途帧或超时则返回 None. 多目标会话中 bbox 为 {obj_id: bbox}
+        """
+        if not self.in_flight:
+            return None
+
+        seq = self.in_flight[0]
+        while seq not in self.replies:
+            if not self._receive_one(timeout):
+                return None
+
+        self.in_flight.popleft()
+        return (seq, *self._parse_update_reply(self.replies.pop(seq)))
+
+    def stats(self):
+        """
+        获取服务端指标 (各命令和各阶段的延迟直方图摘要、队列深度、会话数和每会话内存)
+        """
+        reply = self._request({"cmd": "stats", "session_id": self.session_id})
+        if isinstance(reply, dict) and reply.get("status") == "ok":
+            return reply["stats"]
+        logger.error(f"获取服务端指标失败: {reply}")
+        return None
+
     def release(self):
         """
         释放远程跟踪器资源
         """
         meta = {"cmd": "release", "session_id": self.session_id}
-        self.socket.send_json(meta)
-        reply = self.socket.recv_json()
+        reply = self._request(meta)
+
+        # 服务端已释放会话, 可以回收共享内存
+        self._close_ring()
         
         if isinstance(reply, dict) and reply.get("status") == "ok":
             self.initialized = False
+            self.multi_object = False
             logger.info("tracker 已释放")
             return True
         else:
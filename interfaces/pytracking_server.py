@@ -2,6 +2,7 @@
 import json
 import threading
 import time
+from collections import OrderedDict
 
 import sys
 import os
@@ -9,60 +10,147 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 import cv2
 import zmq
-import numpy as np
 from loguru import logger
 
 from interfaces.cv_wrapper import TrackerDiMP_create
+from interfaces.batching import BatchedBackboneScheduler
+from interfaces.dispatch import SessionDispatcher
+from interfaces.frame_transport import FrameDecoder
+from interfaces.session_manager import SessionManager, state_nbytes, offload_state, restore_state
+from interfaces.metrics import ServerMetrics, start_http_server
 
 logger.remove()  # 移除默认的处理器
 logger.add(sys.stderr, level="INFO")  # 添加新的处理器，级别为DEBUG
 # logger.add(sys.stderr, level="DEBUG")  # 添加新的处理器，级别为DEBUG
 
-class SessionThread(threading.Thread):
-    def __init__(self, session_id, frame, bbox, vis=False):
-        super().__init__()
+class TrackerSession:
+    """
+    单个客户端会话的跟踪器
+
+    init/update 直接在调用线程 (REP 主循环或 router 工作线程) 中执行, 不再为每个会话常驻一个线程.
+    """
+
+    def __init__(self, session_id, vis=False, batch_scheduler=None, shared_model=True, metrics=None):
         self.session_id = session_id
-        self.frame = frame
-        self.bbox = bbox
         self.vis = vis
+        self.batch_scheduler = batch_scheduler
+        self.shared_model = shared_model
+        self.metrics = metrics
         self.tracker = None
         self.initialized = False
         self.lock = threading.Lock()
-        self.stop_event = threading.Event()
-        self.result = None
-        self.result_available = threading.Event()
+        self.last_active = time.time()
 
-    def run(self):
-        try:
-            # 初始化跟踪器
-            self.tracker = TrackerDiMP_create()
-            self.tracker.init(self.frame, tuple(self.bbox))
-            self.initialized = True
-            
-            # 通知主线程初始化完成
-            self.result = {"status": "ok"}
-            self.result_available.set()
-            
-            # 持续处理更新请求
-            while not self.stop_event.is_set():
-                time.sleep(0.001)  # 避免过度占用CPU
-                
-        except Exception as e:
-            logger.error(f"会话 {self.session_id} 初始化跟踪器失败: {e}")
-            self.result = {"status": "error", "msg": str(e)}
-            self.result_available.set()
+        # 状态换出方式 ("host" / "disk") 及文件路径, 未换出时为 None
+        self.offloaded = None
+        self.offload_path = None
+
+    def init(self, frame, bbox=None, objects=None):
+        """
+        初始化跟踪器, 单目标时给出 bbox, 多目标时给出 objects ({obj_id: bbox})
+        """
+        with self.lock:
+            try:
+                # 初始化跟踪器 (共享网络时只创建本会话的跟踪状态, 不重新加载权重)
+                self.tracker = TrackerDiMP_create(shared_model=self.shared_model)
+                if objects is not None:
+                    success = self.tracker.init_multi(frame, objects)
+                else:
+                    success = self.tracker.init(frame, tuple(bbox))
+                if not success:
+                    return {"status": "error", "msg": "tracker init failed"}
+                self._instrument()
+                self.initialized = True
+
+                # 初始化完成, 并告知客户端下一帧所需的图像区域
+                result = {"status": "ok"}
+                search_region = self.search_region()
+                if search_region is not None:
+                    result["search_region"] = search_region
+                return result
+
+            except Exception as e:
+                logger.error(f"会话 {self.session_id} 初始化跟踪器失败: {e}")
+                return {"status": "error", "msg": str(e)}
+
+    def _instrument(self):
+        """为跟踪器各阶段加上计时 (多目标时新加入的目标在 update 后补上)"""
+        if self.metrics is None:
+            return
+        tracker_instance = self.tracker.tracker_instance
+        if self.tracker.multi_object:
+            for obj_tracker in tracker_instance.trackers.values():
+                self.metrics.instrument_tracker(obj_tracker)
+        else:
+            self.metrics.instrument_tracker(tracker_instance)
+
+    def resident_bytes(self):
+        """会话状态 (样本记忆、滤波器等) 当前占用的内存字节数, 已换出时为 0"""
+        if self.offloaded is not None or self.tracker is None or self.tracker.tracker_instance is None:
+            return 0
+        return state_nbytes(self.tracker.tracker_instance)
+
+    def offload(self, mode, path=None):
+        """换出会话状态, 调用方需持有 self.lock"""
+        if self.offloaded is not None or self.tracker is None or self.tracker.tracker_instance is None:
+            return
+        offload_state(self.tracker.tracker_instance, mode, path)
+        self.offloaded = mode
+        self.offload_path = path
+
+    def _restore(self):
+        if self.offloaded is None:
+            return
+        tracker_instance = self.tracker.tracker_instance
+        restore_state(tracker_instance, tracker_instance.params.device, self.offloaded, self.offload_path)
+        logger.info(f"会话 {self.session_id} 状态已恢复")
+        self.offloaded = None
+        self.offload_path = None
+
+    def search_region(self):
+        """下一帧追踪所需的图像区域 [x, y, w, h], 客户端可只上传这一区域"""
+        if self.tracker is None:
+            return None
+        return self.tracker.search_region()
+
+    def update(self, frame, image_offset=None, add_objects=None, remove_objects=None):
+        """
+        更新跟踪器
 
-    def update(self, frame):
+        Returns:
+            单目标时为 bbox (失败为 None); 多目标时为 {obj_id: bbox} 字典
+        """
+        with self.lock:
+            return self._update(frame, image_offset, add_objects, remove_objects)
+
+    def _update(self, frame, image_offset=None, add_objects=None, remove_objects=None):
         if not self.initialized or self.tracker is None:
             return None
 
         try:
-            # 调用实际的追踪器更新方法
-            success, bbox = self.tracker.update(frame)
+            self._restore()
+
+            if self.tracker.multi_object:
+                # 多目标: 帧只解码和转换一次, 由 MultiObjectWrapper 分发给各目标的跟踪器
+                bboxes = self.tracker.update_multi(frame, image_offset, add_objects, remove_objects)
+                if add_objects:
+                    self._instrument()
+                if self.vis:
+                    self._show_multi(frame, bboxes)
+                return bboxes
+
+            # 调用实际的追踪器更新方法, 启用批量推理时骨干网络交由调度器跨会话合并执行
+            backbone_fn = self.batch_scheduler.extract_backbone if self.batch_scheduler is not None else None
+            if backbone_fn is not None and self.metrics is not None:
+                # 包含在调度器中等待组批的时间
+                backbone_fn = self.metrics.timed("backbone", backbone_fn)
+            success, bbox = self.tracker.update(frame, backbone_fn=backbone_fn, image_offset=image_offset)
 
             # 根据vis参数决定是否显示调试窗口
             if self.vis:
                 if frame is not None:
+                    # raw/shm 传输的帧是接收缓冲区或共享内存的视图, 在副本上绘制
+                    frame = frame.copy()
                     cv2.namedWindow(self.session_id, cv2.WINDOW_NORMAL)
 
                 if success and bbox is not None:
@@ -93,80 +181,165 @@ class SessionThread(threading.Thread):
             logger.info(f"会话 {self.session_id} 更新跟踪器失败: {e}")
             return None
 
+    def _show_multi(self, frame, bboxes):
+        # raw/shm 传输的帧是接收缓冲区或共享内存的视图, 在副本上绘制
+        frame = frame.copy()
+        cv2.namedWindow(self.session_id, cv2.WINDOW_NORMAL)
+        for obj_id, bbox in bboxes.items():
+            if bbox is None:
+                continue
+            x, y, w, h = [int(v) for v in bbox]
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(frame, str(obj_id), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 255, 0), 2)
+        cv2.imshow(self.session_id, frame)
+        cv2.waitKey(1)
+
     def stop(self):
-        self.stop_event.set()
+        if self.offloaded == "disk" and self.offload_path is not None and os.path.exists(self.offload_path):
+            os.remove(self.offload_path)
         # 只有在启用调试可视化时才需要销毁窗口
         if self.vis:
             cv2.destroyWindow(self.session_id)
 
 
+def _objects_from_msg(objects):
+    """把消息中的目标列表 [{"id": obj_id, "bbox": [x, y, w, h]}, ...] 转换为有序字典 {obj_id: bbox}"""
+    if objects is None:
+        return None
+    return OrderedDict((obj["id"], obj["bbox"]) for obj in objects)
+
+
 class TrackerServer:
-    def __init__(self, vis=False, address="tcp://*:5555"):
+    def __init__(self, vis=False, address="tcp://*:5555", batch_window=None, max_batch_size=16,
+                 mode="rep", num_workers=8, shared_model=True, session_ttl=None, memory_budget=None,
+                 offload="host", offload_dir=None, metrics_port=None, metrics_sync_cuda=False):
+        """
+        Args:
+            vis: 是否启用调试可视化
+            address: 监听地址
+            batch_window: 跨会话批量推理的时间窗口 (秒), None 表示不启用批量推理. 只在 router 模式下生效
+                          (rep 模式同一时刻只处理一个请求, 无法合并其他会话)
+            max_batch_size: 每批最多合并的会话请求数
+            mode: "rep" 为单线程逐条处理; "router" 为异步模式, 请求按会话分发到工作线程池,
+                  支持 REQ 和 DEALER (流水线) 客户端
+            num_workers: router 模式下的工作线程数
+            shared_model: 各会话是否共享同一份网络权重 (只在第一次创建会话时加载模型)
+            session_ttl: 会话空闲多少秒后自动释放, None 表示只在客户端 release 时释放
+            memory_budget: 会话状态 (样本记忆、滤波器等) 的内存预算 (字节), 超出时换出最久未使用的会话
+            offload: 换出方式, "host" (GPU 状态移到主机内存) 或 "disk"
+            offload_dir: "disk" 换出的目录, 默认为临时目录
+            metrics_port: 在本机该端口提供 Prometheus 格式的 /metrics 端点, None 表示不启用
+                          (指标也可以通过 {"cmd": "stats"} 请求获取)
+            metrics_sync_cuda: 阶段计时时是否同步 CUDA, 否则 GPU 阶段只统计内核启动时间
+        """
+        if mode not in ("rep", "router"):
+            raise ValueError(f"未知的服务端模式: {mode}")
+
+        self.mode = mode
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REP)
+        self.socket = self.context.socket(zmq.ROUTER if mode == "router" else zmq.REP)
         self.address = address
         self.socket.bind(self.address)
+
+        # router 模式: 工作线程池, 以及把回复送回主线程的 inproc 通道 (zmq socket 不能跨线程共享)
+        self.dispatcher = None
+        if mode == "router":
+            self.dispatcher = SessionDispatcher(num_workers)
+            self.reply_address = f"inproc://tracker-replies-{id(self)}"
+            self.reply_socket = self.context.socket(zmq.PULL)
+            self.reply_socket.bind(self.reply_address)
+            self._thread_local = threading.local()
         
-        # 存储多个会话线程，以会话ID为键
-        self.sessions = {}
-        self.sessions_lock = threading.Lock()
+        # 存储多个会话，以会话ID为键, 超时释放和内存预算由 SessionManager 管理
+        self.sessions = SessionManager(ttl=session_ttl, memory_budget=memory_budget, offload=offload,
+                                       offload_dir=offload_dir, on_evict=self._on_session_evicted)
         self.vis = vis
+        self.shared_model = shared_model
+        self.frame_decoder = FrameDecoder()
+
+        # 跨会话批量推理调度器
+        self.batch_scheduler = None
+        if batch_window is not None and mode != "router":
+            logger.warning("rep 模式下无法跨会话批量推理 (同一时刻只有一个请求), 已忽略 batch_window, 请使用 router 模式")
+            batch_window = None
+        if batch_window is not None:
+            self.batch_scheduler = BatchedBackboneScheduler(batch_window, max_batch_size)
+            logger.info(f"启用跨会话批量推理, 时间窗口: {batch_window * 1000:.1f} ms, 最大批量: {max_batch_size}")
         
+        # 指标: 各命令和各阶段的延迟直方图, 队列深度、会话数和每会话内存
+        self.metrics = ServerMetrics(sync_cuda=metrics_sync_cuda)
+        self._register_gauges()
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = start_http_server(self.metrics, metrics_port)
+
         logger.info("服务端启动...")
-        logger.info(f"监听地址: {self.address}")
+        logger.info(f"监听地址: {self.address}, 模式: {self.mode}")
+
+    def _register_gauges(self):
+        self.metrics.register_gauge("tracker_active_sessions", "Number of tracker sessions",
+                                    lambda: len(self.sessions))
+        self.metrics.register_gauge("tracker_queue_depth", "Requests queued in the session dispatcher",
+                                    lambda: self.dispatcher.pending() if self.dispatcher is not None else 0)
+        self.metrics.register_gauge("tracker_batch_queue_depth", "Backbone requests waiting to be batched",
+                                    lambda: self.batch_scheduler.requests.qsize()
+                                    if self.batch_scheduler is not None else 0)
+        self.metrics.register_gauge("tracker_session_state_bytes", "Resident tracker state per session",
+                                    lambda: [({"session": session_id}, session.resident_bytes())
+                                             for session_id, session in self.sessions.items()])
 
-    def decode_frame(self, buf):
-        """解码JPEG为numpy图像"""
-        np_arr = np.frombuffer(buf, dtype=np.uint8)
-        return cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    def decode_frame(self, buf, frame_info=None, session_id=None):
+        """解码帧为numpy图像, 默认为JPEG, 也支持 raw 和共享内存传输 (见 frame_transport)"""
+        with self.metrics.stage("decode"):
+            return self.frame_decoder.decode(buf, frame_info, session_id)
 
-    def init_tracker(self, session_id, frame, bbox):
+    def init_tracker(self, session_id, frame, bbox=None, objects=None):
         """
-        初始化追踪器线程
+        初始化追踪器会话, 多目标时 objects 为 {obj_id: bbox}
         """
-        with self.sessions_lock:
-            # 如果会话已存在，先停止它
-            if session_id in self.sessions:
-                self.sessions[session_id].stop()
-                self.sessions[session_id].join()
-                
-            # 创建并启动新的会话线程
-            session_thread = SessionThread(session_id, frame, bbox, self.vis)
-            session_thread.start()
-            self.sessions[session_id] = session_thread
+        session = TrackerSession(session_id, self.vis, self.batch_scheduler, self.shared_model, self.metrics)
 
-            logger.info(f"开始新任务: {bbox}, {session_id}")
-            
-            # 等待初始化结果
-            session_thread.result_available.wait()
-            return session_thread.result
+        # 如果会话已存在，先停止它
+        old_session = self.sessions.add(session_id, session)
+        if old_session is not None:
+            old_session.stop()
+
+        logger.info(f"开始新任务: {bbox if objects is None else objects}, {session_id}")
+
+        # 在调用线程中初始化 (router 模式下不阻塞其他会话)
+        result = session.init(frame, bbox, objects)
 
-    def update_tracker(self, session_id, frame):
+        # 新会话可能使总占用超出预算
+        self.sessions.enforce_budget()
+        return result
+
+    def update_tracker(self, session_id, frame, image_offset=None, add_objects=None, remove_objects=None):
         """
         更新追踪器
+
+        Returns:
+            tuple: (result, search_region), result 单目标时为 bbox (失败为 None), 多目标时为 {obj_id: bbox}
         """
-        with self.sessions_lock:
-            if session_id not in self.sessions:
-                return None
-                
-            session_thread = self.sessions[session_id]
+        session = self.sessions.get(session_id)
+        if session is None or not session.initialized:
+            return None, None
             
-        if not session_thread.initialized:
-            return None
-            
-        return session_thread.update(frame)
+        result = session.update(frame, image_offset, add_objects, remove_objects)
+        return result, session.search_region()
 
     def release_tracker(self, session_id):
         """
         释放指定会话的跟踪器
         """
-        with self.sessions_lock:
-            if session_id in self.sessions:
-                self.sessions[session_id].stop()
-                self.sessions[session_id].join()
-                del self.sessions[session_id]
-                return True
-        return False
+        session = self.sessions.pop(session_id)
+        if session is None:
+            return False
+
+        session.stop()
+        return True
+
+    def _on_session_evicted(self, session_id, session):
+        self.frame_decoder.release(session_id)
 
     def handle_init_command(self, frame, msg):
         if frame is None:
@@ -176,6 +349,12 @@ class TrackerServer:
         if not session_id:
             return {"status": "error", "msg": "session_id is required"}
         
+        if "objects" in msg:
+            objects = _objects_from_msg(msg["objects"])
+            if not objects:
+                return {"status": "error", "msg": "objects must not be empty"}
+            return self.init_tracker(session_id, frame, objects=objects)
+
         result = self.init_tracker(session_id, frame, msg["bbox"])
         return result
 
@@ -187,9 +366,21 @@ class TrackerServer:
         if not session_id:
             return {"status": "error", "msg": "session_id is required"}
             
-        bbox = self.update_tracker(session_id, frame)
-        if bbox is not None:
-            return {"status": "ok", "bbox": bbox}
+        # 客户端只上传了搜索区域时, offset 为该区域在完整图像中的左上角坐标 (x, y)
+        result, search_region = self.update_tracker(session_id, frame, msg.get("offset"),
+                                                    _objects_from_msg(msg.get("add_objects")),
+                                                    msg.get("remove_objects"))
+        if isinstance(result, dict):
+            # 多目标: 跟踪失败的目标 bbox 为 null
+            response = {"status": "ok", "objects": [{"id": obj_id, "bbox": bbox} for obj_id, bbox in result.items()]}
+            if search_region is not None:
+                response["search_region"] = search_region
+            return response
+        elif result is not None:
+            response = {"status": "ok", "bbox": result}
+            if search_region is not None:
+                response["search_region"] = search_region
+            return response
         else:
             return {"status": "error", "msg": "tracker update failed"}
 
@@ -199,75 +390,159 @@ class TrackerServer:
             return {"status": "error", "msg": "session_id is required"}
             
         success = self.release_tracker(session_id)
+        self.frame_decoder.release(session_id)
         if success:
             return {"status": "ok"}
         else:
             return {"status": "error", "msg": "failed to release tracker"}
 
-    def run(self):
+    def parse_message(self, parts):
+        """
+        解析 multipart 消息: [json字符串, 图像二进制], release 命令可以不带图像
+
+        Returns:
+            tuple: (msg, frame_buf, error), 解析失败时 error 为错误回复
+        """
+        # 检查接收到的部分数量
+        if len(parts) not in (1, 2):
+            logger.error(f"接收到错误的消息部分数量: {len(parts)}, 期望: 2")
+            return None, None, {"status": "error", "msg": "invalid message format"}
+
+        meta_str = parts[0]
+        frame_buf = parts[1] if len(parts) == 2 else None
+        logger.debug(f"接收到消息，元数据长度: {len(meta_str)}, 帧数据长度: {len(frame_buf) if frame_buf else 0}")
+
         try:
-            while True:
-                # multipart 接收: [json字符串, 图像二进制]
-                parts = self.socket.recv_multipart()
-                
-                # 检查接收到的部分数量
-                if len(parts) != 2:
-                    logger.error(f"接收到错误的消息部分数量: {len(parts)}, 期望: 2")
-                    self.socket.send_json({"status": "error", "msg": "invalid message format"})
-                    continue
-                    
-                meta_str, frame_buf = parts
-                logger.debug(f"接收到消息，元数据长度: {len(meta_str)}, 帧数据长度: {len(frame_buf)}")
-                
-                try:
-                    msg = json.loads(meta_str.decode("utf-8"))
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON解码失败: {e}")
-                    self.socket.send_json({"status": "error", "msg": "invalid json format"})
+            msg = json.loads(meta_str.decode("utf-8"))
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON解码失败: {e}")
+            return None, None, {"status": "error", "msg": "invalid json format"}
+
+        return msg, frame_buf, None
+
+    def handle_request(self, msg, frame_buf):
+        """执行一条已解析的请求并返回回复字典"""
+        cmd = msg.get("cmd", "unknown")
+        logger.debug(f"收到命令: {cmd}")
+
+        if cmd in ("init", "update"):
+            with self.metrics.command(cmd):
+                response = self._handle_frame_command(cmd, msg, frame_buf)
+
+        elif cmd == "release":
+            response = self.handle_release_command(msg)
+
+        elif cmd == "stats":
+            response = {"status": "ok", "stats": self.metrics.snapshot()}
+
+        else:
+            logger.warning(f"未知命令: {cmd}")
+            response = {"status": "error", "msg": "unknown command"}
+
+        # 流水线模式下客户端用 seq 匹配请求和回复
+        if "seq" in msg:
+            response = dict(response, seq=msg["seq"])
+        return response
+
+    def _handle_frame_command(self, cmd, msg, frame_buf):
+        """解码帧并执行 init / update 命令"""
+        frame = self.decode_frame(frame_buf, msg.get("frame"), msg.get("session_id"))
+        if frame is None:
+            logger.error("帧解码失败")
+            return {"status": "error", "msg": "failed to decode frame"}
+        elif cmd == "init":
+            return self.handle_init_command(frame, msg)
+        else:
+            return self.handle_update_command(frame, msg)
+
+    def _send_routed_reply(self, envelope, response):
+        """工作线程通过各自的 inproc PUSH socket 把回复交给主线程, 由主线程经 ROUTER 发出"""
+        push_socket = getattr(self._thread_local, "push_socket", None)
+        if push_socket is None:
+            push_socket = self.context.socket(zmq.PUSH)
+            push_socket.setsockopt(zmq.LINGER, 0)
+            push_socket.connect(self.reply_address)
+            self._thread_local.push_socket = push_socket
+        push_socket.send_multipart(envelope + [json.dumps(response).encode("utf-8")])
+
+    def _process_routed(self, envelope, msg, frame_buf):
+        try:
+            response = self.handle_request(msg, frame_buf)
+        except Exception as e:
+            logger.error(f"处理请求时发生异常: {e}")
+            response = {"status": "error", "msg": str(e)}
+            if "seq" in msg:
+                response["seq"] = msg["seq"]
+        self._send_routed_reply(envelope, response)
+
+    def _run_rep(self):
+        while True:
+            # multipart 接收: [json字符串, 图像二进制]
+            parts = self.socket.recv_multipart()
+
+            msg, frame_buf, error = self.parse_message(parts)
+            if error is not None:
+                self.socket.send_json(error)
+                continue
+
+            self.socket.send_json(self.handle_request(msg, frame_buf))
+
+    def _run_router(self):
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        poller.register(self.reply_socket, zmq.POLLIN)
+
+        while True:
+            events = dict(poller.poll())
+
+            # 转发工作线程完成的回复
+            if self.reply_socket in events:
+                while True:
+                    try:
+                        reply_parts = self.reply_socket.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    self.socket.send_multipart(reply_parts)
+
+            if self.socket in events:
+                frames = self.socket.recv_multipart()
+
+                # ROUTER 收到的消息以客户端身份帧开头, REQ 客户端还会带一个空分隔帧, DEALER 客户端则没有
+                num_envelope = 2 if len(frames) > 2 and frames[1] == b"" else 1
+                envelope, parts = frames[:num_envelope], frames[num_envelope:]
+
+                msg, frame_buf, error = self.parse_message(parts)
+                if error is not None:
+                    self.socket.send_multipart(envelope + [json.dumps(error).encode("utf-8")])
                     continue
-                    
-                cmd = msg.get("cmd", "unknown")
-                logger.debug(f"收到命令: {cmd}")
-
-                if cmd == "init":
-                    frame = self.decode_frame(frame_buf)
-                    if frame is None:
-                        logger.error("帧解码失败")
-                        self.socket.send_json({"status": "error", "msg": "failed to decode frame"})
-                        continue
-                        
-                    response = self.handle_init_command(frame, msg)
-                    self.socket.send_json(response)
-
-                elif cmd == "update":
-                    frame = self.decode_frame(frame_buf)
-                    if frame is None:
-                        logger.error("帧解码失败")
-                        self.socket.send_json({"status": "error", "msg": "failed to decode frame"})
-                        continue
-                        
-                    response = self.handle_update_command(frame, msg)
-                    self.socket.send_json(response)
-
-                elif cmd == "release":
-                    response = self.handle_release_command(msg)
-                    self.socket.send_json(response)
 
-                else:
-                    logger.warning(f"未知命令: {cmd}")
-                    self.socket.send_json({"status": "error", "msg": "unknown command"})
+                # 同一会话串行处理, 不同会话并行处理; 帧解码也在工作线程中完成
+                session_key = msg.get("session_id") or envelope[0]
+                self.dispatcher.submit(session_key, lambda e=envelope, m=msg, f=frame_buf: self._process_routed(e, m, f))
+
+    def run(self):
+        try:
+            if self.mode == "router":
+                self._run_router()
+            else:
+                self._run_rep()
         except Exception as e:
             logger.error(f"服务器运行时发生异常: {e}")
             import traceback
             traceback.print_exc()
         finally:
+            if self.dispatcher is not None:
+                self.dispatcher.shutdown()
             # 清理所有会话
-            with self.sessions_lock:
-                for session_id, session_thread in self.sessions.items():
-                    session_thread.stop()
-                    session_thread.join()
-                self.sessions.clear()
-                logger.info("服务器已关闭，所有会话已清理")
+            self.sessions.stop()
+            for session_id, session in self.sessions.pop_all():
+                session.stop()
+            logger.info("服务器已关闭，所有会话已清理")
+            if self.batch_scheduler is not None:
+                self.batch_scheduler.stop()
+            self.frame_decoder.close()
+            if self.metrics_server is not None:
+                self.metrics_server.shutdown()
 
 
 if __name__ == "__main__":
@@ -280,4 +555,10 @@ if __name__ == "__main__":
     # server = TrackerServer(vis=args.debug)
     server = TrackerServer(vis=False)
     # server = TrackerServer(vis=True)
-    server.run()
\ No newline at end of file
+    # 多路视频流时使用 router 模式, 各会话并行处理并合并骨干网络推理
+    # server = TrackerServer(mode="router", batch_window=0.002)
+    # 生产环境中释放空闲 60 秒的会话, 并把会话状态限制在 2 GB 以内
+    # server = TrackerServer(mode="router", session_ttl=60, memory_budget=2 * 2**30)
+    # 在 http://127.0.0.1:9100/metrics 导出延迟直方图等指标
+    # server = TrackerServer(mode="router", metrics_port=9100)
+    server.run()
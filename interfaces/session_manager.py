@@ -0,0 +1,262 @@
+# session_manager.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+from loguru import logger
+
+from pytracking import TensorList
+from pytracking.libs.sample_memory import SampleMemory
+from pytracking.evaluation.multi_object_wrapper import MultiObjectWrapper
+from pytracking.tracker.base import FrameSkippingTracker
+
+
+# 会话中随跟踪过程增长的状态 (样本记忆、滤波器等), 换出时只处理这些属性, 网络权重由各会话共享
+SWAPPABLE_STATE = ('sample_memory', 'training_samples', 'target_filter', 'sample_weights', 'target_boxes',
+                   'iou_modulation')
+
+
+def _map_tensors(value, fn):
+    if torch.is_tensor(value):
+        return fn(value)
+    if isinstance(value, SampleMemory):
+        return value.apply(fn)
+    if isinstance(value, TensorList):
+        return TensorList([_map_tensors(v, fn) for v in value])
+    if isinstance(value, (list, tuple)):
+        return type(value)(_map_tensors(v, fn) for v in value)
+    return value
+
+
+def _iter_tensors(value):
+    if torch.is_tensor(value):
+        yield value
+    elif isinstance(value, SampleMemory):
+        yield from value.tensors()
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _iter_tensors(v)
+
+
+def _state_trackers(tracker_instance):
+    """
+    持有可换出状态的追踪器 [(key, tracker), ...]: 多目标时为 MultiObjectWrapper 中各目标的追踪器 (key 为目标 ID),
+    单目标时为追踪器本身 (key 为 None). FrameSkippingTracker 包装的追踪器取其内部的追踪器
+    """
+    if isinstance(tracker_instance, MultiObjectWrapper):
+        trackers = list(tracker_instance.trackers.items())
+    else:
+        trackers = [(None, tracker_instance)]
+    return [(key, t.base_tracker if isinstance(t, FrameSkippingTracker) else t) for key, t in trackers]
+
+
+def state_nbytes(tracker_instance, device=None):
+    """统计追踪器可换出状态占用的字节数, 指定 device 时只统计位于该设备上的张量"""
+    nbytes = 0
+    for _, tracker in _state_trackers(tracker_instance):
+        for name in SWAPPABLE_STATE:
+            for t in _iter_tensors(getattr(tracker, name, None)):
+                if device is None or t.device.type == torch.device(device).type:
+                    nbytes += t.numel() * t.element_size()
+    return nbytes
+
+
+def offload_state(tracker_instance, mode="host", path=None):
+    """
+    换出追踪器状态 (多目标时换出所有目标的追踪器状态)
+
+    Args:
+        mode: "host" 移到主机内存; "disk" 保存到 path 指定的文件并释放内存
+    """
+    states = OrderedDict()
+    for key, tracker in _state_trackers(tracker_instance):
+        states[key] = {name: getattr(tracker, name) for name in SWAPPABLE_STATE if hasattr(tracker, name)}
+
+    if mode == "host":
+        for key, tracker in _state_trackers(tracker_instance):
+            for name, value in states[key].items():
+                setattr(tracker, name, _map_tensors(value, lambda t: t.cpu()))
+    elif mode == "disk":
+        torch.save(states, path)
+        for key, tracker in _state_trackers(tracker_instance):
+            for name in states[key]:
+                setattr(tracker, name, None)
+    else:
+        raise ValueError(f"未知的换出方式: {mode}")
+
+
+def restore_state(tracker_instance, device, mode="host", path=None):
+    """恢复 offload_state 换出的追踪器状态到 device"""
+    if mode == "host":
+        states = {key: {name: getattr(tracker, name) for name in SWAPPABLE_STATE if hasattr(tracker, name)}
+                  for key, tracker in _state_trackers(tracker_instance)}
+    else:
+        states = torch.load(path, map_location=device, weights_only=False)
+        os.remove(path)
+
+    for key, tracker in _state_trackers(tracker_instance):
+        for name, value in states.get(key, {}).items():
+            setattr(tracker, name, _map_tensors(value, lambda t: t.to(device)))
+
+
+class SessionManager:
+    """
+    会话管理器
+
+    按最近使用顺序 (LRU) 保存会话:
+        - 超过 ttl 秒没有请求的会话会被释放 (客户端崩溃未调用 release 时避免泄漏)
+        - 会话状态总占用超过 memory_budget 字节时, 从最久未使用的会话开始换出其状态 (到主机内存或磁盘),
+          下次 update 时再恢复
+    仅使用 CPU 推理时 "host" 换出不会释放内存, 应使用 "disk".
+    会话对象需提供 lock, last_active, resident_bytes(), offload() 和 stop() (见 pytracking_server.TrackerSession).
+    """
+
+    def __init__(self, ttl=None, memory_budget=None, offload="host", offload_dir=None, check_interval=5.0,
+                 on_evict=None):
+        """
+        Args:
+            ttl: 会话空闲多少秒后被释放, None 表示不释放
+            memory_budget: 会话状态的内存预算 (字节), None 表示不限制
+            offload: 超出预算时状态的换出方式, "host" 或 "disk"
+            offload_dir: "disk" 方式的换出目录, 默认为临时目录
+            check_interval: 后台检查的时间间隔 (秒)
+            on_evict: 会话因超时被释放时的回调 on_evict(session_id, session)
+        """
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.offload = offload
+        self.offload_dir = offload_dir
+        self._temp_offload_dir = offload == "disk" and offload_dir is None
+        if self._temp_offload_dir:
+            self.offload_dir = tempfile.mkdtemp(prefix="tracker_sessions_")
+        self.check_interval = check_interval
+        self.on_evict = on_evict
+
+        self.sessions = OrderedDict()  # 最近使用的会话在末尾
+        self.lock = threading.Lock()
+
+        self.stop_event = threading.Event()
+        self.worker = None
+        if ttl is not None or memory_budget is not None:
+            self.worker = threading.Thread(target=self._run, daemon=True)
+            self.worker.start()
+
+    def __contains__(self, session_id):
+        with self.lock:
+            return session_id in self.sessions
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
+    def get(self, session_id):
+        """获取会话并标记为最近使用"""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+                session.last_active = time.time()
+            return session
+
+    def add(self, session_id, session):
+        """添加会话, 返回被替换的旧会话 (如有)"""
+        with self.lock:
+            old_session = self.sessions.pop(session_id, None)
+            session.last_active = time.time()
+            self.sessions[session_id] = session
+            return old_session
+
+    def pop(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None)
+
+    def items(self):
+        """当前所有会话 [(session_id, session), ...] 的快照"""
+        with self.lock:
+            return list(self.sessions.items())
+
+    def pop_all(self):
+        with self.lock:
+            sessions = list(self.sessions.items())
+            self.sessions.clear()
+            return sessions
+
+    def offload_path(self, session_id):
+        return os.path.join(self.offload_dir, f"{session_id}.pth")
+
+    def evict_expired(self):
+        """释放超时的会话, 正在处理请求的会话跳过 (下次检查时再处理)"""
+        if self.ttl is None:
+            return []
+
+        with self.lock:
+            candidates = [(sid, s) for sid, s in self.sessions.items() if time.time() - s.last_active > self.ttl]
+
+        expired = []
+        for session_id, session in candidates:
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                # 持有会话锁后再确认, 期间可能已有新的请求 (get 会更新 last_active) 或会话已被替换
+                with self.lock:
+                    if self.sessions.get(session_id) is not session or time.time() - session.last_active <= self.ttl:
+                        continue
+                    del self.sessions[session_id]
+
+                logger.info(f"会话 {session_id} 空闲超过 {self.ttl} 秒, 已释放")
+                session.stop()
+                expired.append((session_id, session))
+            finally:
+                session.lock.release()
+
+            if self.on_evict is not None:
+                self.on_evict(session_id, session)
+        return expired
+
+    def enforce_budget(self):
+        """会话状态总占用超过预算时, 从最久未使用的会话开始换出"""
+        if self.memory_budget is None:
+            return
+
+        with self.lock:
+            sessions = list(self.sessions.items())
+
+        resident = [(sid, s, s.resident_bytes()) for sid, s in sessions]
+        total = sum(nbytes for _, _, nbytes in resident)
+
+        for session_id, session, nbytes in resident:
+            if total <= self.memory_budget:
+                break
+            if nbytes == 0:
+                continue
+            # 正在处理请求的会话跳过
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                session.offload(self.offload, self.offload_path(session_id))
+                total -= nbytes
+                logger.info(f"会话 {session_id} 状态已换出 ({self.offload}, {nbytes / 2**20:.1f} MB)")
+            except Exception as e:
+                logger.error(f"会话 {session_id} 状态换出失败: {e}")
+            finally:
+                session.lock.release()
+
+    def _run(self):
+        while not self.stop_event.wait(self.check_interval):
+            try:
+                self.evict_expired()
+                self.enforce_budget()
+            except Exception as e:
+                logger.error(f"会话管理检查失败: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.worker is not None:
+            self.worker.join()
+        # 删除自动创建的换出目录 (其中剩余的会话状态已无法恢复)
+        if self._temp_offload_dir:
+            shutil.rmtree(self.offload_dir, ignore_errors=True)
@@ -12,6 +12,8 @@ def create_default_local_file():
         'tensorboard_dir': 'self.workspace_dir + \'/tensorboard/\'',
         'pretrained_networks': 'self.workspace_dir + \'/pretrained_networks/\'',
         'pregenerated_masks': empty_str,
+        'annotation_cache_dir': 'self.workspace_dir + \'/annotation_cache/\'',
+        'crop_shards_dir': 'self.workspace_dir + \'/crop_shards/\'',
         'lasot_dir': empty_str,
         'got10k_dir': empty_str,
         'trackingnet_dir': empty_str,
@@ -28,7 +30,9 @@ def create_default_local_file():
         'lasot_candidate_matching_dataset_path': empty_str})
 
     comment = {'workspace_dir': 'Base directory for saving network checkpoints.',
-               'tensorboard_dir': 'Directory for tensorboard files.'}
+               'tensorboard_dir': 'Directory for tensorboard files.',
+               'annotation_cache_dir': 'Directory for the cached annotation indices of the datasets.',
+               'crop_shards_dir': 'Directory for the pre-extracted training crops (see ltr/util_scripts/create_crop_shards.py).'}
 
     with open(path, 'w') as f:
         f.write('class EnvironmentSettings:\n')
@@ -5,6 +5,7 @@ from pathlib import Path
 import importlib
 import inspect
 import ltr.admin.settings as ws_settings
+from ltr.admin.model_constructor import NetConstructor
 
 
 def load_trained_network(workspace_dir, network_path, checkpoint=None):
@@ -85,17 +86,7 @@ def load_network(network_dir=None, checkpoint=None, constructor_fun_name=None, c
             net_constr.fun_name = constructor_fun_name
         if constructor_module is not None:
             net_constr.fun_module = constructor_module
-        # Legacy networks before refactoring
-        if net_constr.fun_module.startswith('dlframework.'):
-            net_constr.fun_module = net_constr.fun_module[len('dlframework.'):]
-        net_fun = getattr(importlib.import_module(net_constr.fun_module), net_constr.fun_name)
-        net_fun_args = list(inspect.signature(net_fun).parameters.keys())
-        for arg, val in kwargs.items():
-            if arg in net_fun_args:
-                net_constr.kwds[arg] = val
-            else:
-                print('WARNING: Keyword argument "{}" not found when loading network. It was ignored.'.format(arg))
-        net = net_constr.get()
+        net = _construct_network(net_constr, **kwargs)
     else:
         raise RuntimeError('No constructor for the given network.')
 
@@ -108,6 +99,90 @@ def load_network(network_dir=None, checkpoint=None, constructor_fun_name=None, c
     return net, checkpoint_dict
 
 
+def _construct_network(net_constr, **kwargs):
+    """Build the network from the NetConstructor, replacing the saved constructor arguments with kwargs."""
+    # Legacy networks before refactoring
+    if net_constr.fun_module.startswith('dlframework.'):
+        net_constr.fun_module = net_constr.fun_module[len('dlframework.'):]
+    net_fun = getattr(importlib.import_module(net_constr.fun_module), net_constr.fun_name)
+    net_fun_args = list(inspect.signature(net_fun).parameters.keys())
+    for arg, val in kwargs.items():
+        if arg in net_fun_args:
+            net_constr.kwds[arg] = val
+        else:
+            print('WARNING: Keyword argument "{}" not found when loading network. It was ignored.'.format(arg))
+    return net_constr.get()
+
+
+INFERENCE_NETWORK_SUFFIX = '.inference.pth'
+
+
+def inference_network_path(checkpoint_path):
+    """Default path of the inference network exported from the given checkpoint (see export_inference_network)."""
+    checkpoint_path = str(checkpoint_path)
+    for ext in ('.pth.tar', '.pth'):
+        if checkpoint_path.endswith(ext):
+            return checkpoint_path[:-len(ext)] + INFERENCE_NETWORK_SUFFIX
+    return checkpoint_path + INFERENCE_NETWORK_SUFFIX
+
+
+def export_inference_network(checkpoint_path, output_path=None):
+    """Export a network checkpoint to an inference-only file, which can be loaded with load_inference_network.
+    The file only contains the network weights, the network info and the resolved constructor (function name, module
+    and arguments, stored as plain values), i.e. no optimizer state, settings or pickled framework objects. It is saved
+    in the zip format of torch.save, such that the weights can be memory-mapped when loading.
+    args:
+        checkpoint_path - Path to the training checkpoint.
+        output_path - Path of the exported file. Defaults to inference_network_path(checkpoint_path).
+    returns:
+        The path of the exported file.
+    """
+    if output_path is None:
+        output_path = inference_network_path(checkpoint_path)
+
+    checkpoint_dict = torch_load_legacy(os.path.expanduser(str(checkpoint_path)))
+
+    net_constr = checkpoint_dict.get('constructor', None)
+    if net_constr is None:
+        raise RuntimeError('No constructor for the given network.')
+    fun_module = net_constr.fun_module
+    if fun_module.startswith('dlframework.'):
+        fun_module = fun_module[len('dlframework.'):]
+
+    inference_dict = {'constructor': {'fun_name': net_constr.fun_name,
+                                      'fun_module': fun_module,
+                                      'args': list(net_constr.args),
+                                      'kwds': dict(net_constr.kwds)},
+                      'net_info': checkpoint_dict.get('net_info', None),
+                      'net': {k: v.contiguous() for k, v in checkpoint_dict['net'].items()}}
+
+    torch.save(inference_dict, output_path)
+
+    # Make sure that the file can be loaded without unpickling arbitrary objects
+    torch.load(output_path, map_location='cpu', weights_only=True)
+
+    return output_path
+
+
+def load_inference_network(path, **kwargs):
+    """Load a network exported with export_inference_network. The weights are memory-mapped and assigned to the
+    network without copying (requires torch >= 2.1). The extra keyword arguments are supplied to the network
+    constructor to replace saved ones."""
+    checkpoint_dict = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+
+    constr = checkpoint_dict['constructor']
+    net_constr = NetConstructor(constr['fun_name'], constr['fun_module'], tuple(constr['args']), dict(constr['kwds']))
+    net = _construct_network(net_constr, **kwargs)
+
+    net.load_state_dict(checkpoint_dict['net'], assign=True)
+
+    net.constructor = net_constr
+    if checkpoint_dict.get('net_info', None) is not None:
+        net.info = checkpoint_dict['net_info']
+
+    return net
+
+
 def load_weights(net, path, strict=True):
     checkpoint_dict = torch.load(path, weights_only=False)
     weight_dict = checkpoint_dict['net']
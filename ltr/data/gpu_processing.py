@@ -0,0 +1,452 @@
+import numpy as np
+import cv2 as cv
+import torch
+import torch.nn.functional as F
+import ltr.data.processing_utils as prutils
+from ltr.data.processing import BaseProcessing
+from ltr.data.bounding_box_utils import rect_to_rel, rel_to_rect
+
+
+class RawFramesProcessing(BaseProcessing):
+    """ The processing run in the data loader workers when the processing is done on the training device (see
+    GPUDiMPProcessing). Only pads the decoded frames to a fixed canvas, such that they can be batched. Frames larger
+    than the canvas are downscaled to fit (with cv.INTER_AREA). The search regions of small targets are then cropped
+    from a lower resolution frame than in DiMPProcessing, i.e. the crops are blurrier. Choose a canvas which holds the
+    frames of the datasets (e.g. (1080, 1920) for LaSOT and TrackingNet), or decode the frames at crop resolution
+    (TrackingSampler, decode_at_crop_resolution) such that most frames fit without further downscaling.
+    The data contains the following fields for s in ['train', 'test']:
+        s + '_images' - uint8 Tensor (num_frames, canvas_h, canvas_w, 3)
+        s + '_image_sz' - Tensor (num_frames, 2) with the [width, height] of the frames in the canvas
+        s + '_anno' - Tensor (num_frames, 4) with the target boxes
+
+    Use GPUDiMPProcessing.raw_frames_processing to create it.
+    """
+
+    def __init__(self, canvas_sz=(720, 1280), search_area_factor=None, output_sz=None, scale_jitter_factor=None,
+                 crop_type='replicate', max_scale_change=None):
+        """
+        args:
+            canvas_sz - [height, width] of the canvas.
+            The remaining arguments are the ones of the GPU processing, used by max_decode_downscale (see
+            TrackingSampler, decode_at_crop_resolution).
+        """
+        super().__init__()
+        self.canvas_sz = canvas_sz
+        self.search_area_factor = search_area_factor
+        self.output_sz = output_sz
+        self.scale_jitter_factor = scale_jitter_factor if scale_jitter_factor is not None else {}
+        self.crop_type = crop_type
+        self.max_scale_change = max_scale_change
+
+    def _fit_to_canvas(self, frames, boxes):
+        canvas_h, canvas_w = self.canvas_sz
+        canvas = np.zeros((len(frames), canvas_h, canvas_w, 3), dtype=np.uint8)
+        image_sz = torch.zeros(len(frames), 2)
+        boxes_out = torch.zeros(len(frames), 4)
+
+        for i, (im, box) in enumerate(zip(frames, boxes)):
+            scale = min(1.0, canvas_h / im.shape[0], canvas_w / im.shape[1])
+            if scale < 1.0:
+                out_w = min(canvas_w, round(im.shape[1] * scale))
+                out_h = min(canvas_h, round(im.shape[0] * scale))
+                box = box * torch.Tensor([out_w / im.shape[1], out_h / im.shape[0]]).repeat(2)
+                im = cv.resize(im, (out_w, out_h), interpolation=cv.INTER_AREA)
+
+            canvas[i, :im.shape[0], :im.shape[1], :] = im
+            image_sz[i, :] = torch.Tensor([im.shape[1], im.shape[0]])
+            boxes_out[i, :] = box
+
+        return torch.from_numpy(canvas), image_sz, boxes_out
+
+    def __call__(self, data):
+        """
+        args:
+            data - The input data, should contain the following fields:
+                'train_images', test_images', 'train_anno', 'test_anno'
+        returns:
+            TensorDict - output data block with following fields:
+                'train_images', 'test_images', 'train_image_sz', 'test_image_sz', 'train_anno', 'test_anno'
+        """
+        for s in ['train', 'test']:
+            data[s + '_images'], data[s + '_image_sz'], data[s + '_anno'] = self._fit_to_canvas(data[s + '_images'],
+                                                                                             data[s + '_anno'])
+        return data
+
+
+def sample_box_gmm_batched(mean_box, proposal_sigma, gt_sigma=None, num_samples=1, add_mean_box=False):
+    """ Batched version of prutils.sample_box_gmm, sampling num_samples boxes for each of the mean_box (N, 4).
+
+    returns:
+        proposals (N, num_samples, 4), proposal density and ground truth density (N, num_samples) for all samples
+    """
+    device = mean_box.device
+    center_std = torch.Tensor([s[0] for s in proposal_sigma])
+    sz_std = torch.Tensor([s[1] for s in proposal_sigma])
+    std = torch.stack([center_std, center_std, sz_std, sz_std]).to(device)
+    num_components = std.shape[-1]
+
+    sz_norm = mean_box[:, 2:].clone().view(-1, 1, 2)
+
+    # Sample boxes
+    k = torch.randint(num_components, (mean_box.shape[0], num_samples), device=device)
+    std_samp = std[:, k].permute(1, 2, 0)
+    proposals_rel_centered = std_samp * torch.randn_like(std_samp)
+    proposal_density = prutils.gmm_density_centered(proposals_rel_centered, std.view(1, 1, 4, num_components))
+
+    # Add mean and map back
+    mean_box_rel = rect_to_rel(mean_box.view(-1, 1, 4), sz_norm)
+    proposals = rel_to_rect(proposals_rel_centered + mean_box_rel, sz_norm)
+
+    if gt_sigma is None or gt_sigma[0] == 0 and gt_sigma[1] == 0:
+        gt_density = torch.zeros_like(proposal_density)
+    else:
+        std_gt = torch.Tensor([gt_sigma[0], gt_sigma[0], gt_sigma[1], gt_sigma[1]]).to(device).view(1, 1, 4)
+        gt_density = prutils.gauss_density_centered(proposals_rel_centered, std_gt).prod(-1)
+
+    if add_mean_box:
+        proposals = torch.cat((mean_box.view(-1, 1, 4), proposals), dim=1)
+        proposal_density = torch.cat((-proposal_density.new_ones(mean_box.shape[0], 1), proposal_density), dim=1)
+        gt_density = torch.cat((gt_density.new_ones(mean_box.shape[0], 1), gt_density), dim=1)
+
+    return proposals, proposal_density, gt_density
+
+
+class GPUDiMPProcessing:
+    """ DiMPProcessing run batched on the training device. The data loader workers only decode the frames (see
+    RawFramesProcessing, created with raw_frames_processing) and the trainer calls this processing on each batch (see
+    LTRLoader, gpu_processing). The box jittering, the search region crops (all crop_types, with bilinear sampling
+    using grid_sample), the image transforms and the label and proposal generation are done for the whole batch at
+    once.
+
+    The transforms are fixed instead of being given as tfm.Transform: the joint transforms ToGrayscale and
+    RandomHorizontalFlip (grayscale_probability, joint_flip_probability), followed by the per frame transforms
+    ToTensorAndJitter, RandomHorizontalFlip and Normalize (brightness_jitter, flip_probability, normalize_mean/std).
+    See DiMPProcessing for the remaining arguments.
+    """
+
+    def __init__(self, search_area_factor, output_sz, center_jitter_factor, scale_jitter_factor, crop_type='replicate',
+                 max_scale_change=None, mode='pair', proposal_params=None, label_function_params=None,
+                 brightness_jitter=0.0, grayscale_probability=0.0, joint_flip_probability=0.0, flip_probability=0.0,
+                 normalize_mean=None, normalize_std=None, crop_chunk_size=16):
+        """
+        args:
+            brightness_jitter - Amount of brightness jitter, see tfm.ToTensorAndJitter.
+            grayscale_probability - Probability to convert all frames of a sample to grayscale.
+            joint_flip_probability - Probability to flip all frames of a sample horizontally.
+            flip_probability - Probability to flip each crop horizontally.
+            normalize_mean, normalize_std - Mean and std for normalizing the crops. No normalization if None.
+            crop_chunk_size - Number of frames which are converted to float and cropped at once, which limits the
+                              memory used for the frames.
+        """
+        self.search_area_factor = search_area_factor
+        self.output_sz = output_sz
+        self.center_jitter_factor = center_jitter_factor
+        self.scale_jitter_factor = scale_jitter_factor
+        self.crop_type = crop_type
+        self.max_scale_change = max_scale_change
+        self.mode = mode
+
+        self.proposal_params = proposal_params
+        self.label_function_params = label_function_params
+
+        self.brightness_jitter = brightness_jitter
+        self.grayscale_probability = grayscale_probability
+        self.joint_flip_probability = joint_flip_probability
+        self.flip_probability = flip_probability
+        self.normalize_mean = normalize_mean
+        self.normalize_std = normalize_std
+        self.crop_chunk_size = crop_chunk_size
+
+    def raw_frames_processing(self, canvas_sz=(720, 1280)):
+        """ The RawFramesProcessing to use in the sampler together with this processing.
+
+        args:
+            canvas_sz - [height, width] of the canvas the frames are padded to. Larger frames are downscaled, see
+                        RawFramesProcessing.
+        """
+        return RawFramesProcessing(canvas_sz, search_area_factor=self.search_area_factor, output_sz=self.output_sz,
+                                   scale_jitter_factor=self.scale_jitter_factor, crop_type=self.crop_type,
+                                   max_scale_change=self.max_scale_change)
+
+    def _output_size(self):
+        if isinstance(self.output_sz, (float, int)):
+            return int(self.output_sz), int(self.output_sz)
+        return int(self.output_sz[0]), int(self.output_sz[1])
+
+    def _get_jittered_box(self, box, mode):
+        """ Jitter the input boxes (N, 4), see DiMPProcessing._get_jittered_box."""
+        jittered_size = box[:, 2:4] * torch.exp(torch.randn_like(box[:, 2:4]) * self.scale_jitter_factor[mode])
+        max_offset = jittered_size.prod(dim=1, keepdim=True).sqrt() * self.center_jitter_factor[mode]
+        jittered_center = box[:, 0:2] + 0.5 * box[:, 2:4] + max_offset * (torch.rand_like(box[:, 0:2]) - 0.5)
+
+        return torch.cat((jittered_center - 0.5 * jittered_size, jittered_size), dim=1)
+
+    def _get_crop_boxes(self, boxes, image_sz):
+        """ The search region crop of each of the boxes (N, 4), computed as in prutils.sample_target_adaptive."""
+        output_sz = boxes.new_tensor(self._output_size())
+        crop_sz = (output_sz * ((boxes[:, 2:].prod(dim=1, keepdim=True) / output_sz.prod()).sqrt() *
+                                self.search_area_factor)).ceil()
+
+        # Get new sample size if forced inside the image
+        if self.crop_type == 'inside' or self.crop_type == 'inside_major':
+            rescale_factor = crop_sz / image_sz
+            if self.crop_type == 'inside':
+                rescale_factor = rescale_factor.max(dim=1, keepdim=True)[0]
+            else:
+                rescale_factor = rescale_factor.min(dim=1, keepdim=True)[0]
+            rescale_factor = rescale_factor.clamp(min=1)
+            if self.max_scale_change is not None:
+                rescale_factor = rescale_factor.clamp(max=self.max_scale_change)
+            crop_sz = (crop_sz / rescale_factor).floor()
+        crop_sz = crop_sz.clamp(min=1)
+
+        tl = (boxes[:, :2] + 0.5 * boxes[:, 2:] - 0.5 * crop_sz).round()
+        br = tl + crop_sz
+
+        # Move box inside image
+        shift = (-tl).clamp(min=0) + (image_sz - br).clamp(max=0)
+        tl, br = tl + shift, br + shift
+
+        out = ((-tl).clamp(min=0) + (br - image_sz).clamp(min=0)).div(2).floor()
+        tl = tl + (-tl - out) * (out > 0).float()
+
+        return torch.cat((tl, crop_sz), dim=1)
+
+    def _crop_and_resize(self, images, image_sz, crop_boxes, flip):
+        """ Crops the crop_boxes from the frames and resizes them to output_sz. Pixels outside the frames replicate the
+        frame border. The frames of which flip is set are flipped horizontally before cropping.
+
+        args:
+            images - uint8 Tensor (N, canvas_h, canvas_w, 3)
+            image_sz - Tensor (N, 2), the [width, height] of the frames in the canvas
+            crop_boxes - Tensor (N, 4)
+            flip - bool Tensor (N,)
+
+        returns:
+            Tensor (N, 3, output_h, output_w) in [0, 255]
+        """
+        canvas_h, canvas_w = images.shape[1:3]
+        out_w, out_h = self._output_size()
+
+        # Sampling positions of the output pixels in the frames (same pixel centers as cv.resize)
+        u = torch.arange(out_w, device=images.device, dtype=torch.float32) + 0.5
+        v = torch.arange(out_h, device=images.device, dtype=torch.float32) + 0.5
+        x = crop_boxes[:, 0:1] + u.view(1, -1) * crop_boxes[:, 2:3] / out_w - 0.5
+        y = crop_boxes[:, 1:2] + v.view(1, -1) * crop_boxes[:, 3:4] / out_h - 0.5
+
+        # Replicate the border of each frame, instead of the canvas
+        x = torch.min(x.clamp(min=0), image_sz[:, 0:1] - 1)
+        y = torch.min(y.clamp(min=0), image_sz[:, 1:2] - 1)
+        x = torch.where(flip.view(-1, 1), image_sz[:, 0:1] - 1 - x, x)
+
+        grid_x = (2 * x / max(canvas_w - 1, 1) - 1).view(-1, 1, out_w).expand(-1, out_h, -1)
+        grid_y = (2 * y / max(canvas_h - 1, 1) - 1).view(-1, out_h, 1).expand(-1, -1, out_w)
+        grid = torch.stack((grid_x, grid_y), dim=-1)
+
+        crops = []
+        for i in range(0, images.shape[0], self.crop_chunk_size):
+            im = images[i:i + self.crop_chunk_size].permute(0, 3, 1, 2).float()
+            crops.append(F.grid_sample(im, grid[i:i + self.crop_chunk_size], mode='bilinear', padding_mode='border',
+                                       align_corners=True))
+        return torch.cat(crops, dim=0)
+
+    def _transform_crops(self, crops, boxes, grayscale):
+        """ Applies the image transforms to the crops (N, 3, H, W) in [0, 255]."""
+        num_crops = crops.shape[0]
+
+        if self.grayscale_probability > 0:
+            color_weights = crops.new_tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)
+            gray = (crops * color_weights).sum(dim=1, keepdim=True).expand_as(crops)
+            crops = torch.where(grayscale.view(-1, 1, 1, 1), gray, crops)
+
+        brightness_factor = crops.new_empty(num_crops).uniform_(max(0, 1 - self.brightness_jitter),
+                                                                1 + self.brightness_jitter)
+        crops = (crops * (brightness_factor / 255.0).view(-1, 1, 1, 1)).clamp(0.0, 1.0)
+
+        if self.flip_probability > 0:
+            flip = torch.rand(num_crops, device=crops.device) < self.flip_probability
+            crops = torch.where(flip.view(-1, 1, 1, 1), crops.flip(-1), crops)
+            boxes = torch.where(flip.view(-1, 1), self._flip_boxes(boxes, crops.shape[-1]), boxes)
+
+        if self.normalize_mean is not None:
+            mean = crops.new_tensor(self.normalize_mean).view(1, -1, 1, 1)
+            std = crops.new_tensor(self.normalize_std).view(1, -1, 1, 1)
+            crops = (crops - mean) / std
+
+        return crops, boxes
+
+    @staticmethod
+    def _flip_boxes(boxes, image_w):
+        """ Boxes in a horizontally flipped image, see tfm.RandomHorizontalFlip."""
+        if not torch.is_tensor(image_w):
+            image_w = boxes.new_tensor(float(image_w))
+        x = image_w.view(-1) - 1 - boxes[:, 0] - boxes[:, 2]
+        return torch.stack((x, boxes[:, 1], boxes[:, 2], boxes[:, 3]), dim=1)
+
+    def _generate_proposals(self, boxes):
+        """ Generates proposals for the boxes (N, 4), see DiMPProcessing._generate_proposals.
+
+        returns:
+            dict - 'test_proposals' (N, num_proposals, 4) and 'proposal_iou' (N, num_proposals)
+        """
+        num_proposals = self.proposal_params['boxes_per_frame']
+        proposal_method = self.proposal_params.get('proposal_method', 'default')
+
+        if proposal_method == 'default':
+            # Rejection sampling per box, on the (small) boxes only
+            boxes_cpu = boxes.cpu()
+            proposals = torch.zeros((boxes.shape[0], num_proposals, 4))
+            gt_iou = torch.zeros(boxes.shape[0], num_proposals)
+            for i, box in enumerate(boxes_cpu):
+                for j in range(num_proposals):
+                    proposals[i, j, :], gt_iou[i, j] = prutils.perturb_box(
+                        box, min_iou=self.proposal_params['min_iou'],
+                        sigma_factor=self.proposal_params['sigma_factor'])
+            proposals, gt_iou = proposals.to(boxes.device), gt_iou.to(boxes.device)
+        elif proposal_method == 'gmm':
+            proposals, _, _ = sample_box_gmm_batched(boxes, self.proposal_params['proposal_sigma'],
+                                                     num_samples=num_proposals)
+            gt_iou = prutils.iou(boxes.view(-1, 1, 4).expand_as(proposals).reshape(-1, 4),
+                                 proposals.reshape(-1, 4)).view(boxes.shape[0], -1)
+        else:
+            raise ValueError('Unknown proposal method.')
+
+        # Map to [-1, 1]
+        return {'test_proposals': proposals, 'proposal_iou': gt_iou * 2 - 1}
+
+    def _generate_labels(self, data):
+        """ Generates the label functions for the boxes in data (num_images, 4)."""
+        if self.label_function_params is None:
+            return data
+
+        for s in ['train', 'test']:
+            data[s + '_label'] = prutils.gaussian_label_function(
+                data[s + '_anno'], self.label_function_params['sigma_factor'],
+                self.label_function_params['kernel_sz'], self.label_function_params['feature_sz'], self.output_sz,
+                end_pad_if_even=self.label_function_params.get('end_pad_if_even', True))
+        return data
+
+    @staticmethod
+    def _to_batch_first(x, stack_dim):
+        return x.transpose(0, 1) if stack_dim == 1 else x
+
+    def __call__(self, data, stack_dim=1):
+        """
+        args:
+            data - A batch of the data returned by RawFramesProcessing, moved to the training device.
+            stack_dim - The stack_dim of the LTRLoader.
+        returns:
+            TensorDict - The same fields as DiMPProcessing, batched as by the LTRLoader.
+        """
+        batch_sz = data['train_images'].shape[1 if stack_dim == 1 else 0]
+        device = data['train_images'].device
+
+        # Joint transforms, shared by the train and test frames of a sample
+        grayscale = torch.rand(batch_sz, device=device) < self.grayscale_probability
+        joint_flip = torch.rand(batch_sz, device=device) < self.joint_flip_probability
+
+        num_frames = {}
+        for s in ['train', 'test']:
+            images = self._to_batch_first(data[s + '_images'], stack_dim)
+            num_frames[s] = images.shape[1]
+            assert self.mode == 'sequence' or num_frames[s] == 1, "In pair mode, num train/test frames must be 1"
+
+            images = images.reshape(-1, *images.shape[2:])
+            image_sz = self._to_batch_first(data.pop(s + '_image_sz'), stack_dim).reshape(-1, 2).float()
+            anno = self._to_batch_first(data[s + '_anno'], stack_dim).reshape(-1, 4).float()
+            frame_flip = joint_flip.repeat_interleave(num_frames[s])
+
+            anno = torch.where(frame_flip.view(-1, 1), self._flip_boxes(anno, image_sz[:, 0]), anno)
+
+            # Add a uniform noise to the center pos
+            jittered_anno = self._get_jittered_box(anno, s)
+            crop_boxes = self._get_crop_boxes(jittered_anno, image_sz)
+            crops = self._crop_and_resize(images, image_sz, crop_boxes, frame_flip)
+
+            # Find the bb location in the crop
+            output_sz = anno.new_tensor(self._output_size()).repeat(2)
+            boxes = (anno - torch.cat((crop_boxes[:, :2], torch.zeros_like(crop_boxes[:, :2])), dim=1)) * \
+                output_sz / crop_boxes[:, 2:].repeat(1, 2)
+
+            data[s + '_images'], data[s + '_anno'] = self._transform_crops(crops, boxes,
+                                                                           grayscale.repeat_interleave(num_frames[s]))
+
+        # Generate proposals
+        if self.proposal_params:
+            data.update(self._generate_proposals(data['test_anno']))
+
+        for s in ['train', 'test']:
+            is_distractor = data.get('is_distractor_{}_frame'.format(s), None)
+            if is_distractor is not None:
+                is_distractor = self._to_batch_first(is_distractor, stack_dim).reshape(-1).bool()
+                data[s + '_anno'][is_distractor, :2] = 99999999.9
+
+        # Generate label functions
+        data = self._generate_labels(data)
+
+        # Prepare output, the fields generated above are stacked over all frames of the batch
+        output_keys = ['train_images', 'test_images', 'train_anno', 'test_anno', 'test_proposals', 'proposal_iou',
+                       'proposal_density', 'gt_density', 'train_label', 'test_label', 'train_label_density',
+                       'test_label_density']
+        for key in output_keys:
+            if key not in data:
+                continue
+            s = 'train' if key.startswith('train_') else 'test'
+            val = data[key].view(batch_sz, num_frames[s], *data[key].shape[1:])
+            if self.mode != 'sequence':
+                val = val[:, 0]
+            data[key] = self._to_batch_first(val, stack_dim)
+
+        return data
+
+
+class GPUKLDiMPProcessing(GPUDiMPProcessing):
+    """ KLDiMPProcessing run batched on the training device, see GPUDiMPProcessing."""
+
+    def __init__(self, *args, label_density_params=None, **kwargs):
+        """
+        args:
+            label_density_params - Arguments for the label density generation process, see KLDiMPProcessing.
+            See GPUDiMPProcessing for the remaining arguments.
+        """
+        super().__init__(*args, **kwargs)
+        self.label_density_params = label_density_params
+
+    def _generate_proposals(self, boxes):
+        """ Generate proposal sample boxes from a GMM proposal distribution and compute their ground-truth density,
+        see KLDiMPProcessing._generate_proposals."""
+        proposals, proposal_density, gt_density = sample_box_gmm_batched(
+            boxes, self.proposal_params['proposal_sigma'], gt_sigma=self.proposal_params['gt_sigma'],
+            num_samples=self.proposal_params['boxes_per_frame'],
+            add_mean_box=self.proposal_params.get('add_mean_box', False))
+
+        return {'test_proposals': proposals, 'proposal_density': proposal_density, 'gt_density': gt_density}
+
+    def _generate_label_density(self, target_bb):
+        """ Generates the gaussian label density centered at target_bb, see KLDiMPProcessing."""
+        feat_sz = self.label_density_params['feature_sz'] * self.label_density_params.get('interp_factor', 1)
+        gauss_label = prutils.gaussian_label_function(target_bb.view(-1, 4), self.label_density_params['sigma_factor'],
+                                                      self.label_density_params['kernel_sz'],
+                                                      feat_sz, self.output_sz,
+                                                      end_pad_if_even=self.label_density_params.get('end_pad_if_even', True),
+                                                      density=True,
+                                                      uni_bias=self.label_density_params.get('uni_weight', 0.0))
+
+        gauss_label *= (gauss_label > self.label_density_params.get('threshold', 0.0)).float()
+
+        if self.label_density_params.get('normalize', False):
+            g_sum = gauss_label.sum(dim=(-2, -1))
+            valid = g_sum > 0.01
+            gauss_label[valid, :, :] /= g_sum[valid].view(-1, 1, 1)
+            gauss_label[~valid, :, :] = 1.0 / (gauss_label.shape[-2] * gauss_label.shape[-1])
+
+        gauss_label *= 1.0 - self.label_density_params.get('shrink', 0.0)
+
+        return gauss_label
+
+    def _generate_labels(self, data):
+        data = super()._generate_labels(data)
+        if self.label_density_params is not None:
+            data['train_label_density'] = self._generate_label_density(data['train_anno'])
+            data['test_label_density'] = self._generate_label_density(data['test_anno'])
+        return data
@@ -54,6 +54,27 @@ def opencv_loader(path):
         return None
 
 
+_opencv_reduced_modes = [(8, cv.IMREAD_REDUCED_COLOR_8), (4, cv.IMREAD_REDUCED_COLOR_4),
+                         (2, cv.IMREAD_REDUCED_COLOR_2)]
+
+
+def opencv_loader_downscaled(path, max_downscale=1):
+    """ Read image using opencv's imread function, downscaled by the largest factor 2, 4 or 8 which is at most
+    max_downscale. For JPEGs, libjpeg then performs the downscaling in the DCT domain, such that the full resolution
+    image is never materialized. Returns the image in rgb format and the used downscaling factor. The image is
+    of size ceil(W/factor) x ceil(H/factor), i.e. pixel coordinates are scaled by 1/factor."""
+    factor, mode = next(((f, m) for f, m in _opencv_reduced_modes if f <= max_downscale), (1, cv.IMREAD_COLOR))
+    try:
+        im = cv.imread(path, mode)
+
+        # convert to rgb and return
+        return cv.cvtColor(im, cv.COLOR_BGR2RGB), factor
+    except Exception as e:
+        print('ERROR: Could not read image "{}"'.format(path))
+        print(e)
+        return None, factor
+
+
 def jpeg4py_loader_w_failsafe(path):
     """ Image reading using jpeg4py https://github.com/ajkxyz/jpeg4py"""
     try:
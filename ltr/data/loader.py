@@ -153,6 +153,9 @@ class LTRLoader(torch.utils.data.dataloader.DataLoader):
         worker_init_fn (callable, optional): If not None, this will be called on each
             worker subprocess with the worker id (an int in ``[0, num_workers - 1]``) as
             input, after seeding and before data loading. (default: None)
+        gpu_processing (callable, optional): processing which is applied to each batch by the trainer, after moving
+            it to the training device, e.g. GPUDiMPProcessing. Called as gpu_processing(data, stack_dim=stack_dim).
+            (default: None)
 
     .. note:: By default, each worker will have its PyTorch seed set to
               ``base_seed + worker_id``, where ``base_seed`` is a long generated
@@ -172,7 +175,7 @@ class LTRLoader(torch.utils.data.dataloader.DataLoader):
 
     def __init__(self, name, dataset, training=True, batch_size=1, shuffle=False, sampler=None, batch_sampler=None,
                  num_workers=0, epoch_interval=1, collate_fn=None, stack_dim=0, pin_memory=False, drop_last=False,
-                 timeout=0, worker_init_fn=None):
+                 timeout=0, worker_init_fn=None, gpu_processing=None):
         if collate_fn is None:
             if stack_dim == 0:
                 collate_fn = ltr_collate
@@ -189,6 +192,7 @@ class LTRLoader(torch.utils.data.dataloader.DataLoader):
         self.training = training
         self.epoch_interval = epoch_interval
         self.stack_dim = stack_dim
+        self.gpu_processing = gpu_processing
 
 
 class MultiEpochLTRLoader(LTRLoader):
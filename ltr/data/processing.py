@@ -33,6 +33,39 @@ class BaseProcessing:
                           'test':  transform if test_transform is None else test_transform,
                           'joint': joint_transform}
 
+    def max_decode_downscale(self, boxes, mode):
+        """ Largest factor by which the images can be downscaled when decoding, without the search region crops
+        (see prutils.target_image_crop) being upsampled to output_sz. Used by the sampler to decode the frames at crop
+        resolution (see TrackingSampler).
+
+        args:
+            boxes - Tensor of shape (num_images, 4), the target boxes of the images.
+            mode - 'train' or 'test', the images the boxes belong to.
+
+        returns:
+            list - The downscaling factor for each image. 1 if the processing does not crop search regions.
+        """
+        search_area_factor = getattr(self, 'search_area_factor', None)
+        output_sz = getattr(self, 'output_sz', None)
+        if search_area_factor is None or output_sz is None or not isinstance(search_area_factor, (int, float)):
+            return [1] * len(boxes)
+        if getattr(self, 'crop_type', 'replicate') in ['inside', 'inside_major']:
+            # The crop can be enlarged by up to max_scale_change to fit inside the image
+            max_scale_change = getattr(self, 'max_scale_change', None)
+            if max_scale_change is None:
+                return [1] * len(boxes)
+        else:
+            max_scale_change = 1
+
+        output_sz = max(output_sz) if isinstance(output_sz, (list, tuple, torch.Size)) else output_sz
+
+        # Smallest crop size reachable by the scale jitter in _get_jittered_box (up to two standard deviations)
+        scale_jitter_factor = getattr(self, 'scale_jitter_factor', {}).get(mode, 0)
+        box_sz = boxes[:, 2:4].float().prod(dim=1).clamp(min=0).sqrt()
+        crop_sz = box_sz * search_area_factor * math.exp(-2 * scale_jitter_factor) / max_scale_change
+
+        return (crop_sz / output_sz).clamp(min=1).tolist()
+
     def __call__(self, data: TensorDict):
         raise NotImplementedError
 
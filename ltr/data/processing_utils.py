@@ -506,7 +506,7 @@ def perturb_box(box, min_iou=0.5, sigma_factor=0.1):
 
 
 def gauss_1d(sz, sigma, center, end_pad=0, density=False):
-    k = torch.arange(-(sz - 1) / 2, (sz + 1) / 2 + end_pad).reshape(1, -1)
+    k = torch.arange(-(sz - 1) / 2, (sz + 1) / 2 + end_pad, device=center.device).reshape(1, -1)
     gauss = torch.exp(-1.0 / (2 * sigma ** 2) * (k - center.reshape(-1, 1)) ** 2)
     if density:
         gauss /= math.sqrt(2 * math.pi) * sigma
@@ -531,14 +531,14 @@ def gaussian_label_function(target_bb, sigma_factor, kernel_sz, feat_sz, image_s
     if isinstance(image_sz, (float, int)):
         image_sz = (image_sz, image_sz)
 
-    image_sz = torch.Tensor(image_sz)
+    image_sz = torch.Tensor(image_sz).to(target_bb.device)
     feat_sz = torch.Tensor(feat_sz)
 
     target_center = target_bb[:, 0:2] + 0.5 * target_bb[:, 2:4]
     target_center_norm = (target_center - image_sz / 2) / image_sz
 
-    center = feat_sz * target_center_norm + 0.5 * \
-             torch.Tensor([(kernel_sz[0] + 1) % 2, (kernel_sz[1] + 1) % 2])
+    center = feat_sz.to(target_bb.device) * target_center_norm + 0.5 * \
+             torch.Tensor([(kernel_sz[0] + 1) % 2, (kernel_sz[1] + 1) % 2]).to(target_bb.device)
 
     sigma = sigma_factor * feat_sz.prod().sqrt().item()
 
@@ -1,6 +1,7 @@
 import random
 import torch.utils.data
 from pytracking import TensorDict
+from ltr.data.visible_frame_index import VisibleFrameIndex, gap_increase_for
 
 
 def no_processing(data):
@@ -17,13 +18,15 @@ class TrackingSampler(torch.utils.data.Dataset):
     from that dataset. A base frame is then sampled randomly from the sequence. Next, a set of 'train frames' and
     'test frames' are sampled from the sequence from the range [base_frame_id - max_gap, base_frame_id]  and
     (base_frame_id, base_frame_id + max_gap] respectively. Only the frames in which the target is visible are sampled.
-    If enough visible frames are not found, the 'max_gap' is increased gradually till enough frames are found.
+    If enough visible frames are not found, the 'max_gap' is increased in steps of 5 till enough frames are found. The
+    required increase is computed from the VisibleFrameIndex of the sequence, without trying each gap.
 
     The sampled frames are then passed through the input 'processing' function for the necessary processing-
     """
 
     def __init__(self, datasets, p_datasets, samples_per_epoch, max_gap,
-                 num_test_frames, num_train_frames=1, processing=no_processing, frame_sample_mode='causal'):
+                 num_test_frames, num_train_frames=1, processing=no_processing, frame_sample_mode='causal',
+                 decode_at_crop_resolution=False):
         """
         args:
             datasets - List of datasets to be used for training
@@ -35,6 +38,11 @@ class TrackingSampler(torch.utils.data.Dataset):
             processing - An instance of Processing class which performs the necessary processing of the data.
             frame_sample_mode - Either 'causal' or 'interval'. If 'causal', then the test frames are sampled in a causally,
                                 otherwise randomly within the interval.
+            decode_at_crop_resolution - Decode the frames downscaled by 2, 4 or 8 when the search region crops of the
+                                processing are resized to output_sz by at least that factor (see
+                                BaseProcessing.max_decode_downscale). Only used for datasets which support it (see
+                                BaseVideoDataset.supports_downscaled_frames). Reduces the decoding time and memory for
+                                high resolution videos.
         """
         self.datasets = datasets
 
@@ -52,15 +60,25 @@ class TrackingSampler(torch.utils.data.Dataset):
         self.num_train_frames = num_train_frames
         self.processing = processing
         self.frame_sample_mode = frame_sample_mode
+        self.decode_at_crop_resolution = decode_at_crop_resolution
+
+        self.visible_indices = {}
 
     def __len__(self):
         return self.samples_per_epoch
 
+    def _get_visible_index(self, dataset_id, seq_id, visible):
+        """ The VisibleFrameIndex of a sequence. It is built on the first use and kept for the following samples."""
+        key = (dataset_id, seq_id)
+        if key not in self.visible_indices:
+            self.visible_indices[key] = VisibleFrameIndex(visible)
+        return self.visible_indices[key]
+
     def _sample_visible_ids(self, visible, num_ids=1, min_id=None, max_id=None):
         """ Samples num_ids frames between min_id and max_id for which target is visible
 
         args:
-            visible - 1d Tensor indicating whether target is visible for each frame
+            visible - VisibleFrameIndex, or 1d Tensor indicating whether target is visible for each frame
             num_ids - number of frames to be samples
             min_id - Minimum allowed frame number
             max_id - Maximum allowed frame number
@@ -70,18 +88,64 @@ class TrackingSampler(torch.utils.data.Dataset):
         """
         if num_ids == 0:
             return []
-        if min_id is None or min_id < 0:
-            min_id = 0
-        if max_id is None or max_id > len(visible):
-            max_id = len(visible)
+        if not isinstance(visible, VisibleFrameIndex):
+            visible = VisibleFrameIndex(visible)
+        return visible.sample(num_ids, min_id=min_id, max_id=max_id)
 
-        valid_ids = [i for i in range(min_id, max_id) if visible[i]]
+    def _sample_frame_ids(self, visible):
+        """ Samples the train and test frames of a video sequence according to the frame_sample_mode.
 
-        # No visible ids
-        if len(valid_ids) == 0:
-            return None
+        args:
+            visible - VisibleFrameIndex of the sequence
 
-        return random.choices(valid_ids, k=num_ids)
+        returns:
+            list - Train frame numbers. None if the sequence contains no suitable frames.
+            list - Test frame numbers.
+        """
+        if self.frame_sample_mode == 'interval':
+            # Sample frame numbers within interval defined by the first frame. The gap is only increased if the
+            # intervals would not contain the first frame.
+            gap_increase = gap_increase_for(1 - self.max_gap)
+
+            base_frame_id = self._sample_visible_ids(visible, num_ids=1)
+            extra_train_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
+                                                             min_id=base_frame_id[0] - self.max_gap - gap_increase,
+                                                             max_id=base_frame_id[0] + self.max_gap + gap_increase)
+            train_frame_ids = base_frame_id + extra_train_frame_ids
+            test_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_test_frames,
+                                                      min_id=train_frame_ids[0] - self.max_gap - gap_increase,
+                                                      max_id=train_frame_ids[0] + self.max_gap + gap_increase)
+
+        elif self.frame_sample_mode == 'causal':
+            # Sample test and train frames in a causal manner, i.e. test_frame_ids > train_frame_ids. Only base frames
+            # with a visible frame after them (and before them, if more train frames are needed) are sampled.
+            min_id = self.num_train_frames - 1
+            if self.num_train_frames > 1:
+                min_id = max(min_id, visible.first() + 1)
+            max_id = min(len(visible) - self.num_test_frames, visible.last())
+
+            base_frame_id = self._sample_visible_ids(visible, num_ids=1, min_id=min_id, max_id=max_id)
+            if base_frame_id is None:
+                return None, None
+
+            # Increase gap until the windows contain a visible frame
+            required_gap = visible.next_visible(base_frame_id[0]) - base_frame_id[0] - self.max_gap + 1
+            if self.num_train_frames > 1:
+                required_gap = max(required_gap,
+                                   base_frame_id[0] - self.max_gap - visible.previous_visible(base_frame_id[0]))
+            gap_increase = gap_increase_for(required_gap)
+
+            prev_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
+                                                      min_id=base_frame_id[0] - self.max_gap - gap_increase,
+                                                      max_id=base_frame_id[0])
+            train_frame_ids = base_frame_id + prev_frame_ids
+            test_frame_ids = self._sample_visible_ids(visible, min_id=train_frame_ids[0] + 1,
+                                                      max_id=train_frame_ids[0] + self.max_gap + gap_increase,
+                                                      num_ids=self.num_test_frames)
+        else:
+            raise ValueError('Unknown frame sample mode {}'.format(self.frame_sample_mode))
+
+        return train_frame_ids, test_frame_ids
 
     def __getitem__(self, index):
         """
@@ -93,71 +157,35 @@ class TrackingSampler(torch.utils.data.Dataset):
         """
 
         # Select a dataset
-        dataset = random.choices(self.datasets, self.p_datasets)[0]
+        dataset_id = random.choices(range(len(self.datasets)), self.p_datasets)[0]
+        dataset = self.datasets[dataset_id]
         is_video_dataset = dataset.is_video_sequence()
 
         # Sample a sequence with enough visible frames
-        enough_visible_frames = False
-        while not enough_visible_frames:
+        train_frame_ids = None
+        while train_frame_ids is None:
             # Sample a sequence
             seq_id = random.randint(0, dataset.get_num_sequences() - 1)
-
-            # Sample frames
             seq_info_dict = dataset.get_sequence_info(seq_id)
-            visible = seq_info_dict['visible']
 
-            enough_visible_frames = visible.type(torch.int64).sum().item() > 2 * (
-                    self.num_test_frames + self.num_train_frames) and len(visible) >= 20
+            if not is_video_dataset:
+                # In case of image dataset, just repeat the image to generate synthetic video
+                train_frame_ids = [1] * self.num_train_frames
+                test_frame_ids = [1] * self.num_test_frames
+                break
 
-            enough_visible_frames = enough_visible_frames or not is_video_dataset
+            # Sample frames
+            visible = self._get_visible_index(dataset_id, seq_id, seq_info_dict['visible'])
 
-        if is_video_dataset:
-            train_frame_ids = None
-            test_frame_ids = None
-            gap_increase = 0
+            enough_visible_frames = visible.num_visible > 2 * (
+                    self.num_test_frames + self.num_train_frames) and len(visible) >= 20
 
-            if self.frame_sample_mode == 'interval':
-                # Sample frame numbers within interval defined by the first frame
-                while test_frame_ids is None:
-                    base_frame_id = self._sample_visible_ids(visible, num_ids=1)
-                    extra_train_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
-                                                                     min_id=base_frame_id[
-                                                                                0] - self.max_gap - gap_increase,
-                                                                     max_id=base_frame_id[
-                                                                                0] + self.max_gap + gap_increase)
-                    if extra_train_frame_ids is None:
-                        gap_increase += 5
-                        continue
-                    train_frame_ids = base_frame_id + extra_train_frame_ids
-                    test_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_test_frames,
-                                                              min_id=train_frame_ids[0] - self.max_gap - gap_increase,
-                                                              max_id=train_frame_ids[0] + self.max_gap + gap_increase)
-                    gap_increase += 5  # Increase gap until a frame is found
-
-            elif self.frame_sample_mode == 'causal':
-                # Sample test and train frames in a causal manner, i.e. test_frame_ids > train_frame_ids
-                while test_frame_ids is None:
-                    base_frame_id = self._sample_visible_ids(visible, num_ids=1, min_id=self.num_train_frames - 1,
-                                                             max_id=len(visible) - self.num_test_frames)
-                    prev_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
-                                                              min_id=base_frame_id[0] - self.max_gap - gap_increase,
-                                                              max_id=base_frame_id[0])
-                    if prev_frame_ids is None:
-                        gap_increase += 5
-                        continue
-                    train_frame_ids = base_frame_id + prev_frame_ids
-                    test_frame_ids = self._sample_visible_ids(visible, min_id=train_frame_ids[0] + 1,
-                                                              max_id=train_frame_ids[0] + self.max_gap + gap_increase,
-                                                              num_ids=self.num_test_frames)
-                    # Increase gap until a frame is found
-                    gap_increase += 5
-        else:
-            # In case of image dataset, just repeat the image to generate synthetic video
-            train_frame_ids = [1] * self.num_train_frames
-            test_frame_ids = [1] * self.num_test_frames
+            if enough_visible_frames:
+                train_frame_ids, test_frame_ids = self._sample_frame_ids(visible)
 
-        train_frames, train_anno, meta_obj_train = dataset.get_frames(seq_id, train_frame_ids, seq_info_dict)
-        test_frames, test_anno, meta_obj_test = dataset.get_frames(seq_id, test_frame_ids, seq_info_dict)
+        train_frames, train_anno, meta_obj_train = self._get_frames(dataset, seq_id, train_frame_ids, seq_info_dict,
+                                                                    'train')
+        test_frames, test_anno, meta_obj_test = self._get_frames(dataset, seq_id, test_frame_ids, seq_info_dict, 'test')
 
         data = TensorDict({'train_images': train_frames,
                            'train_anno': train_anno['bbox'],
@@ -168,25 +196,38 @@ class TrackingSampler(torch.utils.data.Dataset):
 
         return self.processing(data)
 
+    def _get_frames(self, dataset, seq_id, frame_ids, seq_info_dict, mode):
+        """ Loads the frames using dataset.get_frames. With decode_at_crop_resolution, the frames are downscaled during
+        decoding as far as the processing permits."""
+        if not (self.decode_at_crop_resolution and dataset.supports_downscaled_frames()
+                and hasattr(self.processing, 'max_decode_downscale')):
+            return dataset.get_frames(seq_id, frame_ids, seq_info_dict)
+
+        boxes = seq_info_dict['bbox'][frame_ids, :]
+        max_downscale = self.processing.max_decode_downscale(boxes, mode)
+        return dataset.get_frames(seq_id, frame_ids, seq_info_dict, max_downscale=max_downscale)
+
 
 class DiMPSampler(TrackingSampler):
     """ See TrackingSampler."""
 
     def __init__(self, datasets, p_datasets, samples_per_epoch, max_gap,
-                 num_test_frames, num_train_frames=1, processing=no_processing, frame_sample_mode='causal'):
+                 num_test_frames, num_train_frames=1, processing=no_processing, frame_sample_mode='causal',
+                 decode_at_crop_resolution=False):
         super().__init__(datasets=datasets, p_datasets=p_datasets, samples_per_epoch=samples_per_epoch, max_gap=max_gap,
                          num_test_frames=num_test_frames, num_train_frames=num_train_frames, processing=processing,
-                         frame_sample_mode=frame_sample_mode)
+                         frame_sample_mode=frame_sample_mode, decode_at_crop_resolution=decode_at_crop_resolution)
 
 
 class ATOMSampler(TrackingSampler):
     """ See TrackingSampler."""
 
     def __init__(self, datasets, p_datasets, samples_per_epoch, max_gap,
-                 num_test_frames=1, num_train_frames=1, processing=no_processing, frame_sample_mode='interval'):
+                 num_test_frames=1, num_train_frames=1, processing=no_processing, frame_sample_mode='interval',
+                 decode_at_crop_resolution=False):
         super().__init__(datasets=datasets, p_datasets=p_datasets, samples_per_epoch=samples_per_epoch, max_gap=max_gap,
                          num_test_frames=num_test_frames, num_train_frames=num_train_frames, processing=processing,
-                         frame_sample_mode=frame_sample_mode)
+                         frame_sample_mode=frame_sample_mode, decode_at_crop_resolution=decode_at_crop_resolution)
 
 
 class LWLSampler(torch.utils.data.Dataset):
@@ -237,14 +278,23 @@ class LWLSampler(torch.utils.data.Dataset):
 
         self.p_reverse = p_reverse
 
+        self.visible_indices = {}
+
     def __len__(self):
         return self.samples_per_epoch
 
+    def _get_visible_index(self, dataset_id, seq_id, visible):
+        """ The VisibleFrameIndex of a sequence. It is built on the first use and kept for the following samples."""
+        key = (dataset_id, seq_id)
+        if key not in self.visible_indices:
+            self.visible_indices[key] = VisibleFrameIndex(visible)
+        return self.visible_indices[key]
+
     def _sample_visible_ids(self, visible, num_ids=1, min_id=None, max_id=None):
         """ Samples num_ids frames between min_id and max_id for which target is visible
 
         args:
-            visible - 1d Tensor indicating whether target is visible for each frame
+            visible - VisibleFrameIndex, or 1d Tensor indicating whether target is visible for each frame
             num_ids - number of frames to be samples
             min_id - Minimum allowed frame number
             max_id - Maximum allowed frame number
@@ -252,18 +302,67 @@ class LWLSampler(torch.utils.data.Dataset):
         returns:
             list - List of sampled frame numbers. None if not sufficient visible frames could be found.
         """
-        if min_id is None or min_id < 0:
-            min_id = 0
-        if max_id is None or max_id > len(visible):
-            max_id = len(visible)
+        if not isinstance(visible, VisibleFrameIndex):
+            visible = VisibleFrameIndex(visible)
+        return visible.sample(num_ids, min_id=min_id, max_id=max_id)
 
-        valid_ids = [i for i in range(min_id, max_id) if visible[i]]
+    def _sample_frame_ids(self, visible, reverse_sequence):
+        """ Samples the train and test frames of a video sequence. The windows of the train frames are enlarged in
+        steps of 5 until they contain a visible frame, with the required increase computed from the VisibleFrameIndex.
 
-        # No visible ids
-        if len(valid_ids) == 0:
-            return None
+        args:
+            visible - VisibleFrameIndex of the sequence
+            reverse_sequence - Sample the train frames after the test frames
 
-        return random.choices(valid_ids, k=num_ids)
+        returns:
+            list - Train frame numbers. None if the sequence contains no suitable frames.
+            list - Test frame numbers.
+        """
+        if visible.num_visible == 0:
+            return None, None
+
+        if not reverse_sequence:
+            # Sample test and train frames in a causal manner, i.e. test_frame_ids > train_frame_ids. Only base frames
+            # with visible frames before and after them are sampled.
+            base_frame_id = self._sample_visible_ids(visible, num_ids=1,
+                                                     min_id=max(self.num_train_frames - 1, visible.first() + 1),
+                                                     max_id=min(len(visible) - self.num_test_frames, visible.last()))
+            if base_frame_id is None:
+                return None, None
+
+            # Increase gap until the windows contain a visible frame
+            gap_increase = gap_increase_for(max(
+                base_frame_id[0] - self.max_gap - visible.previous_visible(base_frame_id[0]),
+                visible.next_visible(base_frame_id[0]) - base_frame_id[0] - self.max_gap + 1))
+
+            prev_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
+                                                      min_id=base_frame_id[0] - self.max_gap - gap_increase,
+                                                      max_id=base_frame_id[0])
+            train_frame_ids = base_frame_id + prev_frame_ids
+            test_frame_ids = self._sample_visible_ids(visible, min_id=train_frame_ids[0]+1,
+                                                      max_id=train_frame_ids[0] + self.max_gap + gap_increase,
+                                                      num_ids=self.num_test_frames)
+        else:
+            # Sample in reverse order, i.e. train frames come after the test frames. Only base frames with a visible
+            # frame before them are sampled.
+            base_frame_id = self._sample_visible_ids(visible, num_ids=1,
+                                                     min_id=max(self.num_test_frames + 1, visible.first() + 2),
+                                                     max_id=len(visible) - self.num_train_frames - 1)
+            if base_frame_id is None:
+                return None, None
+
+            # The window of the train frames contains the base frame
+            gap_increase = gap_increase_for(1 - self.max_gap)
+
+            prev_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
+                                                      min_id=base_frame_id[0],
+                                                      max_id=base_frame_id[0] + self.max_gap + gap_increase)
+            train_frame_ids = base_frame_id + prev_frame_ids
+            test_frame_ids = self._sample_visible_ids(visible, min_id=0,
+                                                      max_id=train_frame_ids[0] - 1,
+                                                      num_ids=self.num_test_frames)
+
+        return train_frame_ids, test_frame_ids
 
     def __getitem__(self, index):
         """
@@ -275,7 +374,8 @@ class LWLSampler(torch.utils.data.Dataset):
         """
 
         # Select a dataset
-        dataset = random.choices(self.datasets, self.p_datasets)[0]
+        dataset_id = random.choices(range(len(self.datasets)), self.p_datasets)[0]
+        dataset = self.datasets[dataset_id]
 
         is_video_dataset = dataset.is_video_sequence()
 
@@ -284,66 +384,25 @@ class LWLSampler(torch.utils.data.Dataset):
             reverse_sequence = random.random() < self.p_reverse
 
         # Sample a sequence with enough visible frames
-        enough_visible_frames = False
-        while not enough_visible_frames:
+        train_frame_ids = None
+        while train_frame_ids is None:
             # Sample a sequence
             seq_id = random.randint(0, dataset.get_num_sequences() - 1)
-
-            # Sample frames
             seq_info_dict = dataset.get_sequence_info(seq_id)
-            visible = seq_info_dict['visible']
 
-            enough_visible_frames = visible.type(torch.int64).sum().item() > 2 * (self.num_test_frames + self.num_train_frames)
+            if not is_video_dataset:
+                # In case of image dataset, just repeat the image to generate synthetic video
+                train_frame_ids = [1]*self.num_train_frames
+                test_frame_ids = [1]*self.num_test_frames
+                break
 
-            enough_visible_frames = enough_visible_frames or not is_video_dataset
+            # Sample frames
+            visible = self._get_visible_index(dataset_id, seq_id, seq_info_dict['visible'])
 
-        if is_video_dataset:
-            train_frame_ids = None
-            test_frame_ids = None
-            gap_increase = 0
+            enough_visible_frames = visible.num_visible > 2 * (self.num_test_frames + self.num_train_frames)
 
-            # Sample test and train frames in a causal manner, i.e. test_frame_ids > train_frame_ids
-            while test_frame_ids is None:
-                if gap_increase > 1000:
-                    raise Exception('Frame not found')
-
-                if not reverse_sequence:
-                    base_frame_id = self._sample_visible_ids(visible, num_ids=1, min_id=self.num_train_frames - 1,
-                                                             max_id=len(visible)-self.num_test_frames)
-                    prev_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
-                                                              min_id=base_frame_id[0] - self.max_gap - gap_increase,
-                                                              max_id=base_frame_id[0])
-                    if prev_frame_ids is None:
-                        gap_increase += 5
-                        continue
-                    train_frame_ids = base_frame_id + prev_frame_ids
-                    test_frame_ids = self._sample_visible_ids(visible, min_id=train_frame_ids[0]+1,
-                                                              max_id=train_frame_ids[0] + self.max_gap + gap_increase,
-                                                              num_ids=self.num_test_frames)
-
-                    # Increase gap until a frame is found
-                    gap_increase += 5
-                else:
-                    # Sample in reverse order, i.e. train frames come after the test frames
-                    base_frame_id = self._sample_visible_ids(visible, num_ids=1, min_id=self.num_test_frames + 1,
-                                                             max_id=len(visible) - self.num_train_frames - 1)
-                    prev_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
-                                                              min_id=base_frame_id[0],
-                                                              max_id=base_frame_id[0] + self.max_gap + gap_increase)
-                    if prev_frame_ids is None:
-                        gap_increase += 5
-                        continue
-                    train_frame_ids = base_frame_id + prev_frame_ids
-                    test_frame_ids = self._sample_visible_ids(visible, min_id=0,
-                                                              max_id=train_frame_ids[0] - 1,
-                                                              num_ids=self.num_test_frames)
-
-                    # Increase gap until a frame is found
-                    gap_increase += 5
-        else:
-            # In case of image dataset, just repeat the image to generate synthetic video
-            train_frame_ids = [1]*self.num_train_frames
-            test_frame_ids = [1]*self.num_test_frames
+            if enough_visible_frames:
+                train_frame_ids, test_frame_ids = self._sample_frame_ids(visible, reverse_sequence)
 
         # Sort frames
         train_frame_ids = sorted(train_frame_ids, reverse=reverse_sequence)
@@ -407,14 +466,23 @@ class KYSSampler(torch.utils.data.Dataset):
 
         self.sample_occluded_sequences = sample_occluded_sequences
 
+        self.visible_indices = {}
+
     def __len__(self):
         return self.samples_per_epoch
 
+    def _get_visible_index(self, dataset_id, seq_id, visible):
+        """ The VisibleFrameIndex of a sequence. It is built on the first use and kept for the following samples."""
+        key = (dataset_id, seq_id)
+        if key not in self.visible_indices:
+            self.visible_indices[key] = VisibleFrameIndex(visible)
+        return self.visible_indices[key]
+
     def _sample_ids(self, valid, num_ids=1, min_id=None, max_id=None):
         """ Samples num_ids frames between min_id and max_id for which target is visible
 
         args:
-            visible - 1d Tensor indicating whether target is visible for each frame
+            valid - VisibleFrameIndex, or 1d Tensor indicating whether target is visible for each frame
             num_ids - number of frames to be samples
             min_id - Minimum allowed frame number
             max_id - Maximum allowed frame number
@@ -422,18 +490,22 @@ class KYSSampler(torch.utils.data.Dataset):
         returns:
             list - List of sampled frame numbers. None if not sufficient visible frames could be found.
         """
-        if min_id is None or min_id < 0:
-            min_id = 0
-        if max_id is None or max_id > len(valid):
-            max_id = len(valid)
-
-        valid_ids = [i for i in range(min_id, max_id) if valid[i]]
-
-        # No visible ids
-        if len(valid_ids) == 0:
-            return None
-
-        return random.choices(valid_ids, k=num_ids)
+        if not isinstance(valid, VisibleFrameIndex):
+            valid = VisibleFrameIndex(valid)
+        return valid.sample(num_ids, min_id=min_id, max_id=max_id)
+
+    def _sample_train_ids(self, visible, base_frame_id, num_train_frames, max_train_gap):
+        """ Samples the train frames before base_frame_id. The gap is increased in steps of 5 until the window contains
+        a visible frame. If the window reaches the start of the sequence without containing one, the base frame is
+        used as train frames."""
+        prev_visible_id = visible.previous_visible(base_frame_id - 1)
+        if prev_visible_id is None:
+            return [base_frame_id] * num_train_frames
+
+        gap_increase = gap_increase_for(base_frame_id - max_train_gap - 1 - prev_visible_id)
+        return self._sample_ids(visible, num_ids=num_train_frames,
+                                min_id=base_frame_id - max_train_gap - gap_increase - 1,
+                                max_id=base_frame_id - 1)
 
     def find_occlusion_end_frame(self, first_occ_frame, target_not_fully_visible):
         for i in range(first_occ_frame, len(target_not_fully_visible)):
@@ -454,7 +526,8 @@ class KYSSampler(torch.utils.data.Dataset):
         # Select a dataset
         p_datasets = self.p_datasets
 
-        dataset = random.choices(self.datasets, p_datasets)[0]
+        dataset_id = random.choices(range(len(self.datasets)), p_datasets)[0]
+        dataset = self.datasets[dataset_id]
         is_video_dataset = dataset.is_video_sequence()
 
         num_train_frames = self.sequence_sample_info['num_train_frames']
@@ -475,97 +548,71 @@ class KYSSampler(torch.utils.data.Dataset):
             seq_id = random.randint(0, dataset.get_num_sequences() - 1)
 
             seq_info_dict = dataset.get_sequence_info(seq_id)
-            visible = seq_info_dict['visible']
-            visible_ratio = seq_info_dict.get('visible_ratio', visible)
-
-            num_visible = visible.type(torch.int64).sum().item()
+            visible_ratio = seq_info_dict.get('visible_ratio', seq_info_dict['visible'])
+            visible = self._get_visible_index(dataset_id, seq_id, seq_info_dict['visible'])
 
-            enough_visible_frames = not is_video_dataset or (num_visible > min_visible_frames and len(visible) >= 20)
+            enough_visible_frames = not is_video_dataset or (visible.num_visible > min_visible_frames and
+                                                             len(visible) >= 20)
 
             valid_sequence = enough_visible_frames
 
         if self.sequence_sample_info['mode'] == 'Sequence':
             if is_video_dataset:
-                train_frame_ids = None
-                test_frame_ids = None
-                gap_increase = 0
-
                 test_valid_image = torch.zeros(num_test_frames, dtype=torch.int8)
+
                 # Sample frame numbers in a causal manner, i.e. test_frame_ids > train_frame_ids
-                while test_frame_ids is None:
-                    occlusion_sampling = False
-                    if dataset.has_occlusion_info() and self.sample_occluded_sequences:
-                        target_not_fully_visible = visible_ratio < 0.9
-                        if target_not_fully_visible.float().sum() > 0:
-                            occlusion_sampling = True
+                occlusion_sampling = False
+                if dataset.has_occlusion_info() and self.sample_occluded_sequences:
+                    target_not_fully_visible = visible_ratio < 0.9
+                    if target_not_fully_visible.float().sum() > 0:
+                        occlusion_sampling = True
+
+                if occlusion_sampling:
+                    first_occ_frame = int(target_not_fully_visible.nonzero()[0])
 
-                    if occlusion_sampling:
-                        first_occ_frame = target_not_fully_visible.nonzero()[0]
+                    occ_end_frame = self.find_occlusion_end_frame(first_occ_frame, target_not_fully_visible)
 
-                        occ_end_frame = self.find_occlusion_end_frame(first_occ_frame, target_not_fully_visible)
+                    # Make sure target visible in first frame
+                    base_frame_id = self._sample_ids(visible, num_ids=1, min_id=max(0, first_occ_frame - 20),
+                                                     max_id=first_occ_frame - 5)
 
-                        # Make sure target visible in first frame
-                        base_frame_id = self._sample_ids(visible, num_ids=1, min_id=max(0, first_occ_frame - 20),
-                                                         max_id=first_occ_frame - 5)
+                    if base_frame_id is None:
+                        base_frame_id = 0
+                    else:
+                        base_frame_id = base_frame_id[0]
 
-                        if base_frame_id is None:
-                            base_frame_id = 0
-                        else:
-                            base_frame_id = base_frame_id[0]
+                    train_frame_ids = self._sample_train_ids(visible, base_frame_id, num_train_frames, max_train_gap)
 
-                        prev_frame_ids = self._sample_ids(visible, num_ids=num_train_frames,
-                                                          min_id=base_frame_id - max_train_gap - gap_increase - 1,
-                                                          max_id=base_frame_id - 1)
+                    end_frame = min(occ_end_frame + random.randint(5, 20), len(visible) - 1)
 
-                        if prev_frame_ids is None:
-                            if base_frame_id - max_train_gap - gap_increase - 1 < 0:
-                                prev_frame_ids = [base_frame_id] * num_train_frames
-                            else:
-                                gap_increase += 5
-                                continue
+                    if (end_frame - base_frame_id) < num_test_frames:
+                        rem_frames = num_test_frames - (end_frame - base_frame_id)
+                        end_frame = random.randint(end_frame, min(len(visible) - 1, end_frame + rem_frames))
+                        base_frame_id = max(0, end_frame - num_test_frames + 1)
 
-                        train_frame_ids = prev_frame_ids
+                        end_frame = min(end_frame, len(visible) - 1)
 
-                        end_frame = min(occ_end_frame + random.randint(5, 20), len(visible) - 1)
+                    step_len = float(end_frame - base_frame_id) / float(num_test_frames)
 
-                        if (end_frame - base_frame_id) < num_test_frames:
-                            rem_frames = num_test_frames - (end_frame - base_frame_id)
-                            end_frame = random.randint(end_frame, min(len(visible) - 1, end_frame + rem_frames))
-                            base_frame_id = max(0, end_frame - num_test_frames + 1)
+                    test_frame_ids = [base_frame_id + int(x * step_len) for x in range(0, num_test_frames)]
+                    test_valid_image[:len(test_frame_ids)] = 1
 
-                            end_frame = min(end_frame, len(visible) - 1)
+                    test_frame_ids = test_frame_ids + [0] * (num_test_frames - len(test_frame_ids))
+                else:
+                    # Make sure target visible in first frame
+                    base_frame_id = self._sample_ids(visible, num_ids=1, min_id=2*num_train_frames,
+                                                     max_id=len(visible) - int(num_test_frames * min_fraction_valid_frames))
+                    if base_frame_id is None:
+                        base_frame_id = 0
+                    else:
+                        base_frame_id = base_frame_id[0]
 
-                        step_len = float(end_frame - base_frame_id) / float(num_test_frames)
+                    train_frame_ids = self._sample_train_ids(visible, base_frame_id, num_train_frames, max_train_gap)
 
-                        test_frame_ids = [base_frame_id + int(x * step_len) for x in range(0, num_test_frames)]
-                        test_valid_image[:len(test_frame_ids)] = 1
+                    test_frame_ids = list(range(base_frame_id, min(len(visible), base_frame_id + num_test_frames)))
+                    test_valid_image[:len(test_frame_ids)] = 1
 
-                        test_frame_ids = test_frame_ids + [0] * (num_test_frames - len(test_frame_ids))
-                    else:
-                        # Make sure target visible in first frame
-                        base_frame_id = self._sample_ids(visible, num_ids=1, min_id=2*num_train_frames,
-                                                         max_id=len(visible) - int(num_test_frames * min_fraction_valid_frames))
-                        if base_frame_id is None:
-                            base_frame_id = 0
-                        else:
-                            base_frame_id = base_frame_id[0]
-
-                        prev_frame_ids = self._sample_ids(visible, num_ids=num_train_frames,
-                                                          min_id=base_frame_id - max_train_gap - gap_increase - 1,
-                                                          max_id=base_frame_id - 1)
-                        if prev_frame_ids is None:
-                            if base_frame_id - max_train_gap - gap_increase - 1 < 0:
-                                prev_frame_ids = [base_frame_id] * num_train_frames
-                            else:
-                                gap_increase += 5
-                                continue
-
-                        train_frame_ids = prev_frame_ids
-
-                        test_frame_ids = list(range(base_frame_id, min(len(visible), base_frame_id + num_test_frames)))
-                        test_valid_image[:len(test_frame_ids)] = 1
-
-                        test_frame_ids = test_frame_ids + [0]*(num_test_frames - len(test_frame_ids))
+                    test_frame_ids = test_frame_ids + [0]*(num_test_frames - len(test_frame_ids))
             else:
                 raise NotImplementedError
         else:
@@ -841,10 +888,6 @@ class TaMOsDatasetSampler(TrackingSampler):
             enough_visible_frames = enough_visible_frames or not is_video_dataset
 
         if is_video_dataset:
-            train_frame_ids = None
-            test_frame_ids = None
-            gap_increase = 0
-
             frame_annotation_period = 1
             if hasattr(dataset, 'get_frame_annotation_period'):
                 frame_annotation_period = dataset.get_frame_annotation_period(seq_id)
@@ -861,32 +904,47 @@ class TaMOsDatasetSampler(TrackingSampler):
             max_gap = max_gap // frame_annotation_period
             gap = gap // frame_annotation_period
 
-            # Sample test and train frames in a causal manner, i.e. test_frame_ids > train_frame_ids
-            while test_frame_ids is None:
-                base_frame_id = self._sample_visible_ids(visible, num_ids=1, min_id=self.num_train_frames - 1,
-                                                         max_id=len(visible) - self.num_test_frames)
-                prev_frame_ids = self._sample_visible_ids(visible, num_ids=self.num_train_frames - 1,
-                                                          min_id=base_frame_id[0] - max_gap - gap_increase,
-                                                          max_id=base_frame_id[0])
-                if prev_frame_ids is None:
-                    gap_increase += max(1, 5 // frame_annotation_period)
-                    continue
-                train_frame_ids = base_frame_id + prev_frame_ids
+            # Sample test and train frames in a causal manner, i.e. test_frame_ids > train_frame_ids. Only base frames
+            # with visible frames after them (and before them, if more train frames are needed) are sampled.
+            visible_index = self._get_visible_index(dataset_id, seq_id, visible)
+            gap_step = max(1, 5 // frame_annotation_period)
 
-                if is_mot_dataset:
-                    visible_for_train_frames = self.recompute_visiblity_for_train_frame_objects(visible_mot,
-                                                                                                train_frame_ids)
-                else:
-                    visible_for_train_frames = visible.clone()
+            min_id = self.num_train_frames - 1
+            if self.num_train_frames > 1:
+                min_id = max(min_id, visible_index.first() + 1)
+            max_id = min(len(visible) - self.num_test_frames, visible_index.last() - gap)
 
-                test_frame_ids = self._sample_visible_ids(visible_for_train_frames, min_id=train_frame_ids[0] + 1 + gap,
-                                                          max_id=train_frame_ids[0] + max_gap + gap_increase,
-                                                          num_ids=self.num_test_frames)
-                # Increase gap until a frame is found
-                gap_increase += max(1, 5 // frame_annotation_period)
+            base_frame_id = self._sample_visible_ids(visible_index, num_ids=1, min_id=min_id, max_id=max_id)
+            if base_frame_id is None:
+                return None
 
-                if gap_increase > len(visible):
-                    return None
+            # Increase gap until the window of the previous train frames contains a visible frame
+            gap_increase = 0
+            if self.num_train_frames > 1:
+                gap_increase = gap_increase_for(
+                    base_frame_id[0] - max_gap - visible_index.previous_visible(base_frame_id[0]), gap_step)
+
+            prev_frame_ids = self._sample_visible_ids(visible_index, num_ids=self.num_train_frames - 1,
+                                                      min_id=base_frame_id[0] - max_gap - gap_increase,
+                                                      max_id=base_frame_id[0])
+            train_frame_ids = base_frame_id + prev_frame_ids
+
+            if is_mot_dataset:
+                visible_for_train_frames = VisibleFrameIndex(
+                    self.recompute_visiblity_for_train_frame_objects(visible_mot, train_frame_ids))
+            else:
+                visible_for_train_frames = visible_index
+
+            # Increase gap until the window of the test frames contains a visible frame
+            next_visible_id = visible_for_train_frames.next_visible(train_frame_ids[0] + gap)
+            if next_visible_id is None:
+                return None
+            gap_increase = max(gap_increase,
+                               gap_increase_for(next_visible_id - train_frame_ids[0] - max_gap + 1, gap_step))
+
+            test_frame_ids = self._sample_visible_ids(visible_for_train_frames, min_id=train_frame_ids[0] + 1 + gap,
+                                                      max_id=train_frame_ids[0] + max_gap + gap_increase,
+                                                      num_ids=self.num_test_frames)
         else:
             # In case of image dataset, just repeat the image to generate synthetic video
             train_frame_ids = [1] * self.num_train_frames
@@ -0,0 +1,79 @@
+import random
+import numpy as np
+import torch
+
+
+def gap_increase_for(required_gap, step=5):
+    """ The smallest multiple of step which is at least required_gap, i.e. the gap increase the samplers reach when
+    increasing the gap in steps of step until the sampling window contains a visible frame."""
+    return step * max(0, -(-int(required_gap) // step))
+
+
+class VisibleFrameIndex:
+    """ The visible frames of a sequence, for sampling visible frames within a frame window without iterating over the
+    window. Stores the ids of the visible frames and the prefix sums of the visibility, such that the number of
+    visible frames in a window, drawing a visible frame from it, and finding the closest visible frame before or after
+    a frame are O(1).
+    """
+
+    def __init__(self, visible):
+        """
+        args:
+            visible - 1d Tensor indicating whether the target is visible in each frame.
+        """
+        visible = torch.as_tensor(visible).reshape(-1).cpu().numpy().astype(bool)
+        self.num_frames = len(visible)
+        self.visible_ids = np.flatnonzero(visible).astype(np.int32)
+        self.prefix = np.zeros(self.num_frames + 1, dtype=np.int32)
+        np.cumsum(visible, out=self.prefix[1:])
+
+    def __len__(self):
+        return self.num_frames
+
+    @property
+    def num_visible(self):
+        return len(self.visible_ids)
+
+    def _window(self, min_id=None, max_id=None):
+        """ Range of positions in visible_ids of the visible frames in [min_id, max_id)."""
+        if min_id is None or min_id < 0:
+            min_id = 0
+        if max_id is None or max_id > self.num_frames:
+            max_id = self.num_frames
+        if max_id <= min_id:
+            return 0, 0
+        return int(self.prefix[min_id]), int(self.prefix[max_id])
+
+    def count(self, min_id=None, max_id=None):
+        """ Number of visible frames in [min_id, max_id)."""
+        start, end = self._window(min_id, max_id)
+        return end - start
+
+    def sample(self, num_ids=1, min_id=None, max_id=None):
+        """ Samples num_ids visible frames in [min_id, max_id), uniformly with replacement.
+
+        returns:
+            list - List of sampled frame numbers. None if there is no visible frame in the window.
+        """
+        start, end = self._window(min_id, max_id)
+        if end <= start:
+            return None
+        return [int(self.visible_ids[random.randrange(start, end)]) for _ in range(num_ids)]
+
+    def first(self):
+        """ The first visible frame, None if no frame is visible."""
+        return int(self.visible_ids[0]) if self.num_visible > 0 else None
+
+    def last(self):
+        """ The last visible frame, None if no frame is visible."""
+        return int(self.visible_ids[-1]) if self.num_visible > 0 else None
+
+    def previous_visible(self, frame_id):
+        """ The last visible frame before frame_id, None if there is none."""
+        start, end = self._window(0, frame_id)
+        return int(self.visible_ids[end - 1]) if end > start else None
+
+    def next_visible(self, frame_id):
+        """ The first visible frame after frame_id, None if there is none."""
+        start, end = self._window(frame_id + 1, None)
+        return int(self.visible_ids[start]) if end > start else None
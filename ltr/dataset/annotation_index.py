@@ -0,0 +1,120 @@
+import os
+import hashlib
+import shutil
+import numpy as np
+import torch
+
+
+class AnnotationIndex:
+    """ Annotations of all sequences of a video dataset (the dicts returned by get_sequence_info, e.g. 'bbox',
+    'valid', 'visible'), packed into one contiguous array per annotation type. The annotations of sequence i are the
+    rows offsets[i]:offsets[i+1] of the arrays.
+
+    The index can be saved to a cache directory, with one .npy file per array. A loaded index memory maps the files,
+    such that the annotations are shared between the DataLoader workers (also when the dataset is pickled to the
+    workers, the files are then mapped again).
+    """
+
+    version = 1
+
+    def __init__(self, arrays, offsets, path=None):
+        """
+        args:
+            arrays - Dict of annotation name -> array of the annotations of all sequences, concatenated in dim 0.
+            offsets - Start row of each sequence in the arrays, followed by the total number of rows.
+            path - Cache directory the arrays are memory mapped from, None for an in-memory index.
+        """
+        self.arrays = arrays
+        self.offsets = offsets
+        self.path = path
+
+    @classmethod
+    def build(cls, read_sequence_info, num_sequences):
+        """ Build the index by reading the annotations of every sequence.
+
+        args:
+            read_sequence_info - Function returning the annotation dict of a sequence, given its index.
+            num_sequences - Number of sequences in the dataset.
+        """
+        annos = [read_sequence_info(seq_id) for seq_id in range(num_sequences)]
+        lengths = [len(next(iter(anno.values()))) if anno else 0 for anno in annos]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+        keys = list(annos[0].keys()) if annos else []
+        arrays = {key: np.concatenate([torch.as_tensor(anno[key]).numpy() for anno in annos]) for key in keys}
+        return cls(arrays, offsets)
+
+    @classmethod
+    def load(cls, path):
+        """ Memory map an index saved by save."""
+        offsets = np.load(os.path.join(path, 'offsets.npy'))
+        keys = [os.path.splitext(f)[0] for f in sorted(os.listdir(path)) if f.endswith('.npy') and f != 'offsets.npy']
+        arrays = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode='r') for key in keys}
+        return cls(arrays, offsets, path)
+
+    def save(self, path):
+        """ Save the index to the directory path. The files are written to a temporary directory first, such that
+        concurrent readers never see a partially written index."""
+        tmp_path = '{}.tmp{}'.format(path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, 'offsets.npy'), self.offsets)
+        for key, array in self.arrays.items():
+            np.save(os.path.join(tmp_path, key + '.npy'), array)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Saved by another process in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load_or_build(cls, dataset, read_sequence_info, cache_dir=None):
+        """ Load the index of the dataset from the cache directory, or build it and save it there. The cache entry is
+        specific to the dataset class, root and sequence list. Delete it if the annotation files are changed.
+
+        args:
+            dataset - The dataset.
+            read_sequence_info - Function reading the annotation dict of a sequence from disk.
+            cache_dir - Cache directory. If None, the index is built in memory and not saved.
+        """
+        if cache_dir is None:
+            return cls.build(read_sequence_info, dataset.get_num_sequences())
+
+        path = os.path.join(cache_dir, cls.cache_name(dataset))
+        if os.path.isdir(path):
+            return cls.load(path)
+
+        print('Building the annotation index of {} in {}'.format(dataset.get_name(), path))
+        index = cls.build(read_sequence_info, dataset.get_num_sequences())
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            index.save(path)
+        except OSError as e:
+            print('WARNING: Could not save the annotation index ({}). It is kept in memory.'.format(e))
+            return index
+        return cls.load(path)
+
+    @classmethod
+    def cache_name(cls, dataset):
+        key = '\n'.join([str(cls.version), type(dataset).__name__, str(dataset.root)] +
+                        [str(s) for s in dataset.sequence_list])
+        return '{}_{}'.format(dataset.get_name(), hashlib.sha1(key.encode()).hexdigest()[:16])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_sequence_info(self, seq_id):
+        """ The annotation dict of a sequence, with tensors of the same types as the read annotations."""
+        start, end = self.offsets[seq_id], self.offsets[seq_id + 1]
+        return {key: torch.from_numpy(np.array(array[start:end])) for key, array in self.arrays.items()}
+
+    def __getstate__(self):
+        if self.path is None:
+            return self.__dict__
+        # Map the files again after unpickling instead of copying the arrays
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        if 'arrays' in state:
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(AnnotationIndex.load(state['path']).__dict__)
@@ -1,5 +1,22 @@
+import os
+import importlib
 import torch.utils.data
-from ltr.data.image_loader import jpeg4py_loader
+from ltr.data.image_loader import jpeg4py_loader, opencv_loader_downscaled
+from .annotation_index import AnnotationIndex
+
+
+def _default_annotation_cache_dir():
+    """ The annotation_cache_dir of the environment settings, or 'annotation_cache' in the workspace_dir. None if
+    neither is set or the environment settings (ltr/admin/local.py) do not exist. Unlike env_settings, this does not
+    create a default local.py, such that datasets created with an explicit root work without one."""
+    try:
+        env = importlib.import_module('ltr.admin.local').EnvironmentSettings()
+    except Exception:
+        return None
+    cache_dir = getattr(env, 'annotation_cache_dir', None)
+    if not cache_dir and getattr(env, 'workspace_dir', None):
+        cache_dir = os.path.join(env.workspace_dir, 'annotation_cache')
+    return cache_dir or None
 
 
 class BaseVideoDataset(torch.utils.data.Dataset):
@@ -18,6 +35,7 @@ class BaseVideoDataset(torch.utils.data.Dataset):
 
         self.sequence_list = []     # Contains the list of sequences.
         self.class_list = []
+        self.annotation_index = None
 
     def __len__(self):
         """ Returns size of the dataset
@@ -83,6 +101,45 @@ class BaseVideoDataset(torch.utils.data.Dataset):
     def has_segmentation_info(self):
         return False
 
+    def supports_downscaled_frames(self):
+        """ Returns whether get_frames accepts the max_downscale argument, i.e. whether the frames can be decoded at a
+        reduced resolution (see TrackingSampler, decode_at_crop_resolution). The annotations returned together with
+        downscaled frames are scaled accordingly.
+
+        returns:
+            bool - True if get_frames supports max_downscale
+        """
+        return False
+
+    def _load_images(self, paths, max_downscale=None):
+        """ Loads the images with the image_loader. Images with a max_downscale of at least 2 are instead downscaled
+        during decoding (see opencv_loader_downscaled).
+
+        args:
+            paths - List of image paths
+            max_downscale - List with the maximum downscaling factor of each image, or None
+
+        returns:
+            list - The images
+            list - The downscaling factor of each image
+        """
+        if max_downscale is None:
+            return [self.image_loader(p) for p in paths], [1] * len(paths)
+
+        images, scale_factors = [], []
+        for path, ds in zip(paths, max_downscale):
+            im, factor = opencv_loader_downscaled(path, ds) if ds >= 2 else (self.image_loader(path), 1)
+            images.append(im)
+            scale_factors.append(factor)
+        return images, scale_factors
+
+    @staticmethod
+    def _downscale_anno_frames(anno_frames, scale_factors):
+        """ Scales the boxes of the frames decoded with the given downscaling factors."""
+        if 'bbox' in anno_frames:
+            anno_frames['bbox'] = [bb / f if f != 1 else bb for bb, f in zip(anno_frames['bbox'], scale_factors)]
+        return anno_frames
+
     def get_sequence_info(self, seq_id):
         """ Returns information about a particular sequences,
 
@@ -92,15 +149,41 @@ class BaseVideoDataset(torch.utils.data.Dataset):
         returns:
             Dict
             """
+        if self.annotation_index is not None:
+            return self.annotation_index.get_sequence_info(seq_id)
+        return self._read_sequence_info(seq_id)
+
+    def _read_sequence_info(self, seq_id):
+        """ Reads the information about a particular sequence (see get_sequence_info) from the annotation files.
+        Datasets implementing this can use an annotation index (see build_annotation_index)."""
         raise NotImplementedError
 
-    def get_frames(self, seq_id, frame_ids, anno=None):
+    def build_annotation_index(self, cache_dir=None, cache=True):
+        """ Reads the annotations of all sequences once and keeps them in an AnnotationIndex, which is then used by
+        get_sequence_info. Call this after the sequence list is final.
+
+        args:
+            cache_dir - Directory in which the index is cached. By default the annotation_cache_dir of the environment
+                        settings, or 'annotation_cache' in the workspace_dir. If neither is set (or there are no
+                        environment settings), the index is only kept in memory.
+            cache - Cache the index. Disable it for sequence lists which change between runs (e.g. random subsets).
+        """
+        if not cache:
+            cache_dir = None
+        elif cache_dir is None:
+            cache_dir = _default_annotation_cache_dir()
+        self.annotation_index = AnnotationIndex.load_or_build(self, self._read_sequence_info, cache_dir or None)
+
+    def get_frames(self, seq_id, frame_ids, anno=None, max_downscale=None):
         """ Get a set of frames from a particular sequence
 
         args:
             seq_id      - index of sequence
             frame_ids   - a list of frame numbers
             anno(None)  - The annotation for the sequence (see get_sequence_info). If None, they will be loaded.
+            max_downscale(None) - Only if supports_downscaled_frames. List with the maximum factor by which each frame
+                                  may be downscaled during decoding. The returned boxes are in the coordinates of the
+                                  returned frames.
 
         returns:
             list - List of frames corresponding to frame_ids
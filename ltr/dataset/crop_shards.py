@@ -0,0 +1,336 @@
+import os
+import json
+import math
+import shutil
+import numpy as np
+import cv2 as cv
+import torch
+from collections import OrderedDict
+from .base_video_dataset import BaseVideoDataset
+from .annotation_index import AnnotationIndex
+
+
+class CropShards:
+    """ Pre-extracted crops around the annotated frames of a video dataset, see write_crop_shards.
+
+    The crops are stored as raw uint8 (HxWx3, rgb) in shard files shard_00000.bin, shard_00001.bin, ..., which are
+    memory mapped. The crops are sorted by sequence and frame. The crops of sequence i are the entries
+    seq_offsets[i]:seq_offsets[i+1] of the index arrays:
+        frame_ids - Frame number of the crop.
+        locations - Shard number, byte offset, height and width of the crop.
+        crop_boxes - The cropped region in the frame (x0, y0) and the scale factors (sx, sy) from frame to crop
+                     coordinates, i.e. x_crop = (x - x0) * sx.
+    """
+
+    version = 2
+    index_files = ['seq_offsets', 'frame_ids', 'locations', 'crop_boxes']
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != self.version:
+            raise ValueError('Crop shards {} have version {}, expected {}. Create them again.'.format(
+                path, self.meta.get('version'), self.version))
+
+        for name in self.index_files:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy')))
+        self._shards = {}
+
+    def _get_shard(self, shard_id):
+        if shard_id not in self._shards:
+            self._shards[shard_id] = np.memmap(os.path.join(self.path, 'shard_{:05d}.bin'.format(shard_id)),
+                                               dtype=np.uint8, mode='r')
+        return self._shards[shard_id]
+
+    def find(self, seq_id, frame_id):
+        """ Entry of the crop of a frame, None if the frame has no crop."""
+        start, end = self.seq_offsets[seq_id], self.seq_offsets[seq_id + 1]
+        pos = start + np.searchsorted(self.frame_ids[start:end], frame_id)
+        if pos < end and self.frame_ids[pos] == frame_id:
+            return pos
+        return None
+
+    def get_crop(self, entry):
+        """ Returns the crop (np.array) and its crop box (x0, y0, sx, sy)."""
+        shard_id, offset, h, w = (int(v) for v in self.locations[entry])
+        crop = np.array(self._get_shard(shard_id)[offset:offset + h * w * 3]).reshape(h, w, 3)
+        return crop, self.crop_boxes[entry]
+
+    def __getstate__(self):
+        # The shards are mapped again after unpickling (e.g. in the DataLoader workers)
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+
+def _max_jitter(factor):
+    """ Largest jitter factor over the modes ('train', 'test')."""
+    return max(factor.values()) if isinstance(factor, dict) else factor
+
+
+def crop_coverage(search_area_factor, output_sz, center_jitter_factor, scale_jitter_factor, max_jitter_std=2.0):
+    """ The image region and resolution needed for the search regions of a processing (see
+    DiMPProcessing._get_jittered_box and prutils.sample_target_adaptive), relative to the box size sqrt(w*h).
+    The scale jitter is covered up to max_jitter_std standard deviations, the center jitter completely.
+
+    returns:
+        float - Half side of the region around the target center which contains all jittered search regions.
+        float - Number of pixels per box size needed such that no search region is upsampled to output_sz.
+    """
+    if isinstance(output_sz, (list, tuple)):
+        output_area_sz = math.sqrt(output_sz[0] * output_sz[1])
+        max_output_sz = max(output_sz)
+    else:
+        output_area_sz = max_output_sz = output_sz
+
+    scale_jitter = math.exp(max_jitter_std * _max_jitter(scale_jitter_factor))
+
+    # The search region side is search_area_factor (times the aspect of output_sz) times the jittered box size, its
+    # center is moved by up to half the center_jitter_factor times the jittered box size
+    aspect = max_output_sz / output_area_sz
+    half_side = 0.5 * scale_jitter * (search_area_factor * aspect + _max_jitter(center_jitter_factor))
+    pixels_per_box = output_area_sz * scale_jitter / search_area_factor
+    return half_side, pixels_per_box
+
+
+def crop_shard_params(processing, max_jitter_std=2.0):
+    """ Arguments of write_crop_shards for the search regions of a processing, e.g. DiMPProcessing."""
+    return {'search_area_factor': processing.search_area_factor, 'output_sz': processing.output_sz,
+            'center_jitter_factor': _max_jitter(processing.center_jitter_factor),
+            'scale_jitter_factor': _max_jitter(processing.scale_jitter_factor), 'max_jitter_std': max_jitter_std}
+
+
+def crop_shards_name(dataset, search_area_factor, output_sz, center_jitter_factor, scale_jitter_factor,
+                     max_jitter_std=2.0):
+    """ Directory name of the crop shards of a dataset, specific to the dataset (see AnnotationIndex.cache_name) and
+    the crop parameters."""
+    if isinstance(output_sz, (list, tuple)):
+        output_sz = 'x'.join(str(int(sz)) for sz in output_sz)
+    return '{}_sa{:g}_sz{}_cj{:g}_sj{:g}_n{:g}'.format(AnnotationIndex.cache_name(dataset), search_area_factor,
+                                                        output_sz, _max_jitter(center_jitter_factor),
+                                                        _max_jitter(scale_jitter_factor), max_jitter_std)
+
+
+def _crop_region(im, box, half_side, pixels_per_box):
+    """ Crops the region of side 2 * half_side * sqrt(w*h) around the box center, clipped to the image, and downscales
+    it to pixels_per_box pixels per box size (see crop_coverage)."""
+    x, y, w, h = box.tolist()
+    box_sz = math.sqrt(max(w, 0) * max(h, 0))
+    if box_sz <= 0:
+        return None, None
+    side = 2 * half_side * box_sz
+    cx, cy = x + 0.5 * w, y + 0.5 * h
+
+    x0 = max(0, int(math.floor(cx - 0.5 * side)))
+    y0 = max(0, int(math.floor(cy - 0.5 * side)))
+    x1 = min(im.shape[1], int(math.ceil(cx + 0.5 * side)))
+    y1 = min(im.shape[0], int(math.ceil(cy + 0.5 * side)))
+    if x1 <= x0 or y1 <= y0:
+        return None, None
+
+    crop = im[y0:y1, x0:x1, :]
+    scale = min(1.0, pixels_per_box / box_sz)
+    if scale < 1.0:
+        out_w, out_h = max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale))
+        crop = cv.resize(crop, (out_w, out_h), interpolation=cv.INTER_AREA)
+
+    crop_box = (x0, y0, crop.shape[1] / (x1 - x0), crop.shape[0] / (y1 - y0))
+    return np.ascontiguousarray(crop, dtype=np.uint8), crop_box
+
+
+def write_crop_shards(dataset, out_dir, search_area_factor, output_sz, center_jitter_factor, scale_jitter_factor,
+                      max_jitter_std=2.0, shard_size=2**30, chunk_size=32):
+    """ Extracts crops around all valid annotated frames of a video dataset and writes them as CropShards to
+    out_dir/crop_shards_name(...). The crops contain all search regions of the processing with the given parameters,
+    including the center jitter and the scale jitter up to max_jitter_std standard deviations (see crop_coverage).
+    The parameters of a processing are given by crop_shard_params(processing). Serve the shards with
+    CropShardDataset.
+
+    args:
+        dataset - The video dataset, e.g. Lasot(split='train').
+        out_dir - Directory in which the shards are saved.
+        search_area_factor - The search_area_factor of the processing.
+        output_sz - The output_sz of the processing.
+        center_jitter_factor - The center_jitter_factor of the processing (the largest one if a dict).
+        scale_jitter_factor - The scale_jitter_factor of the processing (the largest one if a dict).
+        max_jitter_std - Number of standard deviations of the scale jitter which are covered. Search regions beyond it
+                         (less than 1% for 2 std) contain replicated crop borders instead of image content.
+        shard_size - Maximum size of a shard file in bytes.
+        chunk_size - Number of frames loaded at once.
+
+    returns:
+        str - Path of the shards.
+    """
+    center_jitter_factor, scale_jitter_factor = _max_jitter(center_jitter_factor), _max_jitter(scale_jitter_factor)
+    path = os.path.join(out_dir, crop_shards_name(dataset, search_area_factor, output_sz, center_jitter_factor,
+                                                  scale_jitter_factor, max_jitter_std))
+    if os.path.isdir(path):
+        print('Crop shards {} already exist.'.format(path))
+        return path
+
+    half_side, pixels_per_box = crop_coverage(search_area_factor, output_sz, center_jitter_factor, scale_jitter_factor,
+                                              max_jitter_std)
+
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    os.makedirs(tmp_path, exist_ok=True)
+
+    seq_offsets, frame_ids, locations, crop_boxes = [0], [], [], []
+    shard_id, shard_bytes = 0, 0
+    shard_file = open(os.path.join(tmp_path, 'shard_{:05d}.bin'.format(shard_id)), 'wb')
+
+    num_sequences = dataset.get_num_sequences()
+    for seq_id in range(num_sequences):
+        seq_info = dataset.get_sequence_info(seq_id)
+        valid_ids = torch.nonzero(seq_info['valid']).view(-1).tolist()
+
+        for i in range(0, len(valid_ids), chunk_size):
+            chunk_ids = valid_ids[i:i + chunk_size]
+            frames, anno, _ = dataset.get_frames(seq_id, chunk_ids, seq_info)
+
+            for f_id, im, box in zip(chunk_ids, frames, anno['bbox']):
+                crop, crop_box = _crop_region(im, box, half_side, pixels_per_box)
+                if crop is None:
+                    continue
+
+                if shard_bytes > 0 and shard_bytes + crop.nbytes > shard_size:
+                    shard_file.close()
+                    shard_id, shard_bytes = shard_id + 1, 0
+                    shard_file = open(os.path.join(tmp_path, 'shard_{:05d}.bin'.format(shard_id)), 'wb')
+
+                shard_file.write(crop.tobytes())
+                frame_ids.append(f_id)
+                locations.append((shard_id, shard_bytes, crop.shape[0], crop.shape[1]))
+                crop_boxes.append(crop_box)
+                shard_bytes += crop.nbytes
+
+        seq_offsets.append(len(frame_ids))
+        print('\rWriting crop shards of {}: sequence {}/{}'.format(dataset.get_name(), seq_id + 1, num_sequences),
+              end='')
+    print('')
+    shard_file.close()
+
+    np.save(os.path.join(tmp_path, 'seq_offsets.npy'), np.array(seq_offsets, dtype=np.int64))
+    np.save(os.path.join(tmp_path, 'frame_ids.npy'), np.array(frame_ids, dtype=np.int64))
+    np.save(os.path.join(tmp_path, 'locations.npy'), np.array(locations, dtype=np.int64).reshape(-1, 4))
+    np.save(os.path.join(tmp_path, 'crop_boxes.npy'), np.array(crop_boxes, dtype=np.float64).reshape(-1, 4))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'version': CropShards.version, 'dataset': dataset.get_name(),
+                   'index_name': AnnotationIndex.cache_name(dataset), 'search_area_factor': search_area_factor,
+                   'output_sz': output_sz, 'center_jitter_factor': center_jitter_factor,
+                   'scale_jitter_factor': scale_jitter_factor, 'max_jitter_std': max_jitter_std,
+                   'half_side': half_side, 'pixels_per_box': pixels_per_box}, f, indent=2)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Written by another process in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+class CropShardDataset(BaseVideoDataset):
+    """ Serves the frames of a video dataset from crop shards created with write_crop_shards, instead of decoding the
+    full frames. get_frames returns the crops, with the annotated boxes mapped to the crop coordinates. Frames without
+    a crop (e.g. invalid annotations) are loaded from the dataset. Everything else (sequence list, annotations,
+    classes) is taken from the dataset, i.e. the sampling is unchanged.
+
+    Only suited for processing which crops the search region of each frame around its own box (e.g. DiMPProcessing)
+    with crop_type 'replicate'. The shards must cover the search regions of the processing (see write_crop_shards),
+    which is checked when the dataset is created.
+    """
+
+    def __init__(self, dataset, shards_path, processing):
+        """
+        args:
+            dataset - The video dataset the shards were created from.
+            shards_path - Path returned by write_crop_shards.
+            processing - The processing the frames are used with, e.g. DiMPProcessing.
+        """
+        super().__init__(dataset.get_name(), dataset.root, dataset.image_loader)
+        self.dataset = dataset
+        self.shards = CropShards(shards_path)
+
+        if self.shards.meta['index_name'] != AnnotationIndex.cache_name(dataset):
+            raise ValueError('The crop shards {} were created from a different version or subset of {}.'.format(
+                shards_path, dataset.get_name()))
+        self.check_processing(processing)
+
+        self.sequence_list = dataset.sequence_list
+        self.class_list = dataset.class_list
+
+    def check_processing(self, processing):
+        """ Raises a ValueError if the search regions of the processing are not covered by the shards."""
+        crop_type = getattr(processing, 'crop_type', 'replicate')
+        if crop_type in ['inside', 'inside_major']:
+            raise ValueError("Crop shards do not support the crop_type '{}', which depends on the full frame "
+                             "size.".format(crop_type))
+
+        meta = self.shards.meta
+        half_side, pixels_per_box = crop_coverage(processing.search_area_factor, processing.output_sz,
+                                                  processing.center_jitter_factor, processing.scale_jitter_factor,
+                                                  meta['max_jitter_std'])
+        if half_side > meta['half_side'] * (1 + 1e-6):
+            raise ValueError('The crop shards {} do not contain the search regions of the processing, create them with '
+                             'crop_shard_params(processing).'.format(self.shards.path))
+        if pixels_per_box > meta['pixels_per_box'] * (1 + 1e-6):
+            raise ValueError('The crop shards {} have a lower resolution than the search regions of the processing, '
+                             'create them with crop_shard_params(processing).'.format(self.shards.path))
+
+    def get_name(self):
+        return self.dataset.get_name()
+
+    def is_video_sequence(self):
+        return self.dataset.is_video_sequence()
+
+    def has_class_info(self):
+        return self.dataset.has_class_info()
+
+    def has_occlusion_info(self):
+        return self.dataset.has_occlusion_info()
+
+    def get_num_sequences(self):
+        return self.dataset.get_num_sequences()
+
+    def get_num_classes(self):
+        return self.dataset.get_num_classes()
+
+    def get_sequences_in_class(self, class_name):
+        return self.dataset.get_sequences_in_class(class_name)
+
+    def get_class_name(self, seq_id):
+        return self.dataset.get_class_name(seq_id)
+
+    def get_sequence_info(self, seq_id):
+        return self.dataset.get_sequence_info(seq_id)
+
+    def get_frames(self, seq_id, frame_ids, anno=None):
+        if anno is None:
+            anno = self.get_sequence_info(seq_id)
+
+        anno_frames = {}
+        for key, value in anno.items():
+            anno_frames[key] = [value[f_id, ...].clone() for f_id in frame_ids]
+
+        frame_list = []
+        for i, f_id in enumerate(frame_ids):
+            entry = self.shards.find(seq_id, f_id)
+            if entry is None:
+                frames, _, _ = self.dataset.get_frames(seq_id, [f_id], anno)
+                frame_list.append(frames[0])
+                continue
+
+            crop, (x0, y0, sx, sy) = self.shards.get_crop(entry)
+            frame_list.append(crop)
+            if 'bbox' in anno_frames:
+                bb = anno_frames['bbox'][i]
+                anno_frames['bbox'][i] = (bb - bb.new_tensor([x0, y0, 0, 0])) * bb.new_tensor([sx, sy, sx, sy])
+
+        obj_class = self.get_class_name(seq_id) if self.has_class_info() else None
+        object_meta = OrderedDict({'object_class_name': obj_class,
+                                   'motion_class': None,
+                                   'major_class': None,
+                                   'root_class': None,
+                                   'motion_adverb': None})
+
+        return frame_list, anno_frames, object_meta
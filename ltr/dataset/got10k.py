@@ -23,7 +23,8 @@ class Got10k(BaseVideoDataset):
     Download dataset from http://got-10k.aitestunion.com/downloads
     """
 
-    def __init__(self, root=None, image_loader=jpeg4py_loader, split=None, seq_ids=None, data_fraction=None):
+    def __init__(self, root=None, image_loader=jpeg4py_loader, split=None, seq_ids=None, data_fraction=None,
+                 use_annotation_index=True):
         """
         args:
             root - path to the got-10k training data. Note: This should point to the 'train' folder inside GOT-10k
@@ -35,6 +36,8 @@ class Got10k(BaseVideoDataset):
             seq_ids - List containing the ids of the videos to be used for training. Note: Only one of 'split' or 'seq_ids'
                         options can be used at the same time.
             data_fraction - Fraction of dataset to be used. The complete dataset is used by default
+            use_annotation_index - Read the annotations of all sequences once, into a cached annotation index (see
+                                   BaseVideoDataset.build_annotation_index).
         """
         root = env_settings().got10k_dir if root is None else root
         super().__init__('GOT10k', root, image_loader)
@@ -72,6 +75,10 @@ class Got10k(BaseVideoDataset):
         self.class_list = list(self.seq_per_class.keys())
         self.class_list.sort()
 
+        if use_annotation_index:
+            # A random subset of the sequences is not worth caching
+            self.build_annotation_index(cache=data_fraction is None)
+
     def get_name(self):
         return 'got10k'
 
@@ -81,6 +88,9 @@ class Got10k(BaseVideoDataset):
     def has_occlusion_info(self):
         return True
 
+    def supports_downscaled_frames(self):
+        return True
+
     def _load_meta_info(self):
         sequence_meta_info = {s: self._read_meta(os.path.join(self.root, s)) for s in self.sequence_list}
         return sequence_meta_info
@@ -146,7 +156,7 @@ class Got10k(BaseVideoDataset):
     def _get_sequence_path(self, seq_id):
         return os.path.join(self.root, self.sequence_list[seq_id])
 
-    def get_sequence_info(self, seq_id):
+    def _read_sequence_info(self, seq_id):
         seq_path = self._get_sequence_path(seq_id)
         bbox = self._read_bb_anno(seq_path)
 
@@ -167,11 +177,12 @@ class Got10k(BaseVideoDataset):
 
         return obj_meta['object_class_name']
 
-    def get_frames(self, seq_id, frame_ids, anno=None):
+    def get_frames(self, seq_id, frame_ids, anno=None, max_downscale=None):
         seq_path = self._get_sequence_path(seq_id)
         obj_meta = self.sequence_meta_info[self.sequence_list[seq_id]]
 
-        frame_list = [self._get_frame(seq_path, f_id) for f_id in frame_ids]
+        frame_list, scale_factors = self._load_images([self._get_frame_path(seq_path, f_id) for f_id in frame_ids],
+                                                      max_downscale)
 
         if anno is None:
             anno = self.get_sequence_info(seq_id)
@@ -179,5 +190,6 @@ class Got10k(BaseVideoDataset):
         anno_frames = {}
         for key, value in anno.items():
             anno_frames[key] = [value[f_id, ...].clone() for f_id in frame_ids]
+        anno_frames = self._downscale_anno_frames(anno_frames, scale_factors)
 
         return frame_list, anno_frames, obj_meta
@@ -12,7 +12,8 @@ class Got10kVOS(Got10k):
     """
 
     def __init__(self, anno_path=None, split='train'):
-        super().__init__(split=split)
+        # The sequence list is filtered below, after an annotation index would have been built
+        super().__init__(split=split, use_annotation_index=False)
         self.anno_path = anno_path
 
         # TODO this prevents a crash, because that particular sequence does not have masks.
@@ -40,6 +41,10 @@ class Got10kVOS(Got10k):
     def _get_anno_frame_path(self, seq_path, frame_id):
         return os.path.join(seq_path, '{:08}.png'.format(frame_id + 1))  # frames start from 1
 
+    def supports_downscaled_frames(self):
+        # get_frames is overridden and loads the masks at full resolution
+        return False
+
     def get_frames(self, seq_id, frame_ids, anno=None):
         seq_path = self._get_sequence_path(seq_id)
         obj_meta = self.sequence_meta_info[self.sequence_list[seq_id]]
@@ -23,7 +23,8 @@ class Lasot(BaseVideoDataset):
     Download the dataset from https://cis.temple.edu/lasot/download.html
     """
 
-    def __init__(self, root=None, image_loader=jpeg4py_loader, vid_ids=None, split=None, data_fraction=None):
+    def __init__(self, root=None, image_loader=jpeg4py_loader, vid_ids=None, split=None, data_fraction=None,
+                 use_annotation_index=True):
         """
         args:
             root - path to the lasot dataset.
@@ -34,6 +35,8 @@ class Lasot(BaseVideoDataset):
             split - If split='train', the official train split (protocol-II) is used for training. Note: Only one of
                     vid_ids or split option can be used at a time.
             data_fraction - Fraction of dataset to be used. The complete dataset is used by default
+            use_annotation_index - Read the annotations of all sequences once, into a cached annotation index (see
+                                   BaseVideoDataset.build_annotation_index).
         """
         root = env_settings().lasot_dir if root is None else root
         super().__init__('LaSOT', root, image_loader)
@@ -49,6 +52,10 @@ class Lasot(BaseVideoDataset):
 
         self.seq_per_class = self._build_class_list()
 
+        if use_annotation_index:
+            # A random subset of the sequences is not worth caching
+            self.build_annotation_index(cache=data_fraction is None)
+
     def _build_sequence_list(self, vid_ids=None, split=None):
         if split is not None:
             if vid_ids is not None:
@@ -86,6 +93,9 @@ class Lasot(BaseVideoDataset):
     def has_occlusion_info(self):
         return True
 
+    def supports_downscaled_frames(self):
+        return True
+
     def get_num_sequences(self):
         return len(self.sequence_list)
 
@@ -121,7 +131,7 @@ class Lasot(BaseVideoDataset):
 
         return os.path.join(self.root, class_name, class_name + '-' + vid_id)
 
-    def get_sequence_info(self, seq_id):
+    def _read_sequence_info(self, seq_id):
         seq_path = self._get_sequence_path(seq_id)
         bbox = self._read_bb_anno(seq_path)
 
@@ -146,11 +156,12 @@ class Lasot(BaseVideoDataset):
 
         return obj_class
 
-    def get_frames(self, seq_id, frame_ids, anno=None):
+    def get_frames(self, seq_id, frame_ids, anno=None, max_downscale=None):
         seq_path = self._get_sequence_path(seq_id)
 
         obj_class = self._get_class(seq_path)
-        frame_list = [self._get_frame(seq_path, f_id) for f_id in frame_ids]
+        frame_list, scale_factors = self._load_images([self._get_frame_path(seq_path, f_id) for f_id in frame_ids],
+                                                      max_downscale)
 
         if anno is None:
             anno = self.get_sequence_info(seq_id)
@@ -158,6 +169,7 @@ class Lasot(BaseVideoDataset):
         anno_frames = {}
         for key, value in anno.items():
             anno_frames[key] = [value[f_id, ...].clone() for f_id in frame_ids]
+        anno_frames = self._downscale_anno_frames(anno_frames, scale_factors)
 
         object_meta = OrderedDict({'object_class_name': obj_class,
                                    'motion_class': None,
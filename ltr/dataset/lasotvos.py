@@ -14,7 +14,8 @@ class LasotVOS(Lasot):
     """
 
     def __init__(self, anno_path=None, split='train'):
-        super().__init__(split=split)
+        # The annotations are subsampled by skip_interval, which is set below
+        super().__init__(split=split, use_annotation_index=False)
         self.anno_path = anno_path
         self.skip_interval = 5
 
@@ -64,6 +65,10 @@ class LasotVOS(Lasot):
         frame_number = 1 + frame_id * self.skip_interval
         return os.path.join(seq_path, 'img', '{:08}.jpg'.format(frame_number))  # frames start from 1
 
+    def supports_downscaled_frames(self):
+        # get_frames is overridden and loads the masks at full resolution
+        return False
+
     #########################
     def get_frames(self, seq_id, frame_ids, anno=None):
         seq_path = self._get_sequence_path(seq_id)
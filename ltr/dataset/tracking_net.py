@@ -43,7 +43,8 @@ class TrackingNet(BaseVideoDataset):
 
     Download the dataset using the toolkit https://github.com/SilvioGiancola/TrackingNet-devkit.
     """
-    def __init__(self, root=None, image_loader=jpeg4py_loader, set_ids=None, data_fraction=None):
+    def __init__(self, root=None, image_loader=jpeg4py_loader, set_ids=None, data_fraction=None,
+                 use_annotation_index=True):
         """
         args:
             root        - The path to the TrackingNet folder, containing the training sets.
@@ -52,6 +53,8 @@ class TrackingNet(BaseVideoDataset):
             set_ids (None) - List containing the ids of the TrackingNet sets to be used for training. If None, all the
                             sets (0 - 11) will be used.
             data_fraction - Fraction of dataset to be used. The complete dataset is used by default
+            use_annotation_index - Read the annotations of all sequences once, into a cached annotation index (see
+                                   BaseVideoDataset.build_annotation_index).
         """
         root = env_settings().trackingnet_dir if root is None else root
         super().__init__('TrackingNet', root, image_loader)
@@ -74,6 +77,10 @@ class TrackingNet(BaseVideoDataset):
         self.class_list = list(self.seq_per_class.keys())
         self.class_list.sort()
 
+        if use_annotation_index:
+            # A random subset of the sequences is not worth caching
+            self.build_annotation_index(cache=data_fraction is None)
+
     def _load_class_info(self):
         ltr_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
         class_map_path = os.path.join(ltr_path, 'data_specs', 'trackingnet_classmap.txt')
@@ -97,6 +104,9 @@ class TrackingNet(BaseVideoDataset):
     def has_class_info(self):
         return True
 
+    def supports_downscaled_frames(self):
+        return True
+
     def get_sequences_in_class(self, class_name):
         return self.seq_per_class[class_name]
 
@@ -108,18 +118,20 @@ class TrackingNet(BaseVideoDataset):
                              low_memory=False).values
         return torch.tensor(gt)
 
-    def get_sequence_info(self, seq_id):
+    def _read_sequence_info(self, seq_id):
         bbox = self._read_bb_anno(seq_id)
 
         valid = (bbox[:, 2] > 0) & (bbox[:, 3] > 0)
         visible = valid.clone().byte()
         return {'bbox': bbox, 'valid': valid, 'visible': visible}
 
-    def _get_frame(self, seq_id, frame_id):
+    def _get_frame_path(self, seq_id, frame_id):
         set_id = self.sequence_list[seq_id][0]
         vid_name = self.sequence_list[seq_id][1]
-        frame_path = os.path.join(self.root, "TRAIN_" + str(set_id), "frames", vid_name, str(frame_id) + ".jpg")
-        return self.image_loader(frame_path)
+        return os.path.join(self.root, "TRAIN_" + str(set_id), "frames", vid_name, str(frame_id) + ".jpg")
+
+    def _get_frame(self, seq_id, frame_id):
+        return self.image_loader(self._get_frame_path(seq_id, frame_id))
 
     def _get_class(self, seq_id):
         seq_name = self.sequence_list[seq_id][1]
@@ -130,8 +142,9 @@ class TrackingNet(BaseVideoDataset):
 
         return obj_class
 
-    def get_frames(self, seq_id, frame_ids, anno=None):
-        frame_list = [self._get_frame(seq_id, f) for f in frame_ids]
+    def get_frames(self, seq_id, frame_ids, anno=None, max_downscale=None):
+        frame_list, scale_factors = self._load_images([self._get_frame_path(seq_id, f) for f in frame_ids],
+                                                      max_downscale)
 
         if anno is None:
             anno = self.get_sequence_info(seq_id)
@@ -139,6 +152,7 @@ class TrackingNet(BaseVideoDataset):
         anno_frames = {}
         for key, value in anno.items():
             anno_frames[key] = [value[f_id, ...].clone() for f_id in frame_ids]
+        anno_frames = self._downscale_anno_frames(anno_frames, scale_factors)
 
         obj_class = self._get_class(seq_id)
 
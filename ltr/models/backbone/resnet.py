@@ -1,5 +1,6 @@
 import math
 import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 from collections import OrderedDict
 import torch.utils.model_zoo as model_zoo
 # from torchvision.models.resnet import model_urls
@@ -229,6 +230,30 @@ class ResNet(Backbone):
         raise ValueError('output_layer is wrong.')
 
 
+def fuse_conv_bn(net):
+    """Fold the batch norm layers of a ResNet into the preceding convolutions, for inference. The network must be in
+    eval mode. The batch norm layers are replaced by identities, such that the network structure and state dict keys
+    of the convolutions are kept. Returns the network."""
+    def _fuse(module, conv_name, bn_name):
+        bn = getattr(module, bn_name, None)
+        if isinstance(bn, nn.BatchNorm2d):
+            setattr(module, conv_name, fuse_conv_bn_eval(getattr(module, conv_name), bn))
+            setattr(module, bn_name, nn.Identity())
+
+    _fuse(net, 'conv1', 'bn1')
+    for m in list(net.modules()):
+        if isinstance(m, BasicBlock):
+            _fuse(m, 'conv1', 'bn1')
+            _fuse(m, 'conv2', 'bn2')
+        elif isinstance(m, Bottleneck):
+            _fuse(m, 'conv1', 'bn1')
+            _fuse(m, 'conv2', 'bn2')
+            _fuse(m, 'conv3', 'bn3')
+        if isinstance(getattr(m, 'downsample', None), nn.Sequential) and len(m.downsample) == 2:
+            _fuse(m.downsample, '0', '1')
+    return net
+
+
 def resnet_baby(output_layers=None, pretrained=False, inplanes=16, **kwargs):
     """Constructs a ResNet-18 model.
     """
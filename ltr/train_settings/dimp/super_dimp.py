@@ -1,6 +1,7 @@
 import torch.optim as optim
 from ltr.dataset import Lasot, Got10k, TrackingNet, MSCOCOSeq
 from ltr.data import processing, sampler, LTRLoader
+from ltr.data import gpu_processing
 from ltr.models.tracking import dimpnet
 import ltr.models.loss as ltr_losses
 import ltr.models.loss.kl_regression as klreg_losses
@@ -28,6 +29,8 @@ def run(settings):
     settings.center_jitter_factor = {'train': 3, 'test': 5.5}
     settings.scale_jitter_factor = {'train': 0.25, 'test': 0.5}
     settings.hinge_threshold = 0.05
+    settings.gpu_processing = False     # Crop and augment the training batches on the GPU, see GPUKLDiMPProcessing
+    settings.gpu_processing_canvas_sz = (1080, 1920)    # Larger frames are downscaled, see RawFramesProcessing
     # settings.print_stats = ['Loss/total', 'Loss/iou', 'ClfTrain/init_loss', 'ClfTrain/test_loss']
 
     # Train datasets
@@ -83,13 +86,33 @@ def run(settings):
                                                       transform=transform_val,
                                                       joint_transform=transform_joint)
 
+    gpu_processing_train = None
+    if settings.gpu_processing:
+        gpu_processing_train = gpu_processing.GPUKLDiMPProcessing(search_area_factor=settings.search_area_factor,
+                                                                  output_sz=settings.output_sz,
+                                                                  center_jitter_factor=settings.center_jitter_factor,
+                                                                  scale_jitter_factor=settings.scale_jitter_factor,
+                                                                  crop_type='inside_major',
+                                                                  max_scale_change=1.5,
+                                                                  mode='sequence',
+                                                                  proposal_params=proposal_params,
+                                                                  label_function_params=label_params,
+                                                                  label_density_params=label_density_params,
+                                                                  brightness_jitter=0.2,
+                                                                  grayscale_probability=0.05,
+                                                                  joint_flip_probability=0.5,
+                                                                  flip_probability=0.5,
+                                                                  normalize_mean=settings.normalize_mean,
+                                                                  normalize_std=settings.normalize_std)
+        data_processing_train = gpu_processing_train.raw_frames_processing(settings.gpu_processing_canvas_sz)
+
     # Train sampler and loader
     dataset_train = sampler.DiMPSampler([lasot_train, got10k_train, trackingnet_train, coco_train], [1,1,1,1],
                                         samples_per_epoch=40000, max_gap=200, num_test_frames=3, num_train_frames=3,
                                         processing=data_processing_train)
 
     loader_train = LTRLoader('train', dataset_train, training=True, batch_size=settings.batch_size, num_workers=settings.num_workers,
-                             shuffle=True, drop_last=True, stack_dim=1)
+                             shuffle=True, drop_last=True, stack_dim=1, gpu_processing=gpu_processing_train)
 
     # Validation samplers and loaders
     dataset_val = sampler.DiMPSampler([got10k_val], [1], samples_per_epoch=10000, max_gap=200,
@@ -68,6 +68,10 @@ class LTRTrainer(BaseTrainer):
             if self.move_data_to_gpu:
                 data = data.to(self.device)
 
+            # Batched processing on the training device, see LTRLoader
+            if getattr(loader, 'gpu_processing', None) is not None:
+                data = loader.gpu_processing(data, stack_dim=loader.stack_dim)
+
             data['epoch'] = self.epoch
             data['settings'] = self.settings
 
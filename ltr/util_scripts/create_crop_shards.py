@@ -0,0 +1,55 @@
+import os
+import sys
+import argparse
+
+env_path = os.path.join(os.path.dirname(__file__), '../..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from ltr.admin.environment import env_settings
+from ltr.dataset import Lasot, Got10k, TrackingNet
+from ltr.dataset.crop_shards import write_crop_shards
+
+
+def get_dataset(name, env):
+    """ The training datasets as used in the train settings."""
+    if name == 'lasot':
+        return Lasot(env.lasot_dir, split='train')
+    if name == 'got10k':
+        return Got10k(env.got10k_dir, split='vottrain')
+    if name == 'got10k_val':
+        return Got10k(env.got10k_dir, split='votval')
+    if name == 'trackingnet':
+        return TrackingNet(env.trackingnet_dir, set_ids=list(range(4)))
+    raise ValueError('Unknown dataset {}'.format(name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-extract the training crops of a dataset into crop shards. Use '
+                                                 'them in the train settings by wrapping the dataset in '
+                                                 'CropShardDataset(dataset, path, processing).')
+    parser.add_argument('dataset', type=str, help='Name of the dataset (lasot, got10k, got10k_val or trackingnet).')
+    parser.add_argument('search_area_factor', type=float, help='The search_area_factor of the train settings.')
+    parser.add_argument('output_sz', type=int, help='The output_sz of the train settings.')
+    parser.add_argument('center_jitter_factor', type=float, help='The largest center_jitter_factor of the train '
+                                                                 'settings (usually the test one).')
+    parser.add_argument('scale_jitter_factor', type=float, help='The largest scale_jitter_factor of the train '
+                                                                'settings (usually the test one).')
+    parser.add_argument('--max_jitter_std', type=float, default=2.0, help='Standard deviations of the scale jitter '
+                                                                          'covered by the crops.')
+    parser.add_argument('--shard_size', type=int, default=1024, help='Maximum size of a shard file in MB.')
+    parser.add_argument('--out_dir', type=str, default=None, help='Output directory (default is env crop_shards_dir).')
+
+    args = parser.parse_args()
+
+    env = env_settings()
+    out_dir = args.out_dir if args.out_dir is not None else env.crop_shards_dir
+
+    path = write_crop_shards(get_dataset(args.dataset, env), out_dir, args.search_area_factor, args.output_sz,
+                             args.center_jitter_factor, args.scale_jitter_factor, max_jitter_std=args.max_jitter_std,
+                             shard_size=args.shard_size * 2**20)
+    print('Crop shards saved in {}'.format(path))
+
+
+if __name__ == '__main__':
+    main()
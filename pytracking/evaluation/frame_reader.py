@@ -0,0 +1,67 @@
+import queue
+import threading
+import time
+
+
+class PrefetchFrameReader:
+    """Reads and decodes the frames of a sequence in a background thread, keeping up to num_prefetch decoded frames
+    ahead of the tracker. Iterating yields (image, decode_time) for each frame in order, where decode_time is the time
+    spent reading and decoding the frame in the background thread.
+    args:
+        frame_paths: List of image paths.
+        read_image: Function path -> image (RGB numpy array).
+        num_prefetch: Maximum number of decoded frames held in the queue.
+    """
+
+    def __init__(self, frame_paths, read_image, num_prefetch=8):
+        self.frame_paths = frame_paths
+        self.read_image = read_image
+        self.queue = queue.Queue(maxsize=max(num_prefetch, 1))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # Wake up regularly to check whether the reader was closed while the queue is full
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        for path in self.frame_paths:
+            start_time = time.time()
+            try:
+                item = (self.read_image(path), time.time() - start_time, None)
+            except Exception as e:
+                item = (None, time.time() - start_time, e)
+            if not self._put(item):
+                return
+
+    def __len__(self):
+        return len(self.frame_paths)
+
+    def __iter__(self):
+        try:
+            for _ in range(len(self.frame_paths)):
+                image, decode_time, error = self.queue.get()
+                if error is not None:
+                    raise error
+                yield image, decode_time
+        finally:
+            self.close()
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def read_frames(frame_paths, read_image):
+    """Reads the frames in the calling thread. Yields (image, decode_time) like PrefetchFrameReader."""
+    for path in frame_paths:
+        start_time = time.time()
+        image = read_image(path)
+        yield image, time.time() - start_time
@@ -0,0 +1,41 @@
+import copy
+import threading
+
+
+class ModelRegistry:
+    """Process-wide cache of initialized tracker parameters, used to share networks between tracker instances.
+    The parameters (and thereby the networks) for each (tracker name, parameter name) pair are loaded once. Every
+    tracker created through the registry gets a shallow copy of the cached parameters, so that the network weights
+    are shared read-only while parameter values assigned by a tracker stay local to that tracker."""
+
+    def __init__(self):
+        self._params = {}
+        self._lock = threading.Lock()
+
+    def get_parameters(self, tracker):
+        """Get parameters with initialized networks for the given pytracking.evaluation.Tracker."""
+        key = (tracker.name, tracker.parameter_name)
+        with self._lock:
+            if key not in self._params:
+                params = tracker.get_parameters()
+                tracker_instance = tracker.create_tracker(params)
+                if hasattr(tracker_instance, 'initialize_features'):
+                    tracker_instance.initialize_features()
+                self._params[key] = params
+        return copy.copy(self._params[key])
+
+    def create_tracker(self, tracker):
+        """Create a tracker instance which shares the networks of all other instances created by the registry for the
+        same tracker and parameter name."""
+        return tracker.create_tracker(self.get_parameters(tracker), features_initialized=True)
+
+    def release(self, tracker=None):
+        """Drop the cached parameters for the given tracker, or for all trackers if None."""
+        with self._lock:
+            if tracker is None:
+                self._params.clear()
+            else:
+                self._params.pop((tracker.name, tracker.parameter_name), None)
+
+
+model_registry = ModelRegistry()
@@ -2,14 +2,32 @@ import numpy as np
 from collections import OrderedDict
 import time
 import copy
+import warnings
+from pytracking.features.preprocessing import numpy_to_torch
+from pytracking.tracker.base import FrameSkippingTracker
 
 
 class MultiObjectWrapper:
-    def __init__(self, base_tracker_class, params, visdom=None, fast_load=False, frame_reader=None):
+    def __init__(self, base_tracker_class, params, visdom=None, fast_load=False, frame_reader=None,
+                 tracker_factory=None, batched=False, profiler=None):
+        """args:
+            tracker_factory: Optional callable returning a new base tracker instance. Overrides the construction of
+                             trackers from base_tracker_class and params, e.g. to share already loaded networks.
+            batched: Track all objects together if the base tracker class provides a track_multiple function
+                     (see DiMP.track_multiple), instead of running the trackers one by one.
+            profiler: Optional StageProfiler, which is used to time the stages of all created trackers.
+        """
         self.base_tracker_class = base_tracker_class
         self.params = params
         self.visdom = visdom
         self.frame_reader = frame_reader
+        self.tracker_factory = tracker_factory
+        self.profiler = profiler
+        self.batched = batched and hasattr(base_tracker_class, 'track_multiple')
+        if self.batched and params.get('frame_skipping', False):
+            warnings.warn('Frame skipping is not supported by batched multi-object tracking, the objects are tracked '
+                          'one by one.')
+            self.batched = False
 
         self.initialized_ids = []
         self.trackers = OrderedDict()
@@ -22,16 +40,27 @@ class MultiObjectWrapper:
 
     def create_tracker(self):
         tracker = None
-        if self.fast_load:
-            try:
-                tracker = copy.deepcopy(self.tracker_copy)
-            except:
-                pass
+        if self.tracker_factory is not None:
+            tracker = self.tracker_factory()
+        elif self.fast_load:
+            if hasattr(self.tracker_copy, 'clone_state'):
+                # Shares the network and parameters with tracker_copy
+                tracker = self.tracker_copy.clone_state()
+            else:
+                try:
+                    tracker = copy.deepcopy(self.tracker_copy)
+                except:
+                    pass
         if tracker is None:
             tracker = self.base_tracker_class(self.params)
         tracker.visdom = self.visdom
 
         tracker.frame_reader = self.frame_reader
+        if self.params.get('frame_skipping', False) and not isinstance(tracker, FrameSkippingTracker):
+            # The tracker_factory can already apply it (see pytracking.evaluation.Tracker.create_tracker)
+            tracker = FrameSkippingTracker(tracker)
+        if self.profiler is not None:
+            self.profiler.instrument(tracker)
         return tracker
 
     def _split_info(self, info):
@@ -86,7 +115,8 @@ class MultiObjectWrapper:
             if key == 'segmentation':
                 pass
             else:
-                out_merged[key] = {obj_id: out[key] for obj_id, out in out_all.items()}
+                # Skipped objects only output the box (see FrameSkippingTracker)
+                out_merged[key] = {obj_id: out.get(key) for obj_id, out in out_all.items()}
 
         return out_merged
 
@@ -145,15 +175,30 @@ class MultiObjectWrapper:
 
             info['init_other'] = list(init_info_split.values())[0]['init_other']
 
+        # Trackers which split out frame preparation (see DiMP.prepare_frame) accept the converted image through
+        # info, so that the conversion is done once for all objects
+        if self.initialized_ids and hasattr(self.base_tracker_class, 'prepare_frame'):
+            info['image_tensor'] = numpy_to_torch(image)
+
         out_all = OrderedDict()
-        for obj_id in self.initialized_ids:
+        if self.batched and self.initialized_ids:
             start_time = time.time()
+            out_list = self.base_tracker_class.track_multiple([self.trackers[obj_id] for obj_id in self.initialized_ids],
+                                                              image, info)
+
+            # The time is split evenly between the objects
+            default = {'time': (time.time() - start_time) / len(self.initialized_ids)}
+            for obj_id, out in zip(self.initialized_ids, out_list):
+                out_all[obj_id] = self._set_defaults(out, default)
+        else:
+            for obj_id in self.initialized_ids:
+                start_time = time.time()
 
-            out = self.trackers[obj_id].track(image, info)
+                out = self.trackers[obj_id].track(image, info)
 
-            default = {'time': time.time() - start_time}
-            out = self._set_defaults(out, default)
-            out_all[obj_id] = out
+                default = {'time': time.time() - start_time}
+                out = self._set_defaults(out, default)
+                out_all[obj_id] = out
 
         # Initialize new
         if info.get('init_object_ids', False):
@@ -180,6 +225,23 @@ class MultiObjectWrapper:
 
         return out_merged
 
+    def get_frame_counts(self):
+        """Number of full and skipped frames summed over all objects, when frame skipping is enabled (see
+        FrameSkippingTracker.get_frame_counts)."""
+        counts = {'full': 0, 'skipped': 0}
+        for tracker in self.trackers.values():
+            if isinstance(tracker, FrameSkippingTracker):
+                for key, val in tracker.get_frame_counts().items():
+                    counts[key] += val
+        return counts
+
+    def remove_objects(self, object_ids):
+        """Stop tracking the given objects."""
+        for obj_id in object_ids:
+            self.trackers.pop(obj_id, None)
+            if obj_id in self.initialized_ids:
+                self.initialized_ids.remove(obj_id)
+
     def visdom_draw_tracking(self, image, box, segmentation):
         if box is None:
             box = []
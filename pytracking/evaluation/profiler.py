@@ -0,0 +1,85 @@
+import time
+import torch
+from collections import OrderedDict
+from pytracking.tracker.base import FrameSkippingTracker
+
+
+# Tracker methods which are timed by the StageProfiler and the server metrics (interfaces/metrics.py) -> stage name.
+# ATOM, KYS and KeepTrack refine the box in refine_target_box, DiMP calls get_box_proposals and optimize_boxes directly
+# (see DiMP.track_from_backbone). Several methods can map to the same stage, nested calls of a stage are timed once.
+# DiMP.track_multiple runs its batched steps through extract_backbone, classify_target and run_filter_optimizer.
+PROFILED_STAGES = OrderedDict([
+    ('prepare_frame', 'numpy_to_torch'),
+    ('sample_patches', 'sample_patches'),
+    ('extract_backbone_features', 'backbone'),
+    ('extract_backbone', 'backbone'),
+    ('extract_features_and_scores', 'compiled_inference'),
+    ('classify_target', 'classification'),
+    ('refine_target_box', 'box_refinement'),
+    ('get_box_proposals', 'box_refinement'),
+    ('optimize_boxes', 'box_refinement'),
+    ('update_classifier', 'classifier_update'),
+    ('run_filter_optimizer', 'classifier_update'),
+])
+
+
+class StageProfiler:
+    """Measures the time spent in the stages of the tracking pipeline (see PROFILED_STAGES), per frame.
+    The stage methods are wrapped on the tracker instances (see instrument), the networks and other trackers are not
+    affected. Nested stages are timed exclusively, i.e. the time of a stage does not include the stages called from
+    it (e.g. 'backbone' does not include 'sample_patches'), such that the stage times of a frame add up to at most the
+    frame time. In multi-object mode, the times of all objects in a frame are summed.
+    Enabled by the tracker parameter profile_stages (see pytracking.evaluation.Tracker.run_sequence).
+    args:
+        sync_cuda: Synchronize CUDA at the start and end of each stage. Otherwise the GPU stages only contain the kernel
+                   launch time.
+    """
+
+    def __init__(self, sync_cuda=True):
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.frame_times = OrderedDict()
+        self._active = []   # [stage, child time] of the running stages
+
+    def _synchronize(self):
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+
+    def timed(self, stage, fn):
+        """Returns a wrapper of fn which adds its exclusive run time to the stage."""
+        def wrapper(*args, **kwargs):
+            if self._active and self._active[-1][0] == stage:
+                # Already timed by the enclosing call, e.g. optimize_boxes in refine_target_box
+                return fn(*args, **kwargs)
+            self._synchronize()
+            self._active.append([stage, 0.0])
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._synchronize()
+                elapsed = time.perf_counter() - start
+                child_time = self._active.pop()[1]
+                self.frame_times[stage] = self.frame_times.get(stage, 0.0) + elapsed - child_time
+                if self._active:
+                    self._active[-1][1] += elapsed
+        return wrapper
+
+    def instrument(self, tracker):
+        """Wrap the methods in PROFILED_STAGES on the tracker instance."""
+        if isinstance(tracker, FrameSkippingTracker):
+            tracker = tracker.base_tracker
+        if getattr(tracker, '_profiler_instrumented', False):
+            return tracker
+        for method, stage in PROFILED_STAGES.items():
+            if hasattr(tracker, method):
+                setattr(tracker, method, self.timed(stage, getattr(tracker, method)))
+        tracker._profiler_instrumented = True
+        if hasattr(tracker, 'add_instrumenter'):
+            tracker.add_instrumenter(self.instrument)
+        return tracker
+
+    def pop_frame(self):
+        """Returns the stage times (in seconds) accumulated since the last call and resets them."""
+        frame_times = self.frame_times
+        self.frame_times = OrderedDict()
+        return frame_times
@@ -6,6 +6,7 @@ import csv
 from itertools import product
 from collections import OrderedDict
 from pytracking.evaluation import Sequence, Tracker
+from pytracking.evaluation.profiler import PROFILED_STAGES
 from ltr.data.image_loader import imwrite_indexed
 
 
@@ -127,6 +128,19 @@ def _save_tracker_output(seq: Sequence, tracker: Tracker, output: dict):
                 timings_file = '{}_time.txt'.format(base_results_path)
                 save_time(timings_file, data)
 
+        elif key == 'decode_time':
+            decode_times_file = '{}_decode_time.txt'.format(base_results_path)
+            save_time(decode_times_file, data)
+
+        elif key == 'stage_time':
+            # One column per stage, the stage names are given in the header
+            stages = [s for s in OrderedDict.fromkeys(PROFILED_STAGES.values()) if any(s in d for d in data)]
+            stages += [s for s in OrderedDict.fromkeys(s for d in data for s in d) if s not in stages]
+            if stages:
+                stage_times = np.array([[d.get(s, 0.0) for s in stages] for d in data])
+                stage_times_file = '{}_stage_time.txt'.format(base_results_path)
+                np.savetxt(stage_times_file, stage_times, delimiter='\t', fmt='%f', header='\t'.join(stages))
+
         elif key == 'segmentation':
             assert len(frame_names) == len(data)
             if not os.path.exists(segmentation_path):
@@ -135,8 +149,11 @@ def _save_tracker_output(seq: Sequence, tracker: Tracker, output: dict):
                 imwrite_indexed(os.path.join(segmentation_path, '{}.png'.format(frame_name)), frame_seg)
 
 
-def run_sequence(seq: Sequence, tracker: Tracker, debug=False, visdom_info=None):
-    """Runs a tracker on a sequence."""
+def run_sequence(seq: Sequence, tracker: Tracker, debug=False, visdom_info=None, reuse_network=False):
+    """Runs a tracker on a sequence.
+    args:
+        reuse_network: Reuse the networks loaded by earlier sequences in this process (see Tracker.run_sequence).
+    """
 
     def _results_exist():
         if seq.dataset == 'oxuva':
@@ -160,10 +177,10 @@ def run_sequence(seq: Sequence, tracker: Tracker, debug=False, visdom_info=None)
     print('Tracker: {} {} {} ,  Sequence: {}'.format(tracker.name, tracker.parameter_name, tracker.run_id, seq.name))
 
     if debug:
-        output = tracker.run_sequence(seq, debug=debug, visdom_info=visdom_info)
+        output = tracker.run_sequence(seq, debug=debug, visdom_info=visdom_info, reuse_network=reuse_network)
     else:
         try:
-            output = tracker.run_sequence(seq, debug=debug, visdom_info=visdom_info)
+            output = tracker.run_sequence(seq, debug=debug, visdom_info=visdom_info, reuse_network=reuse_network)
         except Exception as e:
             print(e)
             return
@@ -179,6 +196,12 @@ def run_sequence(seq: Sequence, tracker: Tracker, debug=False, visdom_info=None)
 
     print('FPS: {}'.format(num_frames / exec_time))
 
+    if output.get('frame_skipped'):
+        # Counted per object in multi-object mode
+        skipped = [s for f in output['frame_skipped'] for s in (f.values() if isinstance(f, dict) else [f])
+                   if s is not None]
+        print('Frames: {} full, {} skipped'.format(len(skipped) - sum(skipped), sum(skipped)))
+
     if not debug:
         if seq.dataset == 'oxuva':
             _save_tracker_output_oxuva(seq, tracker, output)
@@ -186,14 +209,62 @@ def run_sequence(seq: Sequence, tracker: Tracker, debug=False, visdom_info=None)
             _save_tracker_output(seq, tracker, output)
 
 
-def run_dataset(dataset, trackers, debug=False, threads=0, visdom_info=None):
+def load_stage_times(file):
+    """Loads the per-frame stage times saved by _save_tracker_output. Returns the stage names and the times
+    (num_frames x num_stages array)."""
+    with open(file) as f:
+        stages = f.readline().lstrip('#').split()
+    stage_times = np.loadtxt(file, delimiter='\t', ndmin=2)
+    return stages, stage_times
+
+
+def _print_stage_time_summary(dataset, trackers):
+    """Prints the average time per frame of each tracker stage, for the trackers run with profile_stages."""
+    for tracker in trackers:
+        total_times = OrderedDict()
+        num_frames = 0
+        for seq in dataset:
+            stage_times_file = os.path.join(tracker.results_dir, '{}_stage_time.txt'.format(seq.name))
+            if not os.path.isfile(stage_times_file):
+                continue
+            stages, stage_times = load_stage_times(stage_times_file)
+            for stage, times in zip(stages, stage_times.T):
+                total_times[stage] = total_times.get(stage, 0.0) + times.sum()
+            num_frames += stage_times.shape[0]
+
+        if num_frames == 0:
+            continue
+
+        total = sum(total_times.values())
+        print('Stage times of {} {} {} ({} frames):'.format(tracker.name, tracker.parameter_name, tracker.run_id,
+                                                            num_frames))
+        for stage, stage_time in total_times.items():
+            print('  {:<20} {:8.2f} ms/frame {:6.1f} %'.format(stage, 1000 * stage_time / num_frames,
+                                                             100 * stage_time / max(total, 1e-12)))
+
+
+def _run_worker(task_queue, debug, visdom_info):
+    """Worker process of run_dataset. Runs (sequence, tracker) tasks from the queue until it receives None. The
+    networks of each tracker are loaded for the first task only and reused for the remaining ones."""
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        seq, tracker_info = task
+        run_sequence(seq, tracker_info, debug=debug, visdom_info=visdom_info, reuse_network=True)
+
+
+def run_dataset(dataset, trackers, debug=False, threads=0, visdom_info=None, reuse_network=False):
     """Runs a list of trackers on a dataset.
     args:
         dataset: List of Sequence instances, forming a dataset.
         trackers: List of Tracker instances.
         debug: Debug level.
-        threads: Number of threads to use (default 0).
+        threads: Number of worker processes to use (default 0). Each worker loads the networks once and then pulls
+                 sequences from a shared queue, longest sequences first.
         visdom_info: Dict containing information about the server for visdom
+        reuse_network: In sequential mode (threads=0), load the networks of each tracker once for all sequences (see
+                       Tracker.run_sequence). The parallel workers always reuse the networks.
     """
     multiprocessing.set_start_method('spawn', force=True)
 
@@ -211,9 +282,26 @@ def run_dataset(dataset, trackers, debug=False, threads=0, visdom_info=None):
     if mode == 'sequential':
         for seq in dataset:
             for tracker_info in trackers:
-                run_sequence(seq, tracker_info, debug=debug, visdom_info=visdom_info)
+                run_sequence(seq, tracker_info, debug=debug, visdom_info=visdom_info, reuse_network=reuse_network)
     elif mode == 'parallel':
-        param_list = [(seq, tracker_info, debug, visdom_info) for seq, tracker_info in product(dataset, trackers)]
-        with multiprocessing.Pool(processes=threads) as pool:
-            pool.starmap(run_sequence, param_list)
+        # Longest sequences first, such that no worker is left with a long sequence at the end of the run
+        tasks = sorted(product(dataset, trackers), key=lambda task: len(task[0].frames), reverse=True)
+
+        task_queue = multiprocessing.Queue()
+        for task in tasks:
+            task_queue.put(task)
+        for _ in range(threads):
+            task_queue.put(None)
+
+        workers = [multiprocessing.Process(target=_run_worker, args=(task_queue, debug, visdom_info))
+                   for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            if worker.exitcode != 0:
+                print('Worker {} exited with code {}'.format(worker.name, worker.exitcode))
+
+    if not debug:
+        _print_stage_time_summary(dataset, trackers)
     print('Done')
@@ -12,6 +12,11 @@ from pytracking.utils.plotting import draw_figure, overlay_mask
 from pytracking.utils.convert_vot_anno_to_rect import convert_vot_anno_to_rect
 from ltr.data.bounding_box_utils import masks_to_bboxes
 from pytracking.evaluation.multi_object_wrapper import MultiObjectWrapper
+from pytracking.evaluation.model_registry import model_registry
+from pytracking.tracker.base import FrameSkippingTracker
+from pytracking.evaluation.frame_reader import PrefetchFrameReader, read_frames
+from pytracking.evaluation.profiler import StageProfiler
+from ltr.data.image_loader import jpeg4py_loader_w_failsafe
 from pathlib import Path
 import torch
 
@@ -98,12 +103,18 @@ class Tracker:
                 self.step = True
 
 
-    def create_tracker(self, params):
+    def create_tracker(self, params, features_initialized=False):
         tracker = self.tracker_class(params)
         tracker.visdom = self.visdom
+        if features_initialized:
+            # The networks in params are already loaded
+            tracker.features_initialized = True
+        if params.get('frame_skipping', False):
+            tracker = FrameSkippingTracker(tracker)
         return tracker
 
-    def run_sequence(self, seq, visualization=None, debug=None, visdom_info=None, multiobj_mode=None):
+    def run_sequence(self, seq, visualization=None, debug=None, visdom_info=None, multiobj_mode=None,
+                     reuse_network=False):
         """Run tracker on sequence.
         args:
             seq: Sequence to run the tracker on.
@@ -111,8 +122,15 @@ class Tracker:
             debug: Set debug level (None means default value specified in the parameters).
             visdom_info: Visdom info.
             multiobj_mode: Which mode to use for multiple objects.
+            reuse_network: Take the parameters from the process-wide model registry, such that the networks are only
+                           loaded for the first sequence run in this process.
+        If the parameter profile_stages is set, the time spent in each stage of the tracker is measured (see
+        StageProfiler) and returned in output['stage_time'].
         """
-        params = self.get_parameters()
+        if reuse_network:
+            params = model_registry.get_parameters(self)
+        else:
+            params = self.get_parameters()
         visualization_ = visualization
 
         debug_ = debug
@@ -138,17 +156,28 @@ class Tracker:
         if multiobj_mode is None:
             multiobj_mode = getattr(params, 'multiobj_mode', getattr(self.tracker_class, 'multiobj_mode', 'default'))
 
+        profiler = None
+        if params.get('profile_stages', False):
+            profiler = StageProfiler(sync_cuda=params.get('profile_stages_sync_cuda', True))
+
         if multiobj_mode == 'default' or is_single_object:
-            tracker = self.create_tracker(params)
-        elif multiobj_mode == 'parallel':
-            tracker = MultiObjectWrapper(self.tracker_class, params, self.visdom)
+            tracker = self.create_tracker(params, features_initialized=reuse_network)
+            if profiler is not None:
+                profiler.instrument(tracker)
+        elif multiobj_mode in ('parallel', 'batched'):
+            # 'batched' tracks all objects in one pass if the tracker supports it (see DiMP.track_multiple)
+            tracker_factory = None
+            if reuse_network:
+                tracker_factory = lambda: self.create_tracker(params, features_initialized=True)
+            tracker = MultiObjectWrapper(self.tracker_class, params, self.visdom, tracker_factory=tracker_factory,
+                                         batched=(multiobj_mode == 'batched'), profiler=profiler)
         else:
             raise ValueError('Unknown multi object mode {}'.format(multiobj_mode))
 
-        output = self._track_sequence(tracker, seq, init_info)
+        output = self._track_sequence(tracker, seq, init_info, profiler)
         return output
 
-    def _track_sequence(self, tracker, seq, init_info):
+    def _track_sequence(self, tracker, seq, init_info, profiler=None):
         # Define outputs
         # Each field in output is a list containing tracker prediction for each frame.
 
@@ -164,10 +193,22 @@ class Tracker:
         # object in frame i
         # segmentation[i] is the multi-label segmentation mask for frame i (numpy array)
 
+        # decode_time[i] is the time spent reading and decoding frame i. The frames are read ahead of the tracker in a
+        # background thread, hence this time is not included in time[i].
+
+        # frame_skipped[i] tells whether the tracker skipped frame i + 1 and predicted the box with its motion model
+        # (only when params.frame_skipping is set, see FrameSkippingTracker).
+
+        # stage_time[i] is an OrderedDict containing the time spent in each stage of the tracker in frame i (only when
+        # a profiler is given, see StageProfiler).
+
         output = {'target_bbox': [],
                   'time': [],
                   'segmentation': [],
-                  'object_presence_score': []}
+                  'object_presence_score': [],
+                  'decode_time': [],
+                  'frame_skipped': [],
+                  'stage_time': []}
 
         def _store_outputs(tracker_out: dict, defaults=None):
             defaults = {} if defaults is None else defaults
@@ -176,8 +217,42 @@ class Tracker:
                 if key in tracker_out or val is not None:
                     output[key].append(val)
 
+        frames = self._get_frame_reader(seq, tracker.params)
+        try:
+            image_shape = self._track_frames(tracker, seq, init_info, frames, output, _store_outputs, profiler)
+        finally:
+            frames.close()
+
+        for key in ['target_bbox', 'segmentation']:
+            if key in output and len(output[key]) <= 1:
+                output.pop(key)
+
+        # next two lines are needed for oxuva output format.
+        output['image_shape'] = image_shape
+        output['object_presence_score_threshold'] = tracker.params.get('object_presence_score_threshold', 0.55)
+
+        return output
+
+    def _get_frame_reader(self, seq, params):
+        """Frame reader for the sequence. The number of frames decoded ahead of the tracker is set by the
+        'frame_prefetch' parameter (0 reads the frames in the tracking loop). Setting 'frame_loader' to 'jpeg4py'
+        decodes the frames with jpeg4py instead of opencv."""
+        read_image = self._read_image
+        if params.get('frame_loader', 'opencv') == 'jpeg4py':
+            read_image = jpeg4py_loader_w_failsafe
+
+        num_prefetch = params.get('frame_prefetch', 8)
+        if num_prefetch > 0:
+            return PrefetchFrameReader(seq.frames, read_image, num_prefetch)
+        return read_frames(seq.frames, read_image)
+
+    def _track_frames(self, tracker, seq, init_info, frames, output, _store_outputs, profiler=None):
+        """Runs the tracker on the frames given by the frame reader. Returns the image shape."""
+        frames = iter(frames)
+
         # Initialize
-        image = self._read_image(seq.frames[0])
+        image, decode_time = next(frames)
+        output['decode_time'].append(decode_time)
 
         if tracker.params.visualization and self.visdom is None:
             self.visualize(image, init_info.get('init_bbox'))
@@ -196,6 +271,8 @@ class Tracker:
                         'object_presence_score': 1.}
 
         _store_outputs(out, init_default)
+        if profiler is not None:
+            output['stage_time'].append(profiler.pop_frame())
 
         segmentation = out['segmentation'] if 'segmentation' in out else None
         bboxes = [init_default['target_bbox']]
@@ -211,7 +288,7 @@ class Tracker:
         elif tracker.params.visualization:
             self.visualize(image, bboxes, segmentation)
 
-        for frame_num, frame_path in enumerate(seq.frames[1:], start=1):
+        for frame_num, (image, decode_time) in enumerate(frames, start=1):
             while True:
                 if not self.pause_mode:
                     break
@@ -221,7 +298,7 @@ class Tracker:
                 else:
                     time.sleep(0.1)
 
-            image = self._read_image(frame_path)
+            output['decode_time'].append(decode_time)
 
             start_time = time.time()
 
@@ -231,6 +308,8 @@ class Tracker:
             out = tracker.track(image, info)
             prev_output = OrderedDict(out)
             _store_outputs(out, {'time': time.time() - start_time})
+            if profiler is not None:
+                output['stage_time'].append(profiler.pop_frame())
 
             segmentation = out['segmentation'] if 'segmentation' in out else None
 
@@ -247,15 +326,7 @@ class Tracker:
             elif tracker.params.visualization:
                 self.visualize(image, bboxes, segmentation)
 
-        for key in ['target_bbox', 'segmentation']:
-            if key in output and len(output[key]) <= 1:
-                output.pop(key)
-
-        # next two lines are needed for oxuva output format.
-        output['image_shape'] = image.shape[:2]
-        output['object_presence_score_threshold'] = tracker.params.get('object_presence_score_threshold', 0.55)
-
-        return output
+        return image.shape[:2]
 
     def run_video_generic(self, debug=None, visdom_info=None, videofilepath=None, optional_box=None, save_results=False, camera_id=0):
         """Run the tracker with the webcam or a provided video file.
@@ -282,8 +353,9 @@ class Tracker:
             tracker = self.create_tracker(params)
             if hasattr(tracker, 'initialize_features'):
                 tracker.initialize_features()
-        elif multiobj_mode == 'parallel':
-            tracker = MultiObjectWrapper(self.tracker_class, params, self.visdom, fast_load=True)
+        elif multiobj_mode in ('parallel', 'batched'):
+            tracker = MultiObjectWrapper(self.tracker_class, params, self.visdom, fast_load=True,
+                                         batched=(multiobj_mode == 'batched'))
         else:
             raise ValueError('Unknown multi object mode {}'.format(multiobj_mode))
 
@@ -451,6 +523,10 @@ class Tracker:
         cap.release()
         cv.destroyAllWindows()
 
+        if params.get('frame_skipping', False):
+            frame_counts = tracker.get_frame_counts()
+            print('Frames: {} full, {} skipped'.format(frame_counts['full'], frame_counts['skipped']))
+
         if save_results:
             if not os.path.exists(self.results_dir):
                 os.makedirs(self.results_dir)
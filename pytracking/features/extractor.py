@@ -1,5 +1,5 @@
 import torch
-from pytracking.features.preprocessing import sample_patch
+from pytracking.features.preprocessing import sample_patch, sample_patch_multiscale
 from pytracking import TensorList
 
 class ExtractorBase:
@@ -50,11 +50,13 @@ class MultiResolutionExtractor(ExtractorBase):
     """Multi-resolution feature extractor.
     args:
         features: List of features.
+        use_grid_sample: Extract the image patches of all scales with one grid_sample call.
     """
-    def __init__(self, features, patch_mode='replicate', max_scale_change=None):
+    def __init__(self, features, patch_mode='replicate', max_scale_change=None, use_grid_sample=False):
         super().__init__(features)
         self.patch_mode = patch_mode
         self.max_scale_change = max_scale_change
+        self.use_grid_sample = use_grid_sample
         self.is_color = None
 
     def stride(self):
@@ -102,14 +104,10 @@ class MultiResolutionExtractor(ExtractorBase):
             scales: Image scales to extract features from.
             image_sz: Size to resize the image samples to before extraction.
         """
-        if isinstance(scales, (int, float)):
-            scales = [scales]
-
         # Get image patches
-        patch_iter, coord_iter = zip(*(sample_patch(im, pos, s*image_sz, image_sz, mode=self.patch_mode,
-                                                    max_scale_change=self.max_scale_change) for s in scales))
-        im_patches = torch.cat(list(patch_iter))
-        patch_coords = torch.cat(list(coord_iter))
+        im_patches, patch_coords = sample_patch_multiscale(im, pos, scales, image_sz, mode=self.patch_mode,
+                                                           max_scale_change=self.max_scale_change,
+                                                           use_grid_sample=self.use_grid_sample)
 
         # im_patches = torch.cat([sample_patch(im, pos, s*image_sz, image_sz) for s in scales])
 
@@ -1,30 +1,66 @@
+import os
+import threading
 import torch
 from pytracking.utils.loading import load_network
+from ltr.models.backbone.resnet import ResNet, fuse_conv_bn
+
+
+def set_cpu_affinity(cpus):
+    """Pin all threads of the process to the given CPU cores. os.sched_setaffinity(0, ...) only applies to the calling
+    thread, so the threads which already exist (e.g. the torch intra-op thread pool) are pinned one by one. Threads
+    created later inherit the affinity of the thread creating them."""
+    os.sched_setaffinity(0, cpus)
+    try:
+        thread_ids = os.listdir('/proc/self/task')
+    except OSError:
+        return
+    for tid in thread_ids:
+        try:
+            os.sched_setaffinity(int(tid), cpus)
+        except OSError:
+            # The thread has exited
+            pass
 
 
 class NetWrapper:
     """Used for wrapping networks in pytracking.
-    Network modules and functions can be accessed directly as if they were members of this class."""
-    _rec_iter=0
-    def __init__(self, net_path, use_gpu=True, initialize=False, **kwargs):
+    Network modules and functions can be accessed directly as if they were members of this class.
+    args:
+        net_path: Path to the network (see pytracking.utils.loading.load_network).
+        use_gpu: Run the network on the GPU.
+        initialize: Load the network directly.
+        channels_last: Convert the network to the channels-last memory format (faster convolutions on CPU).
+        num_threads: Number of intra-op threads used by torch (torch.set_num_threads). Default: torch default.
+        cpu_affinity: List of CPU cores to pin all threads of the process to (see set_cpu_affinity). Default: no
+                      pinning.
+        fuse_backbone_bn: Fold the batch norm layers of a ResNet backbone into its convolutions.
+        **kwargs: Passed on to the network constructor.
+    """
+    # Recursion guard for __getattr__. Kept per thread since a wrapper can be shared between trackers running in
+    # different threads (see pytracking.evaluation.model_registry).
+    _rec_state = threading.local()
+    def __init__(self, net_path, use_gpu=True, initialize=False, channels_last=False, num_threads=None,
+                 cpu_affinity=None, fuse_backbone_bn=False, **kwargs):
         self.net_path = net_path
         self.use_gpu = use_gpu
+        self.channels_last = channels_last
+        self.num_threads = num_threads
+        self.cpu_affinity = cpu_affinity
+        self.fuse_backbone_bn = fuse_backbone_bn
         self.net = None
         self.net_kwargs = kwargs
         if initialize:
             self.initialize()
 
     def __getattr__(self, name):
-        if self._rec_iter > 0:
-            self._rec_iter = 0
+        if getattr(self._rec_state, 'rec_iter', 0) > 0:
+            self._rec_state.rec_iter = 0
             return None
-        self._rec_iter += 1
+        self._rec_state.rec_iter = 1
         try:
             ret_val = getattr(self.net, name)
-        except Exception as e:
-            self._rec_iter = 0
-            raise e
-        self._rec_iter = 0
+        finally:
+            self._rec_state.rec_iter = 0
         return ret_val
 
     def load_network(self):
@@ -32,6 +68,27 @@ class NetWrapper:
         if self.use_gpu:
             self.cuda()
         self.eval()
+        self.setup_inference()
+
+    def setup_inference(self):
+        """Apply the inference settings (thread control, backbone fusion and memory format) to the loaded network."""
+        if self.num_threads is not None:
+            torch.set_num_threads(self.num_threads)
+        if self.cpu_affinity is not None:
+            if hasattr(os, 'sched_setaffinity'):
+                set_cpu_affinity(self.cpu_affinity)
+            else:
+                print('WARNING: CPU affinity is not supported on this platform. It was ignored.')
+
+        if self.fuse_backbone_bn:
+            backbone = getattr(self.net, 'feature_extractor', None)
+            if isinstance(backbone, ResNet):
+                fuse_conv_bn(backbone)
+            else:
+                print('WARNING: Batch norm fusion requires a ResNet backbone. It was ignored.')
+
+        if self.channels_last:
+            self.net = self.net.to(memory_format=torch.channels_last)
 
     def initialize(self):
         self.load_network()
@@ -49,11 +106,32 @@ class NetWithBackbone(NetWrapper):
         self._mean = torch.Tensor(mean).view(1, -1, 1, 1)
         self._std = torch.Tensor(std).view(1, -1, 1, 1)
 
+        # Normalization as one multiply-subtract, and the output buffers of preprocess_image on CPU (per thread)
+        pixel_scale = 1/255 if image_format in ['rgb', 'bgr'] else 1
+        self._scale = pixel_scale / self._std
+        self._shift = self._mean / self._std
+        self._buffers = threading.local()
+
+    def __getstate__(self):
+        # The per-thread buffers can not be copied or pickled, they are recreated empty
+        state = self.__dict__.copy()
+        state.pop('_buffers', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+
     def initialize(self, image_format='rgb', mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)):
         super().initialize()
 
-    def preprocess_image(self, im: torch.Tensor):
-        """Normalize the image with the mean and standard deviation used by the network."""
+    def preprocess_image(self, im: torch.Tensor, reuse_buffer=False):
+        """Normalize the image with the mean and standard deviation used by the network.
+        With reuse_buffer on CPU, the result is written to a buffer which is reused for images of the same size, and is
+        only valid until the next call from the same thread. Use it only when the result is consumed immediately."""
+
+        if not self.use_gpu:
+            return self._preprocess_image_cpu(im, reuse_buffer)
 
         if self.image_format in ['rgb', 'bgr']:
             im = im/255
@@ -68,8 +146,24 @@ class NetWithBackbone(NetWrapper):
 
         return im
 
+    def _preprocess_image_cpu(self, im: torch.Tensor, reuse_buffer=False):
+        """Normalize the image as one multiply-subtract, into a new tensor or into the reused buffer."""
+        if self.image_format in ['bgr', 'bgr255']:
+            im = im[:, [2, 1, 0], :, :]
+
+        buffer = getattr(self._buffers, 'image', None) if reuse_buffer else None
+        if buffer is None or buffer.shape != im.shape:
+            memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+            buffer = torch.empty(im.shape, dtype=im.dtype, memory_format=memory_format)
+            if reuse_buffer:
+                self._buffers.image = buffer
+
+        torch.mul(im, self._scale, out=buffer)
+        buffer.sub_(self._shift)
+        return buffer
+
     def extract_backbone(self, im: torch.Tensor):
         """Extract backbone features from the network.
         Expects a float tensor image with pixel range [0, 255]."""
-        im = self.preprocess_image(im)
+        im = self.preprocess_image(im, reuse_buffer=True)
         return self.net.extract_backbone_features(im)
@@ -30,7 +30,8 @@ def sample_patch_transformed(im, pos, scale, image_sz, transforms, is_mask=False
     return im_patches
 
 
-def sample_patch_multiscale(im, pos, scales, image_sz, mode: str='replicate', max_scale_change=None):
+def sample_patch_multiscale(im, pos, scales, image_sz, mode: str='replicate', max_scale_change=None,
+                            use_grid_sample=False):
     """Extract image patches at multiple scales.
     args:
         im: Image.
@@ -39,10 +40,14 @@ def sample_patch_multiscale(im, pos, scales, image_sz, mode: str='replicate', ma
         image_sz: Size to resize the image samples to
         mode: how to treat image borders: 'replicate' (default), 'inside' or 'inside_major'
         max_scale_change: maximum allowed scale change when using 'inside' and 'inside_major' mode
+        use_grid_sample: extract all scales with one grid_sample call (see sample_patch_multiscale_grid)
     """
     if isinstance(scales, (int, float)):
         scales = [scales]
 
+    if use_grid_sample:
+        return sample_patch_multiscale_grid(im, pos, scales, image_sz, mode=mode, max_scale_change=max_scale_change)
+
     # Get image patches
     patch_iter, coord_iter = zip(*(sample_patch(im, pos, s*image_sz, image_sz, mode=mode,
                                                 max_scale_change=max_scale_change) for s in scales))
@@ -52,31 +57,67 @@ def sample_patch_multiscale(im, pos, scales, image_sz, mode: str='replicate', ma
     return  im_patches, patch_coords
 
 
-def sample_patch(im: torch.Tensor, pos: torch.Tensor, sample_sz: torch.Tensor, output_sz: torch.Tensor = None,
-                 mode: str = 'replicate', max_scale_change=None, is_mask=False):
-    """Sample an image patch.
-
+def sample_patch_multiscale_grid(im, pos, scales, image_sz, mode: str='replicate', max_scale_change=None):
+    """Extract image patches at multiple scales, giving the same patches and coordinates as sample_patch_multiscale.
+    Instead of padding, cropping and resizing each scale separately, a bilinear sampling grid is built for each scale
+    and all patches are sampled with one grid_sample call, where border clamping replaces the replicate padding.
+    Scales with different pre-downsampling factors (see sample_patch) are sampled in separate calls.
     args:
-        im: Image
-        pos: center position of crop
-        sample_sz: size to crop
-        output_sz: size to resize to
-        mode: how to treat image borders: 'replicate' (default), 'inside' or 'inside_major'
-        max_scale_change: maximum allowed scale change when using 'inside' and 'inside_major' mode
+        See sample_patch_multiscale.
     """
+    if isinstance(scales, (int, float)):
+        scales = [scales]
 
-    # if mode not in ['replicate', 'inside']:
-    #     raise ValueError('Unknown border mode \'{}\'.'.format(mode))
+    output_sz = image_sz.long().tolist()
+    crops = [_sample_patch_coords(im.shape, pos, s*image_sz, image_sz, mode, max_scale_change) for s in scales]
+
+    patch_coords = torch.cat([df * torch.cat((tl, br)).view(1,4) for df, _, tl, br in crops])
+    im_patches = im.new_empty(len(crops), im.shape[1], output_sz[0], output_sz[1])
+
+    # Group the scales by pre-downsampling factor, which also determines the downsampling offset
+    groups = {}
+    for i, (df, os, tl, br) in enumerate(crops):
+        groups.setdefault(df, (os, []))[1].append(i)
+
+    for df, (os, inds) in groups.items():
+        im2 = im[..., os[0].item()::df, os[1].item()::df] if df > 1 else im
+        grid = torch.stack([_sample_grid(crops[i][2], crops[i][3], output_sz, im2.shape[-2:], im.device)
+                            for i in inds]).to(im.dtype)
+        im_patches[inds] = F.grid_sample(im2.expand(len(inds), -1, -1, -1), grid, mode='bilinear',
+                                         padding_mode='border', align_corners=True)
+
+    return im_patches, patch_coords
+
+
+def _sample_grid(tl, br, output_sz, im_sz, device):
+    """Sampling grid (for grid_sample with align_corners=True) which reproduces cropping the image to [tl, br) with
+    replicate padding followed by bilinear resizing to output_sz (F.interpolate with align_corners=False)."""
+    coords = []
+    for d in range(2):
+        start = int(tl[d].int().item())
+        crop_sz = int(br[d].int().item()) - start
+        src = (torch.arange(output_sz[d], dtype=torch.float64, device=device) + 0.5) * (crop_sz / output_sz[d]) - 0.5
+        src = src.clamp(min=0, max=crop_sz - 1) + start
+        coords.append(src * (2.0 / max(im_sz[d] - 1, 1)) - 1)
+    y, x = coords
+    return torch.stack((x.view(1, -1).expand(output_sz[0], -1), y.view(-1, 1).expand(-1, output_sz[1])), dim=-1)
+
+
+def _sample_patch_coords(im_shape, pos: torch.Tensor, sample_sz: torch.Tensor, output_sz: torch.Tensor = None,
+                         mode: str = 'replicate', max_scale_change=None):
+    """Compute the crop of sample_patch.
+    returns:
+        df: pre-downsampling factor
+        os: offset of the pre-downsampling
+        tl, br: top-left and bottom-right crop coordinates in the downsampled image
+    """
 
     # copy and convert
     posl = pos.long().clone()
 
-    pad_mode = mode
-
     # Get new sample size if forced inside the image
     if mode == 'inside' or mode == 'inside_major':
-        pad_mode = 'replicate'
-        im_sz = torch.Tensor([im.shape[2], im.shape[3]])
+        im_sz = torch.Tensor([im_shape[2], im_shape[3]])
         shrink_factor = (sample_sz.float() / im_sz)
         if mode == 'inside':
             shrink_factor = shrink_factor.max()
@@ -94,13 +135,11 @@ def sample_patch(im: torch.Tensor, pos: torch.Tensor, sample_sz: torch.Tensor, o
 
     sz = sample_sz.float() / df     # new size
 
-    # Do downsampling
+    # Downsampled position and image size
+    os = posl % df                  # offset
     if df > 1:
-        os = posl % df              # offset
         posl = (posl - os) / df     # new position
-        im2 = im[..., os[0].item()::df, os[1].item()::df]   # downsample
-    else:
-        im2 = im
+    im2_sz = torch.LongTensor([(im_shape[2] - os[0].item() + df - 1) // df, (im_shape[3] - os[1].item() + df - 1) // df])
 
     # compute size to crop
     szl = torch.max(sz.round(), torch.Tensor([2])).long()
@@ -111,7 +150,6 @@ def sample_patch(im: torch.Tensor, pos: torch.Tensor, sample_sz: torch.Tensor, o
 
     # Shift the crop to inside
     if mode == 'inside' or mode == 'inside_major':
-        im2_sz = torch.LongTensor([im2.shape[2], im2.shape[3]])
         shift = (-tl).clamp(0) - (br - im2_sz).clamp(0)
         tl += shift
         br += shift
@@ -121,8 +159,34 @@ def sample_patch(im: torch.Tensor, pos: torch.Tensor, sample_sz: torch.Tensor, o
         tl += shift
         br += shift
 
-        # Get image patch
-        # im_patch = im2[...,tl[0].item():br[0].item(),tl[1].item():br[1].item()]
+    return df, os, tl, br
+
+
+def sample_patch(im: torch.Tensor, pos: torch.Tensor, sample_sz: torch.Tensor, output_sz: torch.Tensor = None,
+                 mode: str = 'replicate', max_scale_change=None, is_mask=False):
+    """Sample an image patch.
+
+    args:
+        im: Image
+        pos: center position of crop
+        sample_sz: size to crop
+        output_sz: size to resize to
+        mode: how to treat image borders: 'replicate' (default), 'inside' or 'inside_major'
+        max_scale_change: maximum allowed scale change when using 'inside' and 'inside_major' mode
+    """
+
+    # if mode not in ['replicate', 'inside']:
+    #     raise ValueError('Unknown border mode \'{}\'.'.format(mode))
+
+    df, os, tl, br = _sample_patch_coords(im.shape, pos, sample_sz, output_sz, mode, max_scale_change)
+
+    pad_mode = 'replicate' if mode == 'inside' or mode == 'inside_major' else mode
+
+    # Do downsampling
+    if df > 1:
+        im2 = im[..., os[0].item()::df, os[1].item()::df]   # downsample
+    else:
+        im2 = im
 
     # Get image patch
     pad = (-tl[1].int().item(), br[1].int().item() - im2.shape[3],
@@ -0,0 +1,93 @@
+import torch
+from pytracking.libs.tensorlist import TensorList
+import ltr.data.bounding_box_utils as bbutils
+
+
+def step_length_tensor(step_length, device=None):
+    """Convert the box_refinement_step_length parameter to a tensor. A (tuple, list) gives separate step lengths for
+    the position and the size of the box."""
+    if isinstance(step_length, (tuple, list)):
+        return torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]]).to(device).view(1,1,4)
+    return step_length
+
+
+def cat_objects(inputs):
+    """Concatenate the IoUNet inputs (modulation vectors or IoU features) of several objects along the batch
+    dimension, such that the boxes of all objects can be refined in one optimize_boxes call. Modulation vectors
+    without batch dimension are stacked."""
+    return TensorList([torch.cat([e.view(1, -1) if e.dim() == 1 else e for e in x]) for x in zip(*inputs)])
+
+
+def optimize_boxes(predict_iou, modulation, iou_features, init_boxes, num_iter, step_length, step_decay=1.0,
+                   space='default', adaptive_step=False):
+    """Refine box proposals by gradient ascent on the IoU predicted by the IoUNet.
+    The proposals are updated in-place in one leaf tensor and only the gradient with respect to the boxes is computed,
+    i.e. no gradients are accumulated in the network or the features.
+    args:
+        predict_iou: IoU predictor, called as predict_iou(modulation, iou_features, boxes) (see AtomIoUNet.predict_iou).
+        modulation: Target modulation vectors, with one object per entry in the batch dimension.
+        iou_features: IoU features of the test image, with one object per entry in the batch dimension.
+        init_boxes: Initial proposals, (num_proposals, 4) for a single object or (num_objects, num_proposals, 4).
+        num_iter: Number of refinement steps.
+        step_length: Step length, scalar or tensor (see step_length_tensor).
+        step_decay: Decay of the step length after each step.
+        space: Box parametrization used in the optimization. 'default' (the original IoUNet) or 'relative' (PrDiMP).
+        adaptive_step: Only decay the step length of a proposal when its IoU decreased, and then undo its last step
+                       (used by ATOM).
+    returns:
+        output_boxes: Refined proposals, same shape as init_boxes.
+        output_iou: Predicted IoU of the proposals before the last step, (num_proposals) or (num_objects, num_proposals).
+    """
+    if space not in ('default', 'relative'):
+        raise ValueError('Unknown box_refinement_space {}'.format(space))
+
+    boxes = init_boxes.view(-1, init_boxes.shape[-2], 4)
+    step_length = step_length_tensor(step_length, boxes.device)
+
+    if space == 'relative':
+        sz_norm = boxes[:,:1,2:].clone()
+        x = bbutils.rect_to_rel(boxes, sz_norm)
+    else:
+        x = boxes.clone()
+    x.requires_grad_(True)
+
+    if adaptive_step:
+        step_length = step_length * x.new_ones(x.shape[0], x.shape[1], 1)
+        outputs_prev = x.new_full(x.shape[:2], -99999999)
+        step = torch.zeros_like(x)
+
+    outputs = None
+    for _ in range(num_iter):
+        # forward pass
+        bb = bbutils.rel_to_rect(x, sz_norm) if space == 'relative' else x
+        outputs = predict_iou(modulation, iou_features, bb)
+
+        if isinstance(outputs, (list, tuple)):
+            outputs = outputs[0]
+
+        grad, = torch.autograd.grad(outputs, x, grad_outputs=torch.ones_like(outputs))
+        outputs = outputs.detach()
+
+        # Update proposals
+        with torch.no_grad():
+            if space == 'default':
+                grad *= x[:,:,2:].repeat(1, 1, 2)
+
+            if adaptive_step:
+                update_mask = (outputs > outputs_prev) | (step_decay >= 1)
+                update_mask_float = update_mask.unsqueeze(-1).float()
+                step_length[~update_mask, :] *= step_decay
+                outputs_prev = outputs
+
+                step = update_mask_float * step_length * grad - (1.0 - update_mask_float) * step
+                x.add_(step)
+            else:
+                x.add_(step_length * grad)
+                step_length = step_length * step_decay
+
+    x = x.detach()
+    output_boxes = bbutils.rel_to_rect(x, sz_norm) if space == 'relative' else x
+    if outputs is None:
+        outputs = x.new_zeros(x.shape[:2])
+
+    return output_boxes.view(init_boxes.shape), outputs.view(init_boxes.shape[:-1])
@@ -0,0 +1,87 @@
+import torch
+import torch.nn as nn
+
+
+class DiMPInference(nn.Module):
+    """The per-frame inference of a DiMP network (backbone, classification features and target classifier) as one
+    module, such that it can be compiled into one graph."""
+
+    def __init__(self, net):
+        super().__init__()
+        self.net = net
+
+    def forward(self, im, target_filter):
+        backbone_feat = self.net.extract_backbone_features(im)
+        test_x = self.net.extract_classification_feat(backbone_feat)
+        scores = self.net.classifier.classify(target_filter, test_x)
+        return backbone_feat, test_x, scores
+
+
+def _flatten(outputs):
+    if torch.is_tensor(outputs):
+        return [outputs]
+    if isinstance(outputs, dict):
+        outputs = outputs.values()
+    return [t for x in outputs for t in _flatten(x)]
+
+
+class CompiledInference:
+    """Runs a module through compiled graphs, one per input shape. A graph is built on the first call with a new input
+    shape. If building or running it fails, or if its outputs differ from the eager outputs, the inputs of that shape
+    are run in eager mode.
+    args:
+        module: The module, e.g. DiMPInference.
+        mode: 'trace' (torch.jit.trace) or 'compile' (torch.compile).
+        tolerance: Maximum absolute difference to the eager outputs, checked on the first call of each shape. None
+                   disables the check.
+    """
+
+    def __init__(self, module, mode='trace', tolerance=1e-4):
+        if mode not in ('trace', 'compile'):
+            raise ValueError('Unknown compiled inference mode {}'.format(mode))
+        if mode == 'compile' and not hasattr(torch, 'compile'):
+            raise ValueError('Compiled inference mode compile requires torch.compile (PyTorch 2.0 or later)')
+
+        self.module = module
+        self.mode = mode
+        self.tolerance = tolerance
+        self.graphs = {}    # Input shapes -> graph, or None for eager mode
+
+    def __call__(self, *inputs):
+        key = tuple((tuple(x.shape), x.dtype, str(x.device)) for x in inputs)
+        with torch.no_grad():
+            if key not in self.graphs:
+                self.graphs[key] = self._build_graph(key, inputs)
+
+            graph = self.graphs[key]
+            if graph is not None:
+                try:
+                    return graph(*inputs)
+                except Exception as e:
+                    print('WARNING: Compiled inference failed for input shapes {} ({}). Running in eager mode.'.format(
+                        [k[0] for k in key], e))
+                    self.graphs[key] = None
+
+            return self.module(*inputs)
+
+    def _build_graph(self, key, inputs):
+        try:
+            if self.mode == 'compile':
+                graph = torch.compile(self.module, dynamic=False)
+            else:
+                graph = torch.jit.trace(self.module, inputs, strict=False, check_trace=False)
+            outputs = graph(*inputs)
+        except Exception as e:
+            print('WARNING: Compiling the inference graph for input shapes {} failed ({}). Running in eager mode.'.format(
+                [k[0] for k in key], e))
+            return None
+
+        if self.tolerance is not None:
+            outputs, reference = _flatten(outputs), _flatten(self.module(*inputs))
+            if len(outputs) != len(reference) or \
+                    any((a - b).abs().max().item() > self.tolerance for a, b in zip(outputs, reference)):
+                print('WARNING: The compiled inference graph for input shapes {} does not match the eager outputs. '
+                      'Running in eager mode.'.format([k[0] for k in key]))
+                return None
+
+        return graph
@@ -0,0 +1,134 @@
+import torch
+
+
+class SampleMemory:
+    """Fixed-size memory of training samples with temporal sample weights, used for the online model updates of the
+    trackers (DiMP, KYS, ToMP, LWL, RTS, KeepTrack).
+    All buffers (samples, boxes, labels, ...) and the weight vector are preallocated with memory_size entries. A new
+    sample is appended until the memory is full, and then replaces the sample with the lowest weight (or replacement
+    score). The replacement index is kept as a tensor on the device of the weights, such that an update needs no host
+    synchronization.
+    args:
+        memory_size: Number of samples in the memory.
+        learning_rate: Default learning rate of the temporal sample weights.
+        init_samples_minimum_weight: Minimum total weight of the initial samples. These are never replaced if given.
+        lower_init_weight: Give the first updated sample weight 1 (before normalization) instead of the learning rate.
+        keep_weight_on_same_index: Keep the weight of a sample which replaces the previously replaced sample.
+    """
+
+    def __init__(self, memory_size, learning_rate, init_samples_minimum_weight=None, lower_init_weight=False,
+                 keep_weight_on_same_index=False):
+        self.memory_size = memory_size
+        self.learning_rate = learning_rate
+        self.init_samples_minimum_weight = init_samples_minimum_weight if init_samples_minimum_weight else None
+        self.lower_init_weight = lower_init_weight
+        self.keep_weight_on_same_index = keep_weight_on_same_index
+
+        self.buffers = {}
+        self.weights = None
+        self.num_init = 0
+        self.num_stored = 0
+        self.previous_replace_ind = None
+
+    def initialize(self, init_samples: dict):
+        """Allocate the buffers and store the initial samples, which get equal weights.
+        args:
+            init_samples: Dict name -> initial entries of the buffer (num_init x ...).
+        """
+        self.buffers = {}
+        for name, x in init_samples.items():
+            self.buffers[name] = x.new_zeros(self.memory_size, *x.shape[1:])
+            self.buffers[name][:x.shape[0], ...] = x
+            self.num_init = x.shape[0]
+
+        x = next(iter(init_samples.values()))
+        self.weights = x.new_zeros(self.memory_size)
+        self.weights[:self.num_init] = 1 / self.num_init
+
+        self.num_stored = self.num_init
+        self.previous_replace_ind = None
+
+    def __getitem__(self, name):
+        """The stored entries of a buffer."""
+        return self.buffers[name][:self.num_stored, ...]
+
+    @property
+    def sample_weights(self):
+        """The weights of the stored samples."""
+        return self.weights[:self.num_stored]
+
+    def tensors(self):
+        """All tensors of the memory (buffers, weights and replacement index)."""
+        tensors = list(self.buffers.values()) + [self.weights, self.previous_replace_ind]
+        return [t for t in tensors if t is not None]
+
+    def apply(self, fn):
+        """Replace all tensors t of the memory by fn(t), e.g. to move the memory to another device."""
+        self.buffers = {name: fn(x) for name, x in self.buffers.items()}
+        if self.weights is not None:
+            self.weights = fn(self.weights)
+        if self.previous_replace_ind is not None:
+            self.previous_replace_ind = fn(self.previous_replace_ind)
+        return self
+
+    def update(self, samples: dict, learning_rate=None, replace_score=None):
+        """Insert a new sample, replacing a stored one if the memory is full, and update the sample weights.
+        args:
+            samples: Dict name -> new entry of the buffer (any shape with the number of elements of one entry).
+            learning_rate: Learning rate of the sample weights. Defaults to the learning rate of the memory.
+            replace_score: Score of the stored samples, the lowest is replaced (default: the sample weights).
+        returns:
+            The index of the replaced sample, as a tensor with one element.
+        """
+        replace_ind = self._update_weights(self.learning_rate if learning_rate is None else learning_rate,
+                                           replace_score)
+        self.previous_replace_ind = replace_ind
+
+        for name, x in samples.items():
+            buffer = self.buffers[name]
+            x = torch.as_tensor(x, dtype=buffer.dtype, device=buffer.device)
+            buffer.index_copy_(0, replace_ind, x.reshape(1, *buffer.shape[1:]))
+
+        self.num_stored = min(self.num_stored + 1, self.memory_size)
+        return replace_ind
+
+    def _update_weights(self, lr, replace_score=None):
+        sw = self.weights
+        num_init = self.num_init
+        init_samp_weight = self.init_samples_minimum_weight
+        s_ind = 0 if init_samp_weight is None else num_init
+
+        if self.num_stored == 0 or lr == 1:
+            sw.zero_()
+            sw[0] = 1
+            replace_ind = torch.zeros(1, dtype=torch.long, device=sw.device)
+        else:
+            # Get index to replace
+            if self.num_stored < self.memory_size:
+                replace_ind = torch.full((1,), self.num_stored, dtype=torch.long, device=sw.device)
+            else:
+                score = sw if replace_score is None else replace_score.view(-1)
+                replace_ind = torch.argmin(score[s_ind:]).view(1) + s_ind
+
+            # Update weights
+            if self.previous_replace_ind is None:
+                if self.lower_init_weight:
+                    sw.index_fill_(0, replace_ind, 1)
+                else:
+                    sw /= 1 - lr
+                    sw.index_fill_(0, replace_ind, lr)
+            else:
+                new_weight = sw.index_select(0, self.previous_replace_ind) / (1 - lr)
+                if self.keep_weight_on_same_index:
+                    new_weight = torch.where(replace_ind == self.previous_replace_ind,
+                                             sw.index_select(0, replace_ind), new_weight)
+                sw.index_copy_(0, replace_ind, new_weight)
+
+        sw /= sw.sum()
+        if init_samp_weight is not None:
+            # Raise the total weight of the initial samples to init_samp_weight if it is lower
+            scaled = sw / (init_samp_weight + sw[num_init:].sum())
+            scaled[:num_init] = init_samp_weight / num_init
+            sw.copy_(torch.where(sw[:num_init].sum() < init_samp_weight, scaled, sw))
+
+        return replace_ind
@@ -0,0 +1,24 @@
+import os
+from pytracking.features.net_wrappers import NetWithBackbone
+from pytracking.parameter.dimp.dimp50 import parameters as dimp50_parameters
+
+def parameters():
+    """DiMP50 for CPU-only inference. Same tracker settings as dimp50, with the backbone batch norm layers folded into
+    the convolutions and the channels-last memory format. The tracker runs on a fixed set of (at most 4) cores, with one
+    torch thread per core."""
+    params = dimp50_parameters()
+
+    params.use_gpu = False
+
+    # The first (at most 4) of the cores available to the process
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    cores = cores[:4]
+
+    params.net = NetWithBackbone(net_path='dimp50.pth',
+                                 use_gpu=params.use_gpu,
+                                 channels_last=True,
+                                 num_threads=len(cores),
+                                 cpu_affinity=cores,
+                                 fuse_backbone_bn=True)
+
+    return params
@@ -8,9 +8,9 @@ from pytracking import dcf, fourier, TensorList, operation
 from pytracking.features.preprocessing import numpy_to_torch
 from pytracking.utils.plotting import show_tensor
 from pytracking.libs.optimization import GaussNewtonCG, ConjugateGradient, GradientDescentL2
+from pytracking.libs import box_refinement
 from .optim import ConvProblem, FactorizedConvProblem
 from pytracking.features import augmentation
-import ltr.data.bounding_box_utils as bbutils
 
 
 class ATOM(BaseTracker):
@@ -770,81 +770,13 @@ class ATOM(BaseTracker):
             self.target_scale = new_scale
 
     def optimize_boxes(self, iou_features, init_boxes):
-        # Optimize iounet boxes
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        init_step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            init_step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]]).to(
-                self.params.device).view(1, 1, 4)
-        box_refinement_space = self.params.get('box_refinement_space', 'default')
-
-        step_length = init_step_length * output_boxes.new_ones(1, output_boxes.shape[1], 1)
-        outputs_prev = -99999999 * output_boxes.new_ones(1, output_boxes.shape[1])
-        step = torch.zeros_like(output_boxes)
-
-        if box_refinement_space == 'default':
-            # Optimization using bounding box space used in original IoUNet
-            for i_ in range(self.params.box_refinement_iter):
-                # forward pass
-                bb_init = output_boxes.clone().detach()
-                bb_init.requires_grad = True
-
-                outputs = self.iou_predictor.predict_iou(self.target_feat, iou_features, bb_init)
-
-                if isinstance(outputs, (list, tuple)):
-                    outputs = outputs[0]
-
-                outputs.backward(gradient=torch.ones_like(outputs))
-
-                # Update mask and step length
-                update_mask = (outputs.detach() > outputs_prev) | (self.params.box_refinement_step_decay >= 1)
-                update_mask_float = update_mask.view(1, -1, 1).float()
-                step_length[~update_mask, :] *= self.params.box_refinement_step_decay
-                outputs_prev = outputs.detach().clone()
-
-                # Update proposal
-                step = update_mask_float * step_length * bb_init.grad * bb_init[:, :, 2:].repeat(1, 1, 2) - (
-                            1.0 - update_mask_float) * step
-                output_boxes = bb_init + step
-                output_boxes.detach_()
-
-        elif box_refinement_space == 'relative':
-            # Optimization using relative bounding box space
-            sz_norm = output_boxes[:, :1, 2:].clone()
-            output_boxes_rel = bbutils.rect_to_rel(output_boxes, sz_norm)
-            for i_ in range(self.params.box_refinement_iter):
-                # forward pass
-                bb_init_rel = output_boxes_rel.clone().detach()
-                bb_init_rel.requires_grad = True
-
-                bb_init = bbutils.rel_to_rect(bb_init_rel, sz_norm)
-                outputs = self.iou_predictor.predict_iou(self.target_feat, iou_features, bb_init)
-
-                if isinstance(outputs, (list, tuple)):
-                    outputs = outputs[0]
-
-                outputs.backward(gradient=torch.ones_like(outputs))
-
-                # Update mask and step length
-                update_mask = (outputs.detach() > outputs_prev) | (self.params.box_refinement_step_decay >= 1)
-                update_mask_float = update_mask.view(1, -1, 1).float()
-                step_length[~update_mask, :] *= self.params.box_refinement_step_decay
-                outputs_prev = outputs.detach().clone()
-
-                # Update proposal
-                step = update_mask_float * step_length * bb_init_rel.grad - (1.0 - update_mask_float) * step
-                output_boxes_rel = bb_init_rel + step
-                output_boxes_rel.detach_()
-
-                # for s in outputs.view(-1):
-                #     print('{:.2f}  '.format(s.item()), end='')
-                # print('')
-            # print('')
-
-            output_boxes = bbutils.rel_to_rect(output_boxes_rel, sz_norm)
-
-        else:
-            raise ValueError('Unknown box_refinement_space {}'.format(box_refinement_space))
-
-        return output_boxes.view(-1, 4).cpu(), outputs.detach().view(-1).cpu()
+        """Optimize the iounet boxes (see pytracking.libs.box_refinement). The step length of a box is only decayed
+        when its predicted IoU decreases."""
+        output_boxes, output_iou = box_refinement.optimize_boxes(self.iou_predictor.predict_iou, self.target_feat,
+                                                                 iou_features, init_boxes.to(self.params.device),
+                                                                 self.params.box_refinement_iter,
+                                                                 self.params.box_refinement_step_length,
+                                                                 self.params.box_refinement_step_decay,
+                                                                 self.params.get('box_refinement_space', 'default'),
+                                                                 adaptive_step=True)
+        return output_boxes.cpu(), output_iou.cpu()
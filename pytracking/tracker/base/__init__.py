@@ -1 +1,2 @@
-from .basetracker import BaseTracker
\ No newline at end of file
+from .basetracker import BaseTracker
+from .frame_skipping import FrameSkippingTracker
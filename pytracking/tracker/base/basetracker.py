@@ -1,13 +1,55 @@
 from _collections import OrderedDict
+import copy
 
 class BaseTracker:
     """Base class for all trackers."""
 
+    # Attributes which are shared, and treated as immutable, between a tracker and its clones (see clone_state).
+    # Extend in subclasses with further state which does not depend on the tracked object.
+    shared_state = ('params', 'net', 'visdom', 'frame_reader')
+
     def __init__(self, params):
         self.params = params
         self.visdom = None
 
 
+    def clone_state(self):
+        """Create a new tracker of the same class. The shared state (see shared_state), such as the parameters and the
+        network, is shared with this tracker, while the per-object state is copied. Objects reachable from the shared
+        state (e.g. params.net) are also shared when referenced from the per-object state.
+        Methods wrapped on this instance (e.g. by the StageProfiler) are not copied, since the wrappers call the methods
+        of this tracker. Instead, the clone is instrumented again by the same instrumenters (see add_instrumenter)."""
+        memo = {}
+        for name in self.shared_state:
+            value = self.__dict__.get(name, None)
+            if value is None:
+                continue
+            memo[id(value)] = value
+            for attr in getattr(value, '__dict__', {}).values():
+                memo[id(attr)] = attr
+
+        clone = self.__class__.__new__(self.__class__)
+        for name, value in self.__dict__.items():
+            if self._is_instrumentation(name):
+                continue
+            clone.__dict__[name] = value if name in self.shared_state else copy.deepcopy(value, memo)
+        for instrument in self.__dict__.get('_instrumenters', []):
+            instrument(clone)
+        return clone
+
+
+    def add_instrumenter(self, instrument):
+        """Register a function which wraps methods on this tracker instance, such that it is also applied to the clones
+        (see clone_state). Instance attributes ending with '_instrumented' are treated as its markers."""
+        self._instrumenters = self.__dict__.get('_instrumenters', []) + [instrument]
+
+
+    def _is_instrumentation(self, name):
+        # Instrumenters, their markers, and instance attributes which replace methods of the class
+        return name == '_instrumenters' or name.endswith('_instrumented') or \
+               callable(getattr(self.__class__, name, None))
+
+
     def predicts_segmentation_mask(self):
         return False
 
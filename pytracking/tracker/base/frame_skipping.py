@@ -0,0 +1,141 @@
+import numpy as np
+import torch
+import ltr.data.bounding_box_utils as bbutils
+
+
+class FrameSkippingTracker:
+    """Runs a tracker at an adaptive frame rate. After a confidently tracked frame (flag 'normal' and max score above
+    frame_skipping_min_score), the following frames are skipped: the target box is predicted with a constant velocity
+    motion model, without running the tracker. The tracker is run again after frame_skipping_max_skip skipped frames.
+    Trackers which do not report a flag and max score in their debug_info (see DiMP.track) are run on every frame.
+    The frame counter of the tracker (frame_num) also counts the skipped frames, so that the time stamps of the samples
+    match the sequence. Frames on which the tracker would update its model (params.train_skipping) are not skipped.
+
+    The policy is set in the tracker parameters:
+        frame_skipping: Enable frame skipping (see pytracking.evaluation.Tracker.create_tracker).
+        frame_skipping_max_skip: Maximum number of consecutive skipped frames (default 2).
+        frame_skipping_min_score: Minimum max score of the last tracked frame to skip frames (default 0.5).
+        frame_skipping_flags: Flags of the last tracked frame which allow skipping (default ('normal',)).
+        frame_skipping_update_pos: Move the search region of the tracker to the predicted position before running it
+                                   after skipped frames (default True).
+
+    Other attributes are forwarded to the base tracker.
+    """
+
+    def __init__(self, base_tracker):
+        self.base_tracker = base_tracker
+        self.num_full_frames = 0
+        self.num_skipped_frames = 0
+        self._reset_motion()
+
+    def __getattr__(self, name):
+        # Only called for attributes which are not found on the wrapper
+        if name == 'base_tracker':
+            raise AttributeError(name)
+        return getattr(self.base_tracker, name)
+
+    @property
+    def visdom(self):
+        return self.base_tracker.visdom
+
+    @visdom.setter
+    def visdom(self, visdom):
+        self.base_tracker.visdom = visdom
+
+    def _reset_motion(self):
+        self.last_box = None
+        self.velocity = None
+        self.frames_since_full = 0
+        self.skip_allowed = False
+
+    def initialize(self, image, info: dict) -> dict:
+        self._reset_motion()
+        out = self.base_tracker.initialize(image, info)
+        self.last_box = self._init_box(info)
+        self.num_full_frames += 1
+        return out
+
+    @staticmethod
+    def _init_box(info):
+        """Initial box of the object, given by init_bbox or else derived from init_mask. Returns None if there is no
+        box for a single object, in which case frames are only skipped once the tracker has been run twice."""
+        box = info.get('init_bbox', None)
+        if isinstance(box, dict):
+            # Boxes of several objects (see MultiObjectWrapper._split_info for the per-object info)
+            object_ids = info.get('object_ids', [])
+            box = box.get(object_ids[0], None) if len(object_ids) == 1 else None
+        if box is not None:
+            box = torch.Tensor(list(box))
+            return box if box.numel() == 4 else None
+
+        mask = info.get('init_mask', None)
+        if mask is None or not mask.any():
+            return None
+        return bbutils.masks_to_bboxes(torch.from_numpy(np.asarray(mask)), fmt='t')
+
+    def track(self, image, info: dict = None) -> dict:
+        params = self.base_tracker.params
+        max_skip = params.get('frame_skipping_max_skip', 2)
+
+        frame_num = getattr(self.base_tracker, 'frame_num', None)
+        if not isinstance(frame_num, int):
+            frame_num = None
+
+        if self.skip_allowed and self.frames_since_full < max_skip and \
+                not self._is_update_frame(params, frame_num, self.frames_since_full + 1):
+            self.frames_since_full += 1
+            self.num_skipped_frames += 1
+            return {'target_bbox': self._predict_box(self.frames_since_full).tolist(), 'frame_skipped': True}
+
+        if frame_num is not None:
+            # The tracker increments frame_num for this frame
+            self.base_tracker.frame_num += self.frames_since_full
+
+        if self.frames_since_full > 0 and params.get('frame_skipping_update_pos', True) and \
+                isinstance(getattr(self.base_tracker, 'pos', None), torch.Tensor):
+            box = self._predict_box(self.frames_since_full + 1)
+            self.base_tracker.pos = (box[[1, 0]] + (box[[3, 2]] - 1) / 2).to(self.base_tracker.pos.dtype)
+
+        out = self.base_tracker.track(image, info)
+        self.num_full_frames += 1
+
+        # Update the motion model and the decision for the next frames
+        box = torch.Tensor(out['target_bbox'])
+        valid = box.numel() == 4 and bool((box[2:] > 0).all())
+        if valid and self.last_box is not None:
+            self.velocity = (box[:2] - self.last_box[:2]) / (self.frames_since_full + 1)
+        else:
+            self.velocity = None
+        self.last_box = box if valid else None
+        self.frames_since_full = 0
+        self.skip_allowed = self.velocity is not None and self._confident(params)
+
+        out['frame_skipped'] = False
+        return out
+
+    def _predict_box(self, num_frames):
+        box = self.last_box.clone()
+        box[:2] += num_frames * self.velocity
+        return box
+
+    @staticmethod
+    def _is_update_frame(params, frame_num, num_frames):
+        """Whether the tracker would update its model num_frames after frame frame_num (see DiMP.update_classifier)."""
+        train_skipping = params.get('train_skipping', 1)
+        if frame_num is None or not isinstance(train_skipping, int) or train_skipping <= 1:
+            return False
+        return (frame_num + num_frames - 1) % train_skipping == 0
+
+    def _confident(self, params):
+        debug_info = getattr(self.base_tracker, 'debug_info', None) or {}
+        id_str = getattr(self.base_tracker, 'id_str', '')
+        flag = debug_info.get('flag' + id_str, None)
+        max_score = debug_info.get('max_score' + id_str, None)
+        if flag is None or max_score is None:
+            return False
+        return flag in params.get('frame_skipping_flags', ('normal',)) and \
+               max_score >= params.get('frame_skipping_min_score', 0.5)
+
+    def get_frame_counts(self):
+        """Number of frames the tracker was run on (including the initial frame) and number of skipped frames."""
+        return {'full': self.num_full_frames, 'skipped': self.num_skipped_frames}
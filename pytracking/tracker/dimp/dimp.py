@@ -3,10 +3,14 @@ import torch
 import torch.nn.functional as F
 import math
 import time
+from collections import OrderedDict
 from pytracking import dcf, TensorList
+from pytracking.libs import box_refinement
+from pytracking.libs.sample_memory import SampleMemory
+from pytracking.libs.compiled_inference import CompiledInference, DiMPInference
 from pytracking.features.preprocessing import numpy_to_torch
 from pytracking.utils.plotting import show_tensor, plot_graph
-from pytracking.features.preprocessing import sample_patch_multiscale, sample_patch_transformed
+from pytracking.features.preprocessing import sample_patch_multiscale, sample_patch_transformed, _sample_patch_coords
 from pytracking.features import augmentation
 import ltr.data.bounding_box_utils as bbutils
 from ltr.models.target_classifier.initializer import FilterInitializerZero
@@ -87,48 +91,137 @@ class DiMP(BaseTracker):
         if self.params.get('use_iou_net', True):
             self.init_iou_net(init_backbone_feat)
 
+        self.init_compiled_inference()
+
         out = {'time': time.time() - tic}
         return out
 
+    def init_compiled_inference(self):
+        """Set up the compiled per-frame inference (backbone, classification features and classifier in one graph per
+        input shape, see CompiledInference), if enabled by the compiled_inference parameter ('trace' or 'compile').
+        The compiled graphs are shared by the trackers using the same network."""
+        self.compiled_inference = None
+        mode = self.params.get('compiled_inference', None)
+        if not mode:
+            return
 
-    def track(self, image, info: dict = None) -> dict:
-        self.debug_info = {}
+        compiled_inference = getattr(self.net, 'compiled_inference', None)
+        if compiled_inference is None or compiled_inference.mode != mode:
+            compiled_inference = CompiledInference(DiMPInference(self.net.net), mode,
+                                                   self.params.get('compiled_inference_tolerance', 1e-4))
+            self.net.compiled_inference = compiled_inference
+        self.compiled_inference = compiled_inference
 
-        self.frame_num += 1
-        self.debug_info['frame_num'] = self.frame_num
 
+    def track(self, image, info: dict = None) -> dict:
         # Convert image
-        im = numpy_to_torch(image)
+        im = self.prepare_frame(image, info)
 
         # ------- LOCALIZATION ------- #
 
+        if getattr(self, 'compiled_inference', None) is not None:
+            # Extract backbone features, classification features and scores in the compiled graph
+            backbone_feat, sample_coords, test_x, scores_raw = self.extract_features_and_scores(
+                im, self.get_centered_sample_pos(), self.target_scale * self.params.scale_factors, self.img_sample_sz)
+            return self.track_from_backbone(backbone_feat, sample_coords, test_x, scores_raw)
+
         # Extract backbone features
         backbone_feat, sample_coords, im_patches = self.extract_backbone_features(im, self.get_centered_sample_pos(),
                                                                       self.target_scale * self.params.scale_factors,
                                                                       self.img_sample_sz)
+
+        return self.track_from_backbone(backbone_feat, sample_coords)
+
+
+    def prepare_frame(self, image, info: dict = None):
+        """Start processing a new frame and convert the image to a torch tensor.
+        If info contains 'image_offset' (x, y), the image is a crop of the full frame with its top-left corner at
+        this position. The tracker state is kept in full frame coordinates. If info contains 'image_tensor', it is
+        used as the already converted image (e.g. shared between several trackers)."""
+        info = {} if info is None else info
+        self.debug_info = {}
+
+        self.frame_num += 1
+        self.debug_info['frame_num'] = self.frame_num
+
+        offset = info.get('image_offset', None)
+        self.image_offset = None if offset is None else torch.Tensor([offset[1], offset[0]])
+
+        im = info.get('image_tensor', None)
+        return numpy_to_torch(image) if im is None else im
+
+
+    def sample_search_patches(self, im: torch.Tensor):
+        """Sample the search region patches around the current target estimate. Together with prepare_frame and
+        track_from_backbone, this allows the backbone to be run externally, e.g. batched over several trackers."""
+        return self.sample_patches(im, self.get_centered_sample_pos(), self.target_scale * self.params.scale_factors,
+                                   self.img_sample_sz)
+
+
+    def track_from_backbone(self, backbone_feat, sample_coords, test_x=None, scores_raw=None,
+                            optimize_filter=True) -> dict:
+        """Run the localization and model update for the current frame, given the backbone features of the search
+        region patches. The classification features (test_x) and scores (scores_raw) can be given if they are
+        already computed. If optimize_filter is False, the number of filter optimizer iterations to run is stored in
+        self.pending_filter_iter instead of running the optimizer (see track_multiple)."""
+        frame = self.localize_from_backbone(backbone_feat, sample_coords, test_x, scores_raw)
+
+        # Refine the target box
+        if frame['box_proposals'] is not None:
+            frame['refined_boxes'] = self.optimize_boxes(*frame['box_proposals'])
+
+        return self.update_from_backbone(frame, optimize_filter)
+
+    def localize_from_backbone(self, backbone_feat, sample_coords, test_x=None, scores_raw=None) -> dict:
+        """First part of track_from_backbone: localize the target and generate the IoUNet box proposals. Returns the
+        state of the frame, which is passed on to update_from_backbone. The proposals in frame['box_proposals'] are
+        refined by the caller and the result is stored in frame['refined_boxes']."""
+
         # Extract classification features
-        test_x = self.get_classification_features(backbone_feat)
+        if test_x is None:
+            test_x = self.get_classification_features(backbone_feat)
 
         # Location of sample
         sample_pos, sample_scales = self.get_sample_location(sample_coords)
 
         # Compute classification scores
-        scores_raw = self.classify_target(test_x)
+        if scores_raw is None:
+            scores_raw = self.classify_target(test_x)
 
         # Localize the target
         translation_vec, scale_ind, s, flag = self.localize_target(scores_raw, sample_pos, sample_scales)
         new_pos = sample_pos[scale_ind,:] + translation_vec
 
+        frame = {'test_x': test_x, 'sample_coords': sample_coords, 'sample_pos': sample_pos,
+                 'sample_scales': sample_scales, 'scale_ind': scale_ind, 's': s, 'flag': flag,
+                 'box_proposals': None, 'refined_boxes': None, 'update_scale': True}
+
         # Update position and scale
         if flag != 'not_found':
             if self.params.get('use_iou_net', True):
-                update_scale_flag = self.params.get('update_scale_when_uncertain', True) or flag != 'uncertain'
+                frame['update_scale'] = self.params.get('update_scale_when_uncertain', True) or flag != 'uncertain'
                 if self.params.get('use_classifier', True):
                     self.update_state(new_pos)
-                self.refine_target_box(backbone_feat, sample_pos[scale_ind,:], sample_scales[scale_ind], scale_ind, update_scale_flag)
+                if hasattr(self.net.bb_regressor, 'predict_bb'):
+                    self.direct_box_regression(backbone_feat, sample_pos[scale_ind,:], sample_scales[scale_ind],
+                                               scale_ind, frame['update_scale'])
+                else:
+                    frame['box_proposals'] = self.get_box_proposals(backbone_feat, sample_pos[scale_ind,:],
+                                                                    sample_scales[scale_ind], scale_ind)
             elif self.params.get('use_classifier', True):
                 self.update_state(new_pos, sample_scales[scale_ind])
 
+        return frame
+
+    def update_from_backbone(self, frame: dict, optimize_filter=True) -> dict:
+        """Second part of track_from_backbone: update the target box with the refined proposals, update the model and
+        return the output of the frame."""
+        test_x, sample_coords, sample_pos, sample_scales, scale_ind, s, flag = \
+            [frame[k] for k in ('test_x', 'sample_coords', 'sample_pos', 'sample_scales', 'scale_ind', 's', 'flag')]
+
+        if frame['refined_boxes'] is not None:
+            self.update_box_estimate(*frame['refined_boxes'], sample_pos[scale_ind,:], sample_scales[scale_ind],
+                                     frame['update_scale'])
 
         # ------- UPDATE ------- #
 
@@ -144,7 +237,7 @@ class DiMP(BaseTracker):
             target_box = self.get_iounet_box(self.pos, self.target_sz, sample_pos[scale_ind,:], sample_scales[scale_ind])
 
             # Update the classifier model
-            self.update_classifier(train_x, target_box, learning_rate, s[scale_ind,...])
+            self.update_classifier(train_x, target_box, learning_rate, s[scale_ind,...], optimize_filter)
 
         # Set the pos of the tracker to iounet pos
         if self.params.get('use_iou_net', True) and flag != 'not_found' and hasattr(self, 'pos_iounet'):
@@ -175,6 +268,105 @@ class DiMP(BaseTracker):
         return out
 
 
+    @staticmethod
+    def track_multiple(trackers, image, info: dict = None) -> list:
+        """Track several targets in the same frame, given one initialized DiMP tracker per target. The search patches
+        of all targets are processed in one backbone batch, classified with one grouped convolution and the target
+        filters are optimized in one batched filter optimizer call. The IoUNet box proposals of all targets are refined
+        in one batched box refinement. The batched steps run through the stage methods of the first tracker
+        (extract_backbone, classify_target, optimize_boxes and run_filter_optimizer), such that they are timed by the
+        StageProfiler and the server metrics. Returns the output dict of each tracker."""
+        ims = [tracker.prepare_frame(image, info) for tracker in trackers]
+        patches, sample_coords = zip(*[tracker.sample_search_patches(im) for tracker, im in zip(trackers, ims)])
+
+        # The batching requires the same number and size of search patches for all targets
+        if len(set(p.shape for p in patches)) > 1:
+            backbone_feats = [tracker.extract_backbone(p) for tracker, p in zip(trackers, patches)]
+            return [tracker.track_from_backbone(f, c) for tracker, f, c in zip(trackers, backbone_feats, sample_coords)]
+
+        num_targets = len(trackers)
+        num_scales = patches[0].shape[0]
+
+        backbone_feat = trackers[0].extract_backbone(torch.cat(patches))
+        test_x = trackers[0].get_classification_features(backbone_feat)
+
+        # Classify all targets at once, with the targets in the sequence dimension
+        target_filters = torch.cat([tracker.target_filter for tracker in trackers])
+        test_x_seq = test_x.view(num_targets, num_scales, *test_x.shape[-3:]).transpose(0, 1)
+        scores_raw = trackers[0].classify_target(test_x_seq, target_filters)
+
+        frames = []
+        for i, tracker in enumerate(trackers):
+            patch_ind = slice(i * num_scales, (i + 1) * num_scales)
+            tracker_backbone_feat = OrderedDict((k, v[patch_ind]) for k, v in backbone_feat.items())
+            frames.append(tracker.localize_from_backbone(tracker_backbone_feat, sample_coords[i],
+                                                         test_x=test_x[patch_ind], scores_raw=scores_raw[:, i:i+1]))
+
+        DiMP.refine_boxes_multiple(trackers, frames)
+
+        out = [tracker.update_from_backbone(frame, optimize_filter=False) for tracker, frame in zip(trackers, frames)]
+
+        DiMP.optimize_filters_multiple(trackers)
+        return out
+
+    @staticmethod
+    def refine_boxes_multiple(trackers, frames):
+        """Refine the IoUNet box proposals of several trackers (see localize_from_backbone), in one batched box
+        refinement for all trackers with the same refinement settings and number of proposals."""
+        groups = OrderedDict()
+        for tracker, frame in zip(trackers, frames):
+            if frame['box_proposals'] is None:
+                continue
+            params = tracker.params
+            key = (params.box_refinement_iter, str(params.box_refinement_step_length),
+                   params.box_refinement_step_decay, params.get('box_refinement_space', 'default'),
+                   frame['box_proposals'][1].shape[0])
+            groups.setdefault(key, []).append((tracker, frame))
+
+        for group in groups.values():
+            if len(group) == 1:
+                tracker, frame = group[0]
+                frame['refined_boxes'] = tracker.optimize_boxes(*frame['box_proposals'])
+                continue
+
+            modulation = box_refinement.cat_objects([tracker.iou_modulation for tracker, _ in group])
+            iou_features = box_refinement.cat_objects([frame['box_proposals'][0] for _, frame in group])
+            init_boxes = torch.stack([frame['box_proposals'][1] for _, frame in group])
+            output_boxes, output_iou = group[0][0].optimize_boxes(iou_features, init_boxes, modulation)
+
+            for i, (_, frame) in enumerate(group):
+                frame['refined_boxes'] = (output_boxes[i], output_iou[i])
+
+    @staticmethod
+    def optimize_filters_multiple(trackers):
+        """Run the pending filter optimization (see update_classifier) of several trackers, in one batched filter
+        optimizer call for all trackers with the same number of iterations. Memory slots beyond the number of stored
+        samples of a tracker have zero weight, so the sample memories are stacked up to the largest sample count."""
+        groups = OrderedDict()
+        for tracker in trackers:
+            num_iter = getattr(tracker, 'pending_filter_iter', 0)
+            tracker.pending_filter_iter = 0
+            if num_iter > 0:
+                groups.setdefault(num_iter, []).append(tracker)
+
+        for num_iter, group in groups.items():
+            if len(group) == 1:
+                group[0].optimize_filter(num_iter)
+                continue
+
+            num_samples = max(tracker.sample_memory.num_stored for tracker in group)
+            memories = [tracker.sample_memory for tracker in group]
+            samples = torch.stack([m.buffers['samples'][:num_samples,...] for m in memories], dim=1)
+            target_boxes = torch.stack([m.buffers['target_boxes'][:num_samples,:] for m in memories], dim=1)
+            sample_weights = torch.stack([m.weights[:num_samples] for m in memories], dim=1)
+            target_filters = torch.cat([t.target_filter for t in group])
+
+            target_filters, _ = group[0].run_filter_optimizer(target_filters, num_iter, samples, target_boxes,
+                                                              sample_weights)
+
+            for i, tracker in enumerate(group):
+                tracker.target_filter = target_filters[i:i+1]
+
     def get_sample_location(self, sample_coord):
         """Get the location of the extracted sample."""
         sample_coord = sample_coord.float()
@@ -187,10 +379,13 @@ class DiMP(BaseTracker):
         return self.pos + ((self.feature_sz + self.kernel_size) % 2) * self.target_scale * \
                self.img_support_sz / (2*self.feature_sz)
 
-    def classify_target(self, sample_x: TensorList):
-        """Classify target by applying the DiMP filter."""
+    def classify_target(self, sample_x: TensorList, target_filter=None):
+        """Classify target by applying the DiMP filter. Another filter (e.g. the filters of several trackers, see
+        track_multiple) can be given."""
+        if target_filter is None:
+            target_filter = self.target_filter
         with torch.no_grad():
-            scores = self.net.classifier.classify(self.target_filter, sample_x)
+            scores = self.net.classifier.classify(target_filter, sample_x)
         return scores
 
     def localize_target(self, scores, sample_pos, sample_scales):
@@ -302,14 +497,76 @@ class DiMP(BaseTracker):
 
         return translation_vec1, scale_ind, scores_hn, 'normal'
 
-    def extract_backbone_features(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
+    def sample_patches(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
+        image_offset = getattr(self, 'image_offset', None)
+        if image_offset is not None and self.params.get('border_mode', 'replicate') != 'replicate':
+            # The crop is shrunk and shifted with respect to the full image, so place the region in a full size image
+            full_im = im.new_zeros(im.shape[0], im.shape[1], int(self.image_sz[0].item()), int(self.image_sz[1].item()))
+            y, x = int(image_offset[0].item()), int(image_offset[1].item())
+            full_im[..., y:y + im.shape[2], x:x + im.shape[3]] = im
+            im, image_offset = full_im, None
+
+        if image_offset is not None:
+            pos = pos - image_offset
+
         im_patches, patch_coords = sample_patch_multiscale(im, pos, scales, sz,
                                                            mode=self.params.get('border_mode', 'replicate'),
-                                                           max_scale_change=self.params.get('patch_max_scale_change', None))
-        with torch.no_grad():
-            backbone_feat = self.net.extract_backbone(im_patches)
+                                                           max_scale_change=self.params.get('patch_max_scale_change', None),
+                                                           use_grid_sample=self.params.get('use_grid_sample_crop', False))
+
+        if image_offset is not None:
+            patch_coords = patch_coords + image_offset.repeat(2).view(1, 4).to(patch_coords.dtype)
+        return im_patches, patch_coords
+
+    def get_next_search_region(self, margin=16):
+        """Get the image region [x, y, w, h] that the search patches of the next frame will be sampled from, given the
+        current target state. Only this part of the next frame is needed in track() (see prepare_frame). The margin
+        covers the rounding in sample_patch. For the 'inside' and 'inside_major' border modes, this is the union of the
+        crops after shrinking and shifting them inside the full image, and sample_patches places the received region
+        in a full size image so that the crops are computed as for the full frame."""
+        mode = self.params.get('border_mode', 'replicate')
+        if mode != 'replicate':
+            # The crops are shrunk and shifted inside the image, take the union of the actual crops
+            im_shape = (1, 3, int(self.image_sz[0].item()), int(self.image_sz[1].item()))
+            pos = self.get_centered_sample_pos()
+            tl, br = self.image_sz.clone(), torch.zeros(2)
+            for scale in self.target_scale * self.params.scale_factors:
+                df, os, crop_tl, crop_br = _sample_patch_coords(im_shape, pos, scale * self.img_sample_sz,
+                                                                self.img_sample_sz, mode,
+                                                                self.params.get('patch_max_scale_change', None))
+                tl = torch.min(tl, os.float() + df * crop_tl.float())
+                br = torch.max(br, os.float() + df * crop_br.float())
+            tl = (tl - margin).floor().clamp(min=0)
+            br = torch.min((br + margin).ceil(), self.image_sz)
+            return [int(tl[1].item()), int(tl[0].item()), int((br[1] - tl[1]).item()), int((br[0] - tl[0]).item())]
+
+        max_scale = (self.target_scale * self.params.scale_factors).max()
+        margin = margin + 2 * math.ceil(max_scale.item())
+        pos = self.get_centered_sample_pos()
+        sample_sz = self.img_sample_sz * max_scale
+
+        tl = (pos - sample_sz / 2 - margin).floor().clamp(min=0)
+        br = torch.min((pos + sample_sz / 2 + margin).ceil(), self.image_sz)
+        return [int(tl[1].item()), int(tl[0].item()), int((br[1] - tl[1]).item()), int((br[0] - tl[0]).item())]
+
+    def extract_backbone_features(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
+        im_patches, patch_coords = self.sample_patches(im, pos, scales, sz)
+        backbone_feat = self.extract_backbone(im_patches)
         return backbone_feat, patch_coords, im_patches
 
+    def extract_backbone(self, im_patches: torch.Tensor):
+        """Extract the backbone features of the image patches."""
+        with torch.no_grad():
+            return self.net.extract_backbone(im_patches)
+
+    def extract_features_and_scores(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
+        """Extract the backbone and classification features and the classification scores with the compiled
+        inference (see init_compiled_inference)."""
+        im_patches, patch_coords = self.sample_patches(im, pos, scales, sz)
+        im_patches = self.net.preprocess_image(im_patches, reuse_buffer=True)
+        backbone_feat, test_x, scores = self.compiled_inference(im_patches, self.target_filter)
+        return backbone_feat, patch_coords, test_x, scores
+
     def get_classification_features(self, backbone_feat):
         with torch.no_grad():
             return self.net.extract_classification_feat(backbone_feat)
@@ -403,85 +660,17 @@ class DiMP(BaseTracker):
         for T in self.transforms:
             init_target_boxes.append(self.classifier_target_box + torch.Tensor([T.shift[1], T.shift[0], 0, 0]))
         init_target_boxes = torch.cat(init_target_boxes.view(1, 4), 0).to(self.params.device)
-        self.target_boxes = init_target_boxes.new_zeros(self.params.sample_memory_size, 4)
-        self.target_boxes[:init_target_boxes.shape[0],:] = init_target_boxes
         return init_target_boxes
 
-    def init_memory(self, train_x: TensorList):
-        # Initialize first-frame spatial training samples
-        self.num_init_samples = train_x.size(0)
-        init_sample_weights = TensorList([x.new_ones(1) / x.shape[0] for x in train_x])
-
-        # Sample counters and weights for spatial
-        self.num_stored_samples = self.num_init_samples.copy()
-        self.previous_replace_ind = [None] * len(self.num_stored_samples)
-        self.sample_weights = TensorList([x.new_zeros(self.params.sample_memory_size) for x in train_x])
-        for sw, init_sw, num in zip(self.sample_weights, init_sample_weights, self.num_init_samples):
-            sw[:num] = init_sw
-
-        # Initialize memory
-        self.training_samples = TensorList(
-            [x.new_zeros(self.params.sample_memory_size, x.shape[1], x.shape[2], x.shape[3]) for x in train_x])
-
-        for ts, x in zip(self.training_samples, train_x):
-            ts[:x.shape[0],...] = x
-
+    def init_memory(self, train_x: TensorList, target_boxes):
+        """Initialize the sample memory with the first-frame spatial training samples and their target boxes."""
+        self.sample_memory = SampleMemory(self.params.sample_memory_size, self.params.learning_rate,
+                                          self.params.get('init_samples_minimum_weight', None))
+        self.sample_memory.initialize({'samples': train_x[0], 'target_boxes': target_boxes})
 
     def update_memory(self, sample_x: TensorList, target_box, learning_rate = None):
-        # Update weights and get replace ind
-        replace_ind = self.update_sample_weights(self.sample_weights, self.previous_replace_ind, self.num_stored_samples, self.num_init_samples, learning_rate)
-        self.previous_replace_ind = replace_ind
-
-        # Update sample and label memory
-        for train_samp, x, ind in zip(self.training_samples, sample_x, replace_ind):
-            train_samp[ind:ind+1,...] = x
-
-        # Update bb memory
-        self.target_boxes[replace_ind[0],:] = target_box
-
-        self.num_stored_samples += 1
-
-
-    def update_sample_weights(self, sample_weights, previous_replace_ind, num_stored_samples, num_init_samples, learning_rate = None):
-        # Update weights and get index to replace
-        replace_ind = []
-        for sw, prev_ind, num_samp, num_init in zip(sample_weights, previous_replace_ind, num_stored_samples, num_init_samples):
-            lr = learning_rate
-            if lr is None:
-                lr = self.params.learning_rate
-
-            init_samp_weight = self.params.get('init_samples_minimum_weight', None)
-            if init_samp_weight == 0:
-                init_samp_weight = None
-            s_ind = 0 if init_samp_weight is None else num_init
-
-            if num_samp == 0 or lr == 1:
-                sw[:] = 0
-                sw[0] = 1
-                r_ind = 0
-            else:
-                # Get index to replace
-                if num_samp < sw.shape[0]:
-                    r_ind = num_samp
-                else:
-                    _, r_ind = torch.min(sw[s_ind:], 0)
-                    r_ind = r_ind.item() + s_ind
-
-                # Update weights
-                if prev_ind is None:
-                    sw /= 1 - lr
-                    sw[r_ind] = lr
-                else:
-                    sw[r_ind] = sw[prev_ind] / (1 - lr)
-
-            sw /= sw.sum()
-            if init_samp_weight is not None and sw[:num_init].sum() < init_samp_weight:
-                sw /= init_samp_weight + sw[num_init:].sum()
-                sw[:num_init] = init_samp_weight / num_init
-
-            replace_ind.append(r_ind)
-
-        return replace_ind
+        """Insert the sample and its target box in the memory and update the sample weights."""
+        self.sample_memory.update({'samples': sample_x[0], 'target_boxes': target_box}, learning_rate)
 
     def update_state(self, new_pos, new_scale = None):
         # Update scale
@@ -575,7 +764,7 @@ class DiMP(BaseTracker):
 
         # Init memory
         if self.params.get('update_classifier', True):
-            self.init_memory(TensorList([x]))
+            self.init_memory(TensorList([x]), target_boxes)
 
         if plot_loss:
             if isinstance(losses, dict):
@@ -602,7 +791,7 @@ class DiMP(BaseTracker):
             self.net.classifier.filter_initializer = FilterInitializerZero(self.net.classifier.filter_size, feature_dim)
 
 
-    def update_classifier(self, train_x, target_box, learning_rate=None, scores=None):
+    def update_classifier(self, train_x, target_box, learning_rate=None, scores=None, optimize_filter=True):
         # Set flags and learning rate
         hard_negative_flag = learning_rate is not None
         if learning_rate is None:
@@ -622,21 +811,27 @@ class DiMP(BaseTracker):
         elif (self.frame_num - 1) % self.params.train_skipping == 0:
             num_iter = self.params.get('net_opt_update_iter', None)
 
+        if not optimize_filter:
+            # The optimization is run later, batched over several trackers
+            self.pending_filter_iter = num_iter
+            return
+
+        if num_iter > 0:
+            self.optimize_filter(num_iter)
+
+    def optimize_filter(self, num_iter):
+        """Run the DiMP filter optimizer on the samples in memory."""
         plot_loss = self.params.debug > 0
 
         if num_iter > 0:
             # Get inputs for the DiMP filter optimizer module
-            samples = self.training_samples[0][:self.num_stored_samples[0],...]
-            target_boxes = self.target_boxes[:self.num_stored_samples[0],:].clone()
-            sample_weights = self.sample_weights[0][:self.num_stored_samples[0]]
+            samples = self.sample_memory['samples']
+            target_boxes = self.sample_memory['target_boxes']
+            sample_weights = self.sample_memory.sample_weights
 
             # Run the filter optimizer module
-            with torch.no_grad():
-                self.target_filter, _, losses = self.net.classifier.filter_optimizer(self.target_filter,
-                                                                                     num_iter=num_iter, feat=samples,
-                                                                                     bb=target_boxes,
-                                                                                     sample_weight=sample_weights,
-                                                                                     compute_losses=plot_loss)
+            self.target_filter, losses = self.run_filter_optimizer(self.target_filter, num_iter, samples, target_boxes,
+                                                                   sample_weights, compute_losses=plot_loss)
 
             if plot_loss:
                 if isinstance(losses, dict):
@@ -647,12 +842,32 @@ class DiMP(BaseTracker):
                 elif self.params.debug >= 3:
                     plot_graph(self.losses, 10, title='Training Loss' + self.id_str)
 
+    def run_filter_optimizer(self, target_filter, num_iter, samples, target_boxes, sample_weights,
+                             compute_losses=False):
+        """Run the DiMP filter optimizer module. Returns the optimized filter and the losses."""
+        with torch.no_grad():
+            target_filter, _, losses = self.net.classifier.filter_optimizer(target_filter, num_iter=num_iter,
+                                                                            feat=samples, bb=target_boxes,
+                                                                            sample_weight=sample_weights,
+                                                                            compute_losses=compute_losses)
+        return target_filter, losses
+
     def refine_target_box(self, backbone_feat, sample_pos, sample_scale, scale_ind, update_scale = True):
         """Run the ATOM IoUNet to refine the target bounding box."""
 
         if hasattr(self.net.bb_regressor, 'predict_bb'):
             return self.direct_box_regression(backbone_feat, sample_pos, sample_scale, scale_ind, update_scale)
 
+        iou_features, init_boxes = self.get_box_proposals(backbone_feat, sample_pos, sample_scale, scale_ind)
+
+        # Optimize the boxes
+        output_boxes, output_iou = self.optimize_boxes(iou_features, init_boxes)
+
+        self.update_box_estimate(output_boxes, output_iou, sample_pos, sample_scale, update_scale)
+
+    def get_box_proposals(self, backbone_feat, sample_pos, sample_scale, scale_ind):
+        """Get the IoU features of the given scale and the initial boxes for the IoUNet refinement."""
+
         # Initial box for refinement
         init_box = self.get_iounet_box(self.pos, self.target_sz, sample_pos, sample_scale)
 
@@ -673,8 +888,10 @@ class DiMP(BaseTracker):
             init_boxes = torch.cat([new_center - new_sz/2, new_sz], 1)
             init_boxes = torch.cat([init_box.view(1,4), init_boxes])
 
-        # Optimize the boxes
-        output_boxes, output_iou = self.optimize_boxes(iou_features, init_boxes)
+        return iou_features, init_boxes
+
+    def update_box_estimate(self, output_boxes, output_iou, sample_pos, sample_scale, update_scale = True):
+        """Update the target position and size with the refined IoUNet boxes."""
 
         # Remove weird boxes
         output_boxes[:, 2:].clamp_(1)
@@ -713,79 +930,18 @@ class DiMP(BaseTracker):
         # self.visualize_iou_pred(iou_features, predicted_box)
 
 
-    def optimize_boxes(self, iou_features, init_boxes):
-        box_refinement_space = self.params.get('box_refinement_space', 'default')
-        if box_refinement_space == 'default':
-            return self.optimize_boxes_default(iou_features, init_boxes)
-        if box_refinement_space == 'relative':
-            return self.optimize_boxes_relative(iou_features, init_boxes)
-        raise ValueError('Unknown box_refinement_space {}'.format(box_refinement_space))
-
-
-    def optimize_boxes_default(self, iou_features, init_boxes):
-        """Optimize iounet boxes with the default parametrization"""
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]], device=self.params.device).view(1,1,4)
-
-        for i_ in range(self.params.box_refinement_iter):
-            # forward pass
-            bb_init = output_boxes.clone().detach()
-            bb_init.requires_grad = True
-
-            outputs = self.net.bb_regressor.predict_iou(self.iou_modulation, iou_features, bb_init)
-
-            if isinstance(outputs, (list, tuple)):
-                outputs = outputs[0]
-
-            outputs.backward(gradient = torch.ones_like(outputs))
-
-            # Update proposal
-            output_boxes = bb_init + step_length * bb_init.grad * bb_init[:, :, 2:].repeat(1, 1, 2)
-            output_boxes.detach_()
-
-            step_length *= self.params.box_refinement_step_decay
-
-        return output_boxes.view(-1,4).cpu(), outputs.detach().view(-1).cpu()
-
-
-    def optimize_boxes_relative(self, iou_features, init_boxes):
-        """Optimize iounet boxes with the relative parametrization ised in PrDiMP"""
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]]).to(self.params.device).view(1,1,4)
-
-        sz_norm = output_boxes[:,:1,2:].clone()
-        output_boxes_rel = bbutils.rect_to_rel(output_boxes, sz_norm)
-        for i_ in range(self.params.box_refinement_iter):
-            # forward pass
-            bb_init_rel = output_boxes_rel.clone().detach()
-            bb_init_rel.requires_grad = True
-
-            bb_init = bbutils.rel_to_rect(bb_init_rel, sz_norm)
-            outputs = self.net.bb_regressor.predict_iou(self.iou_modulation, iou_features, bb_init)
-
-            if isinstance(outputs, (list, tuple)):
-                outputs = outputs[0]
-
-            outputs.backward(gradient = torch.ones_like(outputs))
-
-            # Update proposal
-            output_boxes_rel = bb_init_rel + step_length * bb_init_rel.grad
-            output_boxes_rel.detach_()
-
-            step_length *= self.params.box_refinement_step_decay
-
-        #     for s in outputs.view(-1):
-        #         print('{:.2f}  '.format(s.item()), end='')
-        #     print('')
-        # print('')
-
-        output_boxes = bbutils.rel_to_rect(output_boxes_rel, sz_norm)
-
-        return output_boxes.view(-1,4).cpu(), outputs.detach().view(-1).cpu()
+    def optimize_boxes(self, iou_features, init_boxes, modulation=None):
+        """Optimize the iounet boxes (see pytracking.libs.box_refinement). The target modulation defaults to the one
+        of this tracker."""
+        if modulation is None:
+            modulation = self.iou_modulation
+        output_boxes, output_iou = box_refinement.optimize_boxes(self.net.bb_regressor.predict_iou, modulation,
+                                                                 iou_features, init_boxes.to(self.params.device),
+                                                                 self.params.box_refinement_iter,
+                                                                 self.params.box_refinement_step_length,
+                                                                 self.params.box_refinement_step_decay,
+                                                                 self.params.get('box_refinement_space', 'default'))
+        return output_boxes.cpu(), output_iou.cpu()
 
     def direct_box_regression(self, backbone_feat, sample_pos, sample_scale, scale_ind, update_scale = True):
         """Implementation of direct bounding box regression."""
@@ -4,6 +4,7 @@ import torch.nn.functional as F
 import math
 import time
 from pytracking import dcf, TensorList
+from pytracking.libs import box_refinement
 from pytracking.features.preprocessing import numpy_to_torch
 from pytracking.utils.plotting import show_tensor, plot_graph
 from pytracking.features.preprocessing import sample_patch_multiscale, sample_patch_transformed
@@ -311,7 +312,8 @@ class DiMPSimple(BaseTracker):
     def extract_backbone_features(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
         im_patches, patch_coords = sample_patch_multiscale(im, pos, scales, sz,
                                                            mode=self.params.get('border_mode', 'replicate'),
-                                                           max_scale_change=self.params.get('patch_max_scale_change', None))
+                                                           max_scale_change=self.params.get('patch_max_scale_change', None),
+                                                           use_grid_sample=self.params.get('use_grid_sample_crop', False))
         with torch.no_grad():
             backbone_feat = self.net.extract_backbone(im_patches)
         return backbone_feat, patch_coords, im_patches
@@ -764,79 +766,18 @@ class DiMPSimple(BaseTracker):
         # self.visualize_iou_pred(iou_features, predicted_box)
 
 
-    def optimize_boxes(self, iou_features, init_boxes):
-        box_refinement_space = self.params.get('box_refinement_space', 'default')
-        if box_refinement_space == 'default':
-            return self.optimize_boxes_default(iou_features, init_boxes)
-        if box_refinement_space == 'relative':
-            return self.optimize_boxes_relative(iou_features, init_boxes)
-        raise ValueError('Unknown box_refinement_space {}'.format(box_refinement_space))
-
-
-    def optimize_boxes_default(self, iou_features, init_boxes):
-        """Optimize iounet boxes with the default parametrization"""
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]], device=self.params.device).view(1,1,4)
-
-        for i_ in range(self.params.box_refinement_iter):
-            # forward pass
-            bb_init = output_boxes.clone().detach()
-            bb_init.requires_grad = True
-
-            outputs = self.net.bb_regressor.predict_iou(self.iou_modulation, iou_features, bb_init)
-
-            if isinstance(outputs, (list, tuple)):
-                outputs = outputs[0]
-
-            outputs.backward(gradient = torch.ones_like(outputs))
-
-            # Update proposal
-            output_boxes = bb_init + step_length * bb_init.grad * bb_init[:, :, 2:].repeat(1, 1, 2)
-            output_boxes.detach_()
-
-            step_length *= self.params.box_refinement_step_decay
-
-        return output_boxes.view(-1,4).cpu(), outputs.detach().view(-1).cpu()
-
-
-    def optimize_boxes_relative(self, iou_features, init_boxes):
-        """Optimize iounet boxes with the relative parametrization ised in PrDiMP"""
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]]).to(self.params.device).view(1,1,4)
-
-        sz_norm = output_boxes[:,:1,2:].clone()
-        output_boxes_rel = bbutils.rect_to_rel(output_boxes, sz_norm)
-        for i_ in range(self.params.box_refinement_iter):
-            # forward pass
-            bb_init_rel = output_boxes_rel.clone().detach()
-            bb_init_rel.requires_grad = True
-
-            bb_init = bbutils.rel_to_rect(bb_init_rel, sz_norm)
-            outputs = self.net.bb_regressor.predict_iou(self.iou_modulation, iou_features, bb_init)
-
-            if isinstance(outputs, (list, tuple)):
-                outputs = outputs[0]
-
-            outputs.backward(gradient = torch.ones_like(outputs))
-
-            # Update proposal
-            output_boxes_rel = bb_init_rel + step_length * bb_init_rel.grad
-            output_boxes_rel.detach_()
-
-            step_length *= self.params.box_refinement_step_decay
-
-        #     for s in outputs.view(-1):
-        #         print('{:.2f}  '.format(s.item()), end='')
-        #     print('')
-        # print('')
-
-        output_boxes = bbutils.rel_to_rect(output_boxes_rel, sz_norm)
-
-        return output_boxes.view(-1,4).cpu(), outputs.detach().view(-1).cpu()
+    def optimize_boxes(self, iou_features, init_boxes, modulation=None):
+        """Optimize the iounet boxes (see pytracking.libs.box_refinement). The target modulation defaults to the one
+        of this tracker."""
+        if modulation is None:
+            modulation = self.iou_modulation
+        output_boxes, output_iou = box_refinement.optimize_boxes(self.net.bb_regressor.predict_iou, modulation,
+                                                                 iou_features, init_boxes.to(self.params.device),
+                                                                 self.params.box_refinement_iter,
+                                                                 self.params.box_refinement_step_length,
+                                                                 self.params.box_refinement_step_decay,
+                                                                 self.params.get('box_refinement_space', 'default'))
+        return output_boxes.cpu(), output_iou.cpu()
 
     def direct_box_regression(self, backbone_feat, sample_pos, sample_scale, scale_ind, update_scale = True):
         """Implementation of direct bounding box regression."""
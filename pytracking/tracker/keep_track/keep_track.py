@@ -4,11 +4,12 @@ import torch.nn.functional as F
 import math
 import time
 from pytracking import dcf, TensorList
+from pytracking.libs import box_refinement
+from pytracking.libs.sample_memory import SampleMemory
 from pytracking.features.preprocessing import numpy_to_torch
 from pytracking.utils.plotting import show_tensor, plot_graph
 from pytracking.features.preprocessing import sample_patch_multiscale, sample_patch_transformed
 from pytracking.features import augmentation
-import ltr.data.bounding_box_utils as bbutils
 from ltr.models.target_classifier.initializer import FilterInitializerZero
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
@@ -108,8 +109,6 @@ class KeepTrack(BaseTracker):
         self.target_scales = []
         self.target_not_found_counter = 0
 
-        self.mem_sort_indices = torch.arange(0, self.num_init_samples[0])
-
         out = {'time': time.time() - tic}
         return out
 
@@ -478,7 +477,8 @@ class KeepTrack(BaseTracker):
     def extract_backbone_features(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
         im_patches, patch_coords = sample_patch_multiscale(im, pos, scales, sz,
                                                            mode=self.params.get('border_mode', 'replicate'),
-                                                           max_scale_change=self.params.get('patch_max_scale_change', None))
+                                                           max_scale_change=self.params.get('patch_max_scale_change', None),
+                                                           use_grid_sample=self.params.get('use_grid_sample_crop', False))
         with torch.no_grad():
             backbone_feat = self.net.extract_backbone(im_patches)
         return backbone_feat, patch_coords, im_patches
@@ -570,8 +570,7 @@ class KeepTrack(BaseTracker):
 
     def init_target_label_certainties(self, train_x: TensorList):
         num_train_samples = train_x[0].shape[0]
-        self.target_label_certainties = train_x[0].new_zeros(self.params.sample_memory_size, 1, 1, 1)
-        self.target_label_certainties[:num_train_samples] = 1.
+        return train_x[0].new_ones(num_train_samples, 1, 1, 1)
 
     def init_target_boxes(self):
         """Get the target bounding boxes for the initial augmented samples."""
@@ -580,13 +579,10 @@ class KeepTrack(BaseTracker):
         for T in self.transforms:
             init_target_boxes.append(self.classifier_target_box + torch.Tensor([T.shift[1], T.shift[0], 0, 0]))
         init_target_boxes = torch.cat(init_target_boxes.view(1, 4), 0).to(self.params.device)
-
-        self.target_boxes = init_target_boxes.new_zeros(self.params.sample_memory_size, 4)
-        self.target_boxes[:init_target_boxes.shape[0],:] = init_target_boxes
         return init_target_boxes
 
     def init_target_labels(self, train_x: TensorList):
-        self.target_labels = TensorList([x.new_zeros(self.params.sample_memory_size, 1,
+        target_labels = TensorList([x.new_zeros(x.shape[0], 1,
                                                      x.shape[2] + (int(self.kernel_size[0].item()) + 1) % 2,
                                                      x.shape[3] + (int(self.kernel_size[1].item()) + 1) % 2)
                                          for x in train_x])
@@ -597,115 +593,49 @@ class KeepTrack(BaseTracker):
         # Center pos in normalized img_coords
         target_center_norm = (self.pos - self.init_sample_pos) / (self.init_sample_scale * self.img_support_sz)
 
-        for target, x in zip(self.target_labels, train_x):
+        for target, x in zip(target_labels, train_x):
             ksz_even = torch.Tensor([(self.kernel_size[0] + 1) % 2, (self.kernel_size[1] + 1) % 2])
             center_pos = self.feature_sz * target_center_norm + 0.5 * ksz_even
             for i, T in enumerate(self.transforms[:x.shape[0]]):
                 sample_center = center_pos + torch.Tensor(T.shift) / self.img_support_sz * self.feature_sz
                 target[i, 0, ...] = dcf.label_function_spatial(self.feature_sz, self.sigma, sample_center, end_pad=ksz_even)
 
-        return self.target_labels[0][:train_x[0].shape[0]]
+        return target_labels[0]
 
-    def init_memory(self, train_x: TensorList):
-        # Initialize first-frame spatial training samples
-        self.num_init_samples = train_x.size(0)
-        init_sample_weights = TensorList([x.new_ones(1) / x.shape[0] for x in train_x])
+    def init_memory(self, train_x: TensorList, target_labels, target_boxes, target_label_certainties):
+        """Initialize the sample memory with the first-frame spatial training samples, labels, target boxes and
+        label certainties."""
+        self.sample_memory = SampleMemory(self.params.sample_memory_size, self.params.learning_rate,
+                                          self.params.get('init_samples_minimum_weight', None),
+                                          keep_weight_on_same_index=True)
+        self.sample_memory.initialize({'samples': train_x[0], 'target_labels': target_labels,
+                                       'target_boxes': target_boxes,
+                                       'target_label_certainties': target_label_certainties})
 
-        # Sample counters and weights for spatial
-        self.num_stored_samples = self.num_init_samples.copy()
-        self.previous_replace_ind = [None] * len(self.num_stored_samples)
-        self.sample_weights = TensorList([x.new_zeros(self.params.sample_memory_size) for x in train_x])
-        for sw, init_sw, num in zip(self.sample_weights, init_sample_weights, self.num_init_samples):
-            sw[:num] = init_sw
+        # Insertion time of the stored samples, see mem_sort_indices
+        self.mem_time_stamps = target_boxes.new_zeros(self.params.sample_memory_size)
+        self.mem_time_stamps[:self.sample_memory.num_init] = torch.arange(self.sample_memory.num_init)
+        self.mem_num_inserted = self.sample_memory.num_init
 
-        # Initialize memory
-        self.training_samples = TensorList(
-            [x.new_zeros(self.params.sample_memory_size, x.shape[1], x.shape[2], x.shape[3]) for x in train_x])
-
-        for ts, x in zip(self.training_samples, train_x):
-            ts[:x.shape[0],...] = x
+    @property
+    def mem_sort_indices(self):
+        """Indices of the stored samples, sorted from the oldest to the most recently inserted one."""
+        return torch.argsort(self.mem_time_stamps[:self.sample_memory.num_stored])
 
     def update_memory(self, sample_x: TensorList, sample_y: TensorList, target_box, learning_rate=None, target_label_certainty=None):
-        # Update weights and get replace ind
         if (self.candidate_collection is None or self.candidate_collection.object_id_of_selected_candidate == 0):
             target_label_certainty = torch.max(target_label_certainty, torch.sqrt(target_label_certainty.clone().detach()))
 
-        certainties = [self.target_label_certainties.view(-1) * self.sample_weights[0].view(-1)]
-
-        replace_ind = self.update_sample_weights_based_on_certainty(certainties, self.sample_weights,
-                                                                    self.previous_replace_ind, self.num_stored_samples,
-                                                                    self.num_init_samples, learning_rate)
-
-        self.previous_replace_ind = replace_ind
-
-        # Update sample and label memory
-        for train_samp, x, ind in zip(self.training_samples, sample_x, replace_ind):
-            train_samp[ind:ind+1,...] = x
-
-        for y_memory, y, ind in zip(self.target_labels, sample_y, replace_ind):
-            y_memory[ind:ind+1,...] = y
+        # Replace the sample with the lowest certainty weighted by its sample weight
+        memory = self.sample_memory
+        replace_score = memory.buffers['target_label_certainties'].view(-1) * memory.weights
 
-        # Update target label certainties memory
+        replace_ind = memory.update({'samples': sample_x[0], 'target_labels': sample_y[0], 'target_boxes': target_box,
+                                     'target_label_certainties': target_label_certainty},
+                                    learning_rate, replace_score=replace_score)
 
-        self.target_label_certainties[replace_ind[0]] = target_label_certainty
-
-        # Update bb memory
-        self.target_boxes[replace_ind[0],:] = target_box
-
-        if replace_ind[0] >= len(self.mem_sort_indices):
-            self.mem_sort_indices = torch.cat([self.mem_sort_indices, torch.zeros(1, dtype=torch.long)])
-            self.mem_sort_indices[replace_ind[0]] = torch.max(self.mem_sort_indices) + 1
-        else:
-            idx = torch.nonzero(self.mem_sort_indices == replace_ind[0])
-            mem_temp = self.mem_sort_indices.clone()
-            mem_temp[idx:-1] = self.mem_sort_indices[idx+1:]
-            mem_temp[-1] = replace_ind[0]
-            self.mem_sort_indices = mem_temp
-
-        self.num_stored_samples += 1
-
-    def update_sample_weights_based_on_certainty(self, certainties, sample_weights, previous_replace_ind, num_stored_samples, num_init_samples, learning_rate=None):
-        # Update weights and get index to replace
-        replace_ind = []
-        for cert, sw, prev_ind, num_samp, num_init in zip(certainties, sample_weights, previous_replace_ind, num_stored_samples, num_init_samples):
-            lr = learning_rate
-            if lr is None:
-                lr = self.params.learning_rate
-
-            init_samp_weight = self.params.get('init_samples_minimum_weight', None)
-            if init_samp_weight == 0:
-                init_samp_weight = None
-            s_ind = 0 if init_samp_weight is None else num_init
-
-            if num_samp == 0 or lr == 1:
-                sw[:] = 0
-                sw[0] = 1
-                r_ind = 0
-            else:
-                # Get index to replace
-                if num_samp < sw.shape[0]:
-                    r_ind = num_samp
-                else:
-                    _, r_ind = torch.min(cert[s_ind:], 0)
-                    r_ind = r_ind.item() + s_ind
-
-                # Update weights
-                if prev_ind is None:
-                    sw /= 1 - lr
-                    sw[r_ind] = lr
-                elif r_ind == prev_ind:
-                    pass
-                else:
-                    sw[r_ind] = sw[prev_ind] / (1 - lr)
-
-            sw /= sw.sum()
-            if init_samp_weight is not None and sw[:num_init].sum() < init_samp_weight:
-                sw /= init_samp_weight + sw[num_init:].sum()
-                sw[:num_init] = init_samp_weight / num_init
-
-            replace_ind.append(r_ind)
-
-        return replace_ind
+        self.mem_time_stamps.index_fill_(0, replace_ind, self.mem_num_inserted)
+        self.mem_num_inserted += 1
 
     def get_label_function(self, pos, sample_pos, sample_scale):
         train_y = TensorList()
@@ -820,7 +750,7 @@ class KeepTrack(BaseTracker):
         target_labels = self.init_target_labels(TensorList([x]))
 
         # Init target label certainties, init gth samples as 1.0
-        self.init_target_label_certainties(TensorList([x]))
+        target_label_certainties = self.init_target_label_certainties(TensorList([x]))
 
         # Set number of iterations
         plot_loss = self.params.debug > 0
@@ -836,7 +766,7 @@ class KeepTrack(BaseTracker):
 
         # Init memory
         if self.params.get('update_classifier', True):
-            self.init_memory(TensorList([x]))
+            self.init_memory(TensorList([x]), target_labels, target_boxes, target_label_certainties)
 
         if plot_loss:
             if isinstance(losses, dict):
@@ -885,10 +815,10 @@ class KeepTrack(BaseTracker):
 
         # Compute sample weights either fully on age or mix with correctness certainty of target lables.
         # Supress memory sample if certainty is below certain threshold.
-        sample_weights = self.sample_weights[0][:self.num_stored_samples[0]].view(-1, 1, 1, 1)
+        sample_weights = self.sample_memory.sample_weights.view(-1, 1, 1, 1)
 
         if self.params.get('use_certainty_for_weight_computation', False):
-            target_label_certainties = self.target_label_certainties[:self.num_stored_samples[0]].view(-1, 1, 1, 1)
+            target_label_certainties = self.sample_memory['target_label_certainties']
 
             ths_cert = self.params.get('certainty_for_weight_computation_ths', 0.5)
             weights = target_label_certainties
@@ -900,9 +830,9 @@ class KeepTrack(BaseTracker):
 
         if num_iter > 0:
             # Get inputs for the DiMP filter optimizer module
-            samples = self.training_samples[0][:self.num_stored_samples[0],...]
-            target_labels = self.target_labels[0][:self.num_stored_samples[0],...]
-            target_boxes = self.target_boxes[:self.num_stored_samples[0],:].clone()
+            samples = self.sample_memory['samples']
+            target_labels = self.sample_memory['target_labels']
+            target_boxes = self.sample_memory['target_boxes']
 
             self.net.classifier.compute_losses = plot_loss
 
@@ -990,72 +920,18 @@ class KeepTrack(BaseTracker):
         if update_scale:
             self.target_scale = new_scale
 
-    def optimize_boxes(self, iou_features, init_boxes):
-        box_refinement_space = self.params.get('box_refinement_space', 'default')
-        if box_refinement_space == 'default':
-            return self.optimize_boxes_default(iou_features, init_boxes)
-        if box_refinement_space == 'relative':
-            return self.optimize_boxes_relative(iou_features, init_boxes)
-        raise ValueError('Unknown box_refinement_space {}'.format(box_refinement_space))
-
-    def optimize_boxes_default(self, iou_features, init_boxes):
-        # Optimize iounet boxes
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]], device=self.params.device).view(1,1,4)
-
-        for i_ in range(self.params.box_refinement_iter):
-            # forward pass
-            bb_init = output_boxes.clone().detach()
-            bb_init.requires_grad = True
-
-            outputs = self.net.bb_regressor.predict_iou(self.iou_modulation, iou_features, bb_init)
-
-            if isinstance(outputs, (list, tuple)):
-                outputs = outputs[0]
-
-            outputs.backward(gradient = torch.ones_like(outputs))
-
-            # Update proposal
-            output_boxes = bb_init + step_length * bb_init.grad * bb_init[:, :, 2:].repeat(1, 1, 2)
-            output_boxes.detach_()
-
-            step_length *= self.params.box_refinement_step_decay
-
-        return output_boxes.view(-1,4).cpu(), outputs.detach().view(-1).cpu()
-
-    def optimize_boxes_relative(self, iou_features, init_boxes):
-        # Optimize iounet boxes
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]]).to(self.params.device).view(1,1,4)
-
-        sz_norm = output_boxes[:,:1,2:].clone()
-        output_boxes_rel = bbutils.rect_to_rel(output_boxes, sz_norm)
-        for i_ in range(self.params.box_refinement_iter):
-            # forward pass
-            bb_init_rel = output_boxes_rel.clone().detach()
-            bb_init_rel.requires_grad = True
-
-            bb_init = bbutils.rel_to_rect(bb_init_rel, sz_norm)
-            outputs = self.net.bb_regressor.predict_iou(self.iou_modulation, iou_features, bb_init)
-
-            if isinstance(outputs, (list, tuple)):
-                outputs = outputs[0]
-
-            outputs.backward(gradient = torch.ones_like(outputs))
-
-            # Update proposal
-            output_boxes_rel = bb_init_rel + step_length * bb_init_rel.grad
-            output_boxes_rel.detach_()
-
-            step_length *= self.params.box_refinement_step_decay
-
-        output_boxes = bbutils.rel_to_rect(output_boxes_rel, sz_norm)
-
-        return output_boxes.view(-1,4).cpu(), outputs.detach().view(-1).cpu()
+    def optimize_boxes(self, iou_features, init_boxes, modulation=None):
+        """Optimize the iounet boxes (see pytracking.libs.box_refinement). The target modulation defaults to the one
+        of this tracker."""
+        if modulation is None:
+            modulation = self.iou_modulation
+        output_boxes, output_iou = box_refinement.optimize_boxes(self.net.bb_regressor.predict_iou, modulation,
+                                                                 iou_features, init_boxes.to(self.params.device),
+                                                                 self.params.box_refinement_iter,
+                                                                 self.params.box_refinement_step_length,
+                                                                 self.params.box_refinement_step_decay,
+                                                                 self.params.get('box_refinement_space', 'default'))
+        return output_boxes.cpu(), output_iou.cpu()
 
     def direct_box_regression(self, backbone_feat, sample_pos, sample_scale, scale_ind, update_scale = True):
         """Run the ATOM IoUNet to refine the target bounding box."""
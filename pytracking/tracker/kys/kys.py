@@ -5,6 +5,8 @@ import math
 import time
 from pytracking.tracker.base import BaseTracker
 from pytracking import dcf, TensorList
+from pytracking.libs import box_refinement
+from pytracking.libs.sample_memory import SampleMemory
 from pytracking.features.preprocessing import numpy_to_torch
 from pytracking.utils.plotting import plot_graph
 from pytracking.features.preprocessing import sample_patch_multiscale, sample_patch_transformed
@@ -227,7 +229,8 @@ class KYS(BaseTracker):
     def extract_backbone_features(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
         im_patches, patch_coords = sample_patch_multiscale(im, pos, scales, sz,
                                                            mode=self.params.get('border_mode', 'replicate'),
-                                                           max_scale_change=self.params.get('patch_max_scale_change', None))
+                                                           max_scale_change=self.params.get('patch_max_scale_change', None),
+                                                           use_grid_sample=self.params.get('use_grid_sample_crop', False))
         with torch.no_grad():
             backbone_feat = self.net.extract_backbone(im_patches)
         return backbone_feat, patch_coords, im_patches
@@ -508,83 +511,17 @@ class KYS(BaseTracker):
         for T in self.transforms:
             init_target_boxes.append(self.classifier_target_box + torch.Tensor([T.shift[1], T.shift[0], 0, 0]))
         init_target_boxes = torch.cat(init_target_boxes.view(1, 4), 0).to(self.params.device)
-        self.target_boxes = init_target_boxes.new_zeros(self.params.sample_memory_size, 4)
-        self.target_boxes[:init_target_boxes.shape[0],:] = init_target_boxes
         return init_target_boxes
 
-    def init_memory(self, train_x: TensorList):
-        # Initialize first-frame spatial training samples
-        self.num_init_samples = train_x.size(0)
-        init_sample_weights = TensorList([x.new_ones(1) / x.shape[0] for x in train_x])
-
-        # Sample counters and weights for spatial
-        self.num_stored_samples = self.num_init_samples.copy()
-        self.previous_replace_ind = [None] * len(self.num_stored_samples)
-        self.sample_weights = TensorList([x.new_zeros(self.params.sample_memory_size) for x in train_x])
-        for sw, init_sw, num in zip(self.sample_weights, init_sample_weights, self.num_init_samples):
-            sw[:num] = init_sw
-
-        # Initialize memory
-        self.training_samples = TensorList(
-            [x.new_zeros(self.params.sample_memory_size, x.shape[1], x.shape[2], x.shape[3]) for x in train_x])
-
-        for ts, x in zip(self.training_samples, train_x):
-            ts[:x.shape[0],...] = x
+    def init_memory(self, train_x: TensorList, target_boxes):
+        """Initialize the sample memory with the first-frame spatial training samples and their target boxes."""
+        self.sample_memory = SampleMemory(self.params.sample_memory_size, self.params.learning_rate,
+                                          self.params.get('init_samples_minimum_weight', None))
+        self.sample_memory.initialize({'samples': train_x[0], 'target_boxes': target_boxes})
 
     def update_memory(self, sample_x: TensorList, target_box, learning_rate=None):
-        # Update weights and get replace ind
-        replace_ind = self.update_sample_weights(self.sample_weights, self.previous_replace_ind, self.num_stored_samples, self.num_init_samples, learning_rate)
-        self.previous_replace_ind = replace_ind
-
-        # Update sample and label memory
-        for train_samp, x, ind in zip(self.training_samples, sample_x, replace_ind):
-            train_samp[ind:ind+1,...] = x
-
-        # Update bb memory
-        self.target_boxes[replace_ind[0],:] = target_box
-
-        self.num_stored_samples += 1
-
-    def update_sample_weights(self, sample_weights, previous_replace_ind, num_stored_samples, num_init_samples, learning_rate = None):
-        # Update weights and get index to replace
-        replace_ind = []
-        for sw, prev_ind, num_samp, num_init in zip(sample_weights, previous_replace_ind, num_stored_samples, num_init_samples):
-            lr = learning_rate
-            if lr is None:
-                lr = self.params.learning_rate
-
-            init_samp_weight = self.params.get('init_samples_minimum_weight', None)
-            if init_samp_weight == 0:
-                init_samp_weight = None
-            s_ind = 0 if init_samp_weight is None else num_init
-
-            if num_samp == 0 or lr == 1:
-                sw[:] = 0
-                sw[0] = 1
-                r_ind = 0
-            else:
-                # Get index to replace
-                if num_samp < sw.shape[0]:
-                    r_ind = num_samp
-                else:
-                    _, r_ind = torch.min(sw[s_ind:], 0)
-                    r_ind = r_ind.item() + s_ind
-
-                # Update weights
-                if prev_ind is None:
-                    sw /= 1 - lr
-                    sw[r_ind] = lr
-                else:
-                    sw[r_ind] = sw[prev_ind] / (1 - lr)
-
-            sw /= sw.sum()
-            if init_samp_weight is not None and sw[:num_init].sum() < init_samp_weight:
-                sw /= init_samp_weight + sw[num_init:].sum()
-                sw[:num_init] = init_samp_weight / num_init
-
-            replace_ind.append(r_ind)
-
-        return replace_ind
+        """Insert the sample and its target box in the memory and update the sample weights."""
+        self.sample_memory.update({'samples': sample_x[0], 'target_boxes': target_box}, learning_rate)
 
     def update_state(self, new_pos, new_scale=None):
         # Update scale
@@ -697,7 +634,7 @@ class KYS(BaseTracker):
 
         # Init memory
         if self.params.get('update_classifier', True):
-            self.init_memory(TensorList([x]))
+            self.init_memory(TensorList([x]), target_boxes)
 
         if plot_loss:
             if isinstance(losses, dict):
@@ -729,9 +666,9 @@ class KYS(BaseTracker):
 
         if num_iter > 0:
             # Get inputs for the DiMP filter optimizer module
-            samples = self.training_samples[0][:self.num_stored_samples[0],...]
-            target_boxes = self.target_boxes[:self.num_stored_samples[0],:].clone()
-            sample_weights = self.sample_weights[0][:self.num_stored_samples[0]]
+            samples = self.sample_memory['samples']
+            target_boxes = self.sample_memory['target_boxes']
+            sample_weights = self.sample_memory.sample_weights
 
             # Run the filter optimizer module
             with torch.no_grad():
@@ -814,36 +751,18 @@ class KYS(BaseTracker):
             else:
                 self.target_scale = new_scale
 
-    def optimize_boxes(self, iou_features, init_boxes):
-        return self.optimize_boxes_default(iou_features, init_boxes)
-
-    def optimize_boxes_default(self, iou_features, init_boxes):
-        # Optimize iounet boxes
-        output_boxes = init_boxes.view(1, -1, 4).to(self.params.device)
-        step_length = self.params.box_refinement_step_length
-        if isinstance(step_length, (tuple, list)):
-            step_length = torch.Tensor([step_length[0], step_length[0], step_length[1], step_length[1]],
-                                       device=self.params.device).view(1,1,4)
-
-        for i_ in range(self.params.box_refinement_iter):
-            # forward pass
-            bb_init = output_boxes.clone().detach()
-            bb_init.requires_grad = True
-
-            outputs = self.net.bb_regressor.predict_iou(self.iou_modulation, iou_features, bb_init)
-
-            if isinstance(outputs, (list, tuple)):
-                outputs = outputs[0]
-
-            outputs.backward(gradient = torch.ones_like(outputs))
-
-            # Update proposal
-            output_boxes = bb_init + step_length * bb_init.grad * bb_init[:, :, 2:].repeat(1, 1, 2)
-            output_boxes.detach_()
-
-            step_length *= self.params.box_refinement_step_decay
-
-        return output_boxes.view(-1,4).cpu(), outputs.detach().view(-1).cpu()
+    def optimize_boxes(self, iou_features, init_boxes, modulation=None):
+        """Optimize the iounet boxes (see pytracking.libs.box_refinement). The target modulation defaults to the one
+        of this tracker."""
+        if modulation is None:
+            modulation = self.iou_modulation
+        output_boxes, output_iou = box_refinement.optimize_boxes(self.net.bb_regressor.predict_iou, modulation,
+                                                                 iou_features, init_boxes.to(self.params.device),
+                                                                 self.params.box_refinement_iter,
+                                                                 self.params.box_refinement_step_length,
+                                                                 self.params.box_refinement_step_decay,
+                                                                 'default')
+        return output_boxes.cpu(), output_iou.cpu()
 
     def visdom_draw_tracking(self, image, box, segmentation=None):
         if hasattr(self, 'search_area_box'):
@@ -5,6 +5,7 @@ import numpy as np
 import math
 import time
 from pytracking import TensorList
+from pytracking.libs.sample_memory import SampleMemory
 from pytracking.features.preprocessing import numpy_to_torch
 from pytracking.features.preprocessing import sample_patch_multiscale, sample_patch_transformed, sample_patch
 from pytracking.features import augmentation
@@ -368,7 +369,8 @@ class LWL(BaseTracker):
     def extract_backbone_features(self, im: torch.Tensor, pos: torch.Tensor, scale, sz: torch.Tensor):
         im_patches, patch_coords = sample_patch_multiscale(im, pos, scale.unsqueeze(0), sz,
                                                            mode=self.params.get('border_mode', 'replicate'),
-                                                           max_scale_change=self.params.get('patch_max_scale_change', None))
+                                                           max_scale_change=self.params.get('patch_max_scale_change', None),
+                                                           use_grid_sample=self.params.get('use_grid_sample_crop', False))
         with torch.no_grad():
             backbone_feat = self.net.extract_backbone(im_patches)
         return backbone_feat, patch_coords[0], im_patches[0]
@@ -434,86 +436,14 @@ class LWL(BaseTracker):
         """ Initialize the sample memory used to update the target model """
         assert masks.dim() == 4
 
-        # Initialize first-frame spatial training samples
-        self.num_init_samples = train_x.size(0)
-        init_sample_weights = TensorList([x.new_ones(1) / x.shape[0] for x in train_x])
-
-        # Sample counters and weights for spatial
-        self.num_stored_samples = self.num_init_samples.copy()
-        self.previous_replace_ind = [None] * len(self.num_stored_samples)
-        self.sample_weights = TensorList([x.new_zeros(self.params.sample_memory_size) for x in train_x])
-        for sw, init_sw, num in zip(self.sample_weights, init_sample_weights, self.num_init_samples):
-            sw[:num] = init_sw
-
-        # Initialize memory
-        self.training_samples = TensorList(
-            [x.new_zeros(self.params.sample_memory_size, x.shape[1], x.shape[2], x.shape[3]) for x in train_x])
-
-        self.target_masks = masks.new_zeros(self.params.sample_memory_size, masks.shape[-3], masks.shape[-2],
-                                            masks.shape[-1])
-        self.target_masks[:masks.shape[0], :, :, :] = masks
-
-        for ts, x in zip(self.training_samples, train_x):
-            ts[:x.shape[0],...] = x
+        self.sample_memory = SampleMemory(self.params.sample_memory_size, self.params.learning_rate,
+                                          self.params.get('init_samples_minimum_weight', None),
+                                          lower_init_weight=self.params.get('lower_init_weight', False))
+        self.sample_memory.initialize({'samples': train_x[0], 'target_masks': masks})
 
     def update_memory(self, sample_x: TensorList, mask, learning_rate=None):
         """ Add a new sample to the memory. If the memory is full, an old sample are removed"""
-        # Update weights and get replace ind
-        replace_ind = self.update_sample_weights(self.sample_weights, self.previous_replace_ind, self.num_stored_samples, self.num_init_samples, learning_rate)
-        self.previous_replace_ind = replace_ind
-
-        # Update sample and label memory
-        for train_samp, x, ind in zip(self.training_samples, sample_x, replace_ind):
-            train_samp[ind:ind+1,...] = x
-
-        self.target_masks[replace_ind[0], :, :, :] = mask[0, ...]
-
-        self.num_stored_samples = [n + 1 if n < self.params.sample_memory_size else n for n in self.num_stored_samples]
-
-
-    def update_sample_weights(self, sample_weights, previous_replace_ind, num_stored_samples, num_init_samples, learning_rate = None):
-        """ Update weights and get index to replace """
-        replace_ind = []
-        for sw, prev_ind, num_samp, num_init in zip(sample_weights, previous_replace_ind, num_stored_samples, num_init_samples):
-            lr = learning_rate
-            if lr is None:
-                lr = self.params.learning_rate
-
-            init_samp_weight = self.params.get('init_samples_minimum_weight', None)
-            if init_samp_weight == 0:
-                init_samp_weight = None
-            s_ind = 0 if init_samp_weight is None else num_init
-
-            if num_samp == 0 or lr == 1:
-                sw[:] = 0
-                sw[0] = 1
-                r_ind = 0
-            else:
-                # Get index to replace
-                if num_samp < sw.shape[0]:
-                    r_ind = num_samp
-                else:
-                    _, r_ind = torch.min(sw[s_ind:], 0)
-                    r_ind = r_ind.item() + s_ind
-
-                # Update weights
-                if prev_ind is None:
-                    if self.params.get('lower_init_weight', False):
-                        sw[r_ind] = 1
-                    else:
-                        sw /= 1 - lr
-                        sw[r_ind] = lr
-                else:
-                    sw[r_ind] = sw[prev_ind] / (1 - lr)
-
-            sw /= sw.sum()
-            if init_samp_weight is not None and sw[:num_init].sum() < init_samp_weight:
-                sw /= init_samp_weight + sw[num_init:].sum()
-                sw[:num_init] = init_samp_weight / num_init
-
-            replace_ind.append(r_ind)
-
-        return replace_ind
+        self.sample_memory.update({'samples': sample_x[0], 'target_masks': mask[0, ...]}, learning_rate)
 
     def init_target_model(self, init_backbone_feat, init_masks):
         # Get target model features
@@ -557,13 +487,13 @@ class LWL(BaseTracker):
             num_iter = self.params.get('net_opt_update_iter', None)
 
         if num_iter > 0:
-            samples = self.training_samples[0][:self.num_stored_samples[0],...]
-            masks = self.target_masks[:self.num_stored_samples[0], ...]
+            samples = self.sample_memory['samples']
+            masks = self.sample_memory['target_masks']
 
             with torch.no_grad():
                 few_shot_label, few_shot_sw = self.net.label_encoder(masks, samples.unsqueeze(1))
 
-            sample_weights = self.sample_weights[0][:self.num_stored_samples[0]]
+            sample_weights = self.sample_memory.sample_weights
 
             if few_shot_sw is not None:
                 # few_shot_sw provides spatial weights, while sample_weights contains temporal weights.
@@ -3,6 +3,7 @@ import torch.nn.functional as F
 import math
 
 from pytracking import dcf, TensorList
+from pytracking.libs.sample_memory import SampleMemory
 from pytracking.features.preprocessing import sample_patch_transformed
 from pytracking.features import augmentation
 from pytracking.utils.plotting import plot_graph
@@ -228,91 +229,19 @@ class ClassifierBranch:
         return sample_pos, sample_scales
 
 
-    def init_classifier_memory(self, train_x: TensorList):
-        # Initialize first-frame spatial training samples
-        self.clf_num_init_samples = train_x.size(0)
-        init_sample_weights = TensorList([x.new_ones(1) / x.shape[0] for x in train_x])
-
-        # Sample counters and weights for spatial
-        self.clf_num_stored_samples = self.clf_num_init_samples.copy()
-        self.clf_previous_replace_ind = [None] * len(self.clf_num_stored_samples)
-        self.clf_sample_weights = TensorList([x.new_zeros(self.params.clf_sample_memory_size) for x in train_x])
-        for sw, init_sw, num in zip(self.clf_sample_weights, init_sample_weights, self.clf_num_init_samples):
-            sw[:num] = init_sw
-
-        # Initialize memory
-        self.clf_training_samples = TensorList(
-            [x.new_zeros(self.params.clf_sample_memory_size, x.shape[1], x.shape[2], x.shape[3]) for x in train_x])
-
-        for ts, x in zip(self.clf_training_samples, train_x):
-            ts[:x.shape[0],...] = x
+    def init_classifier_memory(self, train_x: TensorList, target_boxes, target_labels):
+        """Initialize the sample memory with the first-frame spatial training samples, their target boxes and labels."""
+        self.clf_sample_memory = SampleMemory(self.params.clf_sample_memory_size, self.params.clf_learning_rate,
+                                              self.params.get('clf_init_samples_minimum_weight', None),
+                                              lower_init_weight=self.params.get('clf_lower_init_weight', False))
+        self.clf_sample_memory.initialize({'samples': train_x[0], 'target_boxes': target_boxes,
+                                           'target_labels': target_labels})
 
 
     def update_classifier_memory(self, sample_x: TensorList, sample_y: TensorList, target_box, learning_rate=None):
-        # Update weights and get replace ind
-        replace_ind = self.update_classifier_sample_weights(
-            self.clf_sample_weights, self.clf_previous_replace_ind, self.clf_num_stored_samples,
-            self.clf_num_init_samples, learning_rate)
-        self.clf_previous_replace_ind = replace_ind
-
-        # Update sample and label memory
-        for train_samp, x, ind in zip(self.clf_training_samples, sample_x, replace_ind):
-            train_samp[ind:ind+1,...] = x
-
-        for y_memory, y, ind in zip(self.clf_target_labels, sample_y, replace_ind):
-            y_memory[ind:ind+1,...] = y
-
-        # Update bb memory
-        self.clf_target_boxes[replace_ind[0],:] = target_box
-
-        self.clf_num_stored_samples += 1
-
-
-    def update_classifier_sample_weights(self, sample_weights, previous_replace_ind, num_stored_samples,
-                                         num_init_samples, learning_rate=None):
-        """ Update weights and get index to replace """
-        replace_ind = []
-        for sw, prev_ind, num_samp, num_init in zip(sample_weights, previous_replace_ind,
-                                                    num_stored_samples, num_init_samples):
-            lr = learning_rate
-            if lr is None:
-                lr = self.params.clf_learning_rate
-
-            init_samp_weight = self.params.get('clf_init_samples_minimum_weight', None)
-            if init_samp_weight == 0:
-                init_samp_weight = None
-            s_ind = 0 if init_samp_weight is None else num_init
-
-            if num_samp == 0 or lr == 1:
-                sw[:] = 0
-                sw[0] = 1
-                r_ind = 0
-            else:
-                # Get index to replace
-                if num_samp < sw.shape[0]:
-                    r_ind = num_samp
-                else:
-                    _, r_ind = torch.min(sw[s_ind:], 0)
-                    r_ind = r_ind.item() + s_ind
-
-                # Update weights
-                if prev_ind is None:
-                    if self.params.get('clf_lower_init_weight', False):
-                        sw[r_ind] = 1
-                    else:
-                        sw /= 1 - lr
-                        sw[r_ind] = lr
-                else:
-                    sw[r_ind] = sw[prev_ind] / (1 - lr)
-
-            sw /= sw.sum()
-            if init_samp_weight is not None and sw[:num_init].sum() < init_samp_weight:
-                sw /= init_samp_weight + sw[num_init:].sum()
-                sw[:num_init] = init_samp_weight / num_init
-
-            replace_ind.append(r_ind)
-
-        return replace_ind
+        """Insert the sample, its target box and label in the memory and update the sample weights."""
+        self.clf_sample_memory.update({'samples': sample_x[0], 'target_boxes': target_box,
+                                       'target_labels': sample_y[0]}, learning_rate)
 
 
     def init_classifier(self, init_backbone_feat):
@@ -350,7 +279,7 @@ class ClassifierBranch:
 
         # Init memory
         if self.params.get('update_classifier', True):
-            self.init_classifier_memory(TensorList([x]))
+            self.init_classifier_memory(TensorList([x]), target_boxes, target_labels)
 
         if plot_loss:
             if isinstance(losses, dict):
@@ -390,10 +319,10 @@ class ClassifierBranch:
             return
 
         # Get inputs for the DiMP filter optimizer module
-        samples = self.clf_training_samples[0][:self.clf_num_stored_samples[0],...]
-        target_boxes = self.clf_target_boxes[:self.clf_num_stored_samples[0],:].clone()
-        target_labels = self.clf_target_labels[0][:self.clf_num_stored_samples[0],...]
-        sample_weights = self.clf_sample_weights[0][:self.clf_num_stored_samples[0]].view(-1, 1, 1, 1).clone()
+        samples = self.clf_sample_memory['samples']
+        target_boxes = self.clf_sample_memory['target_boxes']
+        target_labels = self.clf_sample_memory['target_labels']
+        sample_weights = self.clf_sample_memory.sample_weights.view(-1, 1, 1, 1)
 
         # Run the filter optimizer module
         with torch.no_grad():
@@ -470,17 +399,15 @@ class ClassifierBranch:
         for T in self.clf_transforms:
             init_target_boxes.append(self.classifier_target_box + torch.Tensor([T.shift[1], T.shift[0], 0, 0]))
         init_target_boxes = torch.cat(init_target_boxes.view(1, 4), 0).to(self.params.device)
-
-        self.clf_target_boxes = init_target_boxes.new_zeros(self.params.clf_sample_memory_size, 4)
-        self.clf_target_boxes[:init_target_boxes.shape[0],:] = init_target_boxes
         return init_target_boxes
 
 
     def init_target_labels(self, train_x: TensorList):
-        self.clf_target_labels = TensorList([x.new_zeros(self.params.clf_sample_memory_size, 1,
-                                                     x.shape[2] + (int(self.clf_kernel_size[0].item()) + 1) % 2,
-                                                     x.shape[3] + (int(self.clf_kernel_size[1].item()) + 1) % 2)
-                                         for x in train_x])
+        """Get the target labels for the initial augmented samples."""
+        target_labels = TensorList([x.new_zeros(x.shape[0], 1,
+                                                x.shape[2] + (int(self.clf_kernel_size[0].item()) + 1) % 2,
+                                                x.shape[3] + (int(self.clf_kernel_size[1].item()) + 1) % 2)
+                                    for x in train_x])
         # Output sigma factor
         output_sigma_factor = self.params.get('clf_output_sigma_factor', 1/4)
         self.clf_sigma = (self.clf_feature_sz / self.clf_img_support_sz * self.clf_base_target_sz).prod().sqrt() * output_sigma_factor * torch.ones(2)
@@ -488,14 +415,14 @@ class ClassifierBranch:
         # Center pos in normalized img_coords
         target_center_norm = (self.clf_pos - self.clf_init_sample_pos) / (self.clf_init_sample_scale * self.clf_img_support_sz)
 
-        for target, x in zip(self.clf_target_labels, train_x):
+        for target, x in zip(target_labels, train_x):
             ksz_even = torch.Tensor([(self.clf_kernel_size[0] + 1) % 2, (self.clf_kernel_size[1] + 1) % 2])
             center_pos = self.clf_feature_sz * target_center_norm + 0.5 * ksz_even
             for i, T in enumerate(self.clf_transforms[:x.shape[0]]):
                 sample_center = center_pos + torch.Tensor(T.shift) / self.clf_img_support_sz * self.clf_feature_sz
                 target[i, 0, ...] = dcf.label_function_spatial(self.clf_feature_sz, self.clf_sigma, sample_center, end_pad=ksz_even)
 
-        return self.clf_target_labels[0][:train_x[0].shape[0]]
+        return target_labels[0]
 
 
 
@@ -4,6 +4,7 @@ import torch.nn.functional as F
 import math
 import time
 from pytracking import dcf, TensorList
+from pytracking.libs.sample_memory import SampleMemory
 from pytracking.features.preprocessing import numpy_to_torch
 from pytracking.features.preprocessing import sample_patch_multiscale, sample_patch_transformed
 from pytracking.features import augmentation
@@ -282,9 +283,9 @@ class ToMP(BaseTracker):
     def classify_target(self, sample_x: TensorList):
         """Classify target by applying the DiMP filter."""
         with torch.no_grad():
-            train_samples = self.training_samples[0][:self.num_stored_samples[0], ...]
-            target_labels = self.target_labels[0][:self.num_stored_samples[0], ...]
-            target_boxes = self.target_boxes[:self.num_stored_samples[0], :]
+            train_samples = self.sample_memory['samples']
+            target_labels = self.sample_memory['target_labels']
+            target_boxes = self.sample_memory['target_boxes']
 
             test_feat = self.net.head.extract_head_feat(sample_x)
             train_feat = self.net.head.extract_head_feat(train_samples)
@@ -413,7 +414,8 @@ class ToMP(BaseTracker):
     def extract_backbone_features(self, im: torch.Tensor, pos: torch.Tensor, scales, sz: torch.Tensor):
         im_patches, patch_coords = sample_patch_multiscale(im, pos, scales, sz,
                                                            mode=self.params.get('border_mode', 'replicate'),
-                                                           max_scale_change=self.params.get('patch_max_scale_change', None))
+                                                           max_scale_change=self.params.get('patch_max_scale_change', None),
+                                                           use_grid_sample=self.params.get('use_grid_sample_crop', False))
         with torch.no_grad():
             backbone_feat = self.net.extract_backbone(im_patches)
         return backbone_feat, patch_coords, im_patches
@@ -499,12 +501,10 @@ class ToMP(BaseTracker):
         for T in self.transforms:
             init_target_boxes.append(self.classifier_target_box + torch.Tensor([T.shift[1], T.shift[0], 0, 0]))
         init_target_boxes = torch.cat(init_target_boxes.view(1, 4), 0).to(self.params.device)
-        self.target_boxes = init_target_boxes.new_zeros(self.params.sample_memory_size, 4)
-        self.target_boxes[:init_target_boxes.shape[0],:] = init_target_boxes
         return init_target_boxes
 
     def init_target_labels(self, train_x: TensorList):
-        self.target_labels = TensorList([x.new_zeros(self.params.sample_memory_size, 1,
+        target_labels = TensorList([x.new_zeros(x.shape[0], 1,
                                                      x.shape[2] + (int(self.kernel_size[0].item()) + 1) % 2,
                                                      x.shape[3] + (int(self.kernel_size[1].item()) + 1) % 2)
                                          for x in train_x])
@@ -515,91 +515,26 @@ class ToMP(BaseTracker):
         # Center pos in normalized img_coords
         target_center_norm = (self.pos - self.init_sample_pos) / (self.init_sample_scale * self.img_support_sz)
 
-        for target, x in zip(self.target_labels, train_x):
+        for target, x in zip(target_labels, train_x):
             ksz_even = torch.Tensor([(self.kernel_size[0] + 1) % 2, (self.kernel_size[1] + 1) % 2])
             center_pos = self.feature_sz * target_center_norm + 0.5 * ksz_even
             for i, T in enumerate(self.transforms[:x.shape[0]]):
                 sample_center = center_pos + torch.Tensor(T.shift) / self.img_support_sz * self.feature_sz
                 target[i, 0, ...] = dcf.label_function_spatial(self.feature_sz, self.sigma, sample_center, end_pad=ksz_even)
 
-        return self.target_labels[0][:train_x[0].shape[0]]
+        return target_labels[0]
 
-    def init_memory(self, train_x: TensorList):
-        # Initialize first-frame spatial training samples
-        self.num_init_samples = train_x.size(0)
-        init_sample_weights = TensorList([x.new_ones(1) / x.shape[0] for x in train_x])
-
-        # Sample counters and weights for spatial
-        self.num_stored_samples = self.num_init_samples.copy()
-        self.previous_replace_ind = [None] * len(self.num_stored_samples)
-        self.sample_weights = TensorList([x.new_zeros(self.params.sample_memory_size) for x in train_x])
-        for sw, init_sw, num in zip(self.sample_weights, init_sample_weights, self.num_init_samples):
-            sw[:num] = init_sw
-
-        # Initialize memory
-        self.training_samples = TensorList(
-            [x.new_zeros(self.params.sample_memory_size, x.shape[1], x.shape[2], x.shape[3]) for x in train_x])
-
-        for ts, x in zip(self.training_samples, train_x):
-            ts[:x.shape[0],...] = x
+    def init_memory(self, train_x: TensorList, target_labels, target_boxes):
+        """Initialize the sample memory with the first-frame spatial training samples, labels and target boxes."""
+        self.sample_memory = SampleMemory(self.params.sample_memory_size, self.params.learning_rate,
+                                          self.params.get('init_samples_minimum_weight', None))
+        self.sample_memory.initialize({'samples': train_x[0], 'target_labels': target_labels,
+                                       'target_boxes': target_boxes})
 
     def update_memory(self, sample_x: TensorList, sample_y: TensorList, target_box, learning_rate = None):
-        # Update weights and get replace ind
-        replace_ind = self.update_sample_weights(self.sample_weights, self.previous_replace_ind, self.num_stored_samples, self.num_init_samples, learning_rate)
-        self.previous_replace_ind = replace_ind
-
-        # Update sample and label memory
-        for train_samp, x, ind in zip(self.training_samples, sample_x, replace_ind):
-            train_samp[ind:ind+1,...] = x
-
-        for y_memory, y, ind in zip(self.target_labels, sample_y, replace_ind):
-            y_memory[ind:ind+1,...] = y
-
-        # Update bb memory
-        self.target_boxes[replace_ind[0],:] = target_box
-
-        self.num_stored_samples += 1
-
-    def update_sample_weights(self, sample_weights, previous_replace_ind, num_stored_samples, num_init_samples, learning_rate = None):
-        # Update weights and get index to replace
-        replace_ind = []
-        for sw, prev_ind, num_samp, num_init in zip(sample_weights, previous_replace_ind, num_stored_samples, num_init_samples):
-            lr = learning_rate
-            if lr is None:
-                lr = self.params.learning_rate
-
-            init_samp_weight = self.params.get('init_samples_minimum_weight', None)
-            if init_samp_weight == 0:
-                init_samp_weight = None
-            s_ind = 0 if init_samp_weight is None else num_init
-
-            if num_samp == 0 or lr == 1:
-                sw[:] = 0
-                sw[0] = 1
-                r_ind = 0
-            else:
-                # Get index to replace
-                if num_samp < sw.shape[0]:
-                    r_ind = num_samp
-                else:
-                    _, r_ind = torch.min(sw[s_ind:], 0)
-                    r_ind = r_ind.item() + s_ind
-
-                # Update weights
-                if prev_ind is None:
-                    sw /= 1 - lr
-                    sw[r_ind] = lr
-                else:
-                    sw[r_ind] = sw[prev_ind] / (1 - lr)
-
-            sw /= sw.sum()
-            if init_samp_weight is not None and sw[:num_init].sum() < init_samp_weight:
-                sw /= init_samp_weight + sw[num_init:].sum()
-                sw[:num_init] = init_samp_weight / num_init
-
-            replace_ind.append(r_ind)
-
-        return replace_ind
+        """Insert the sample with its label and target box in the memory and update the sample weights."""
+        self.sample_memory.update({'samples': sample_x[0], 'target_labels': sample_y[0], 'target_boxes': target_box},
+                                  learning_rate)
 
     def get_label_function(self, pos, sample_pos, sample_scale):
         train_y = TensorList()
@@ -660,14 +595,14 @@ class ToMP(BaseTracker):
         target_boxes = self.init_target_boxes()
 
         # Get target labels for the different augmentations
-        self.init_target_labels(TensorList([x]))
+        target_labels = self.init_target_labels(TensorList([x]))
 
         self.num_gth_frames = target_boxes.shape[0]
 
         if hasattr(self.net.head.filter_predictor, 'num_gth_frames'):
             self.net.head.filter_predictor.num_gth_frames = self.num_gth_frames
 
-        self.init_memory(TensorList([x]))
+        self.init_memory(TensorList([x]), target_labels, target_boxes)
 
     def visdom_draw_tracking(self, image, box, segmentation=None):
         if hasattr(self, 'search_area_box'):
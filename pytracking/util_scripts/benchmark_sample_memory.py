@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import argparse
+import torch
+
+env_path = os.path.join(os.path.dirname(__file__), '../..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from pytracking.libs.sample_memory import SampleMemory
+
+
+class LegacySampleMemory:
+    """ The per-tracker sample memory used before SampleMemory (list of weights, python index, .item() sync), kept
+    here as reference for the benchmark."""
+
+    def __init__(self, memory_size, learning_rate, init_samples_minimum_weight=None):
+        self.memory_size = memory_size
+        self.learning_rate = learning_rate
+        self.init_samples_minimum_weight = init_samples_minimum_weight
+
+    def initialize(self, init_samples: dict):
+        self.buffers = {}
+        for name, x in init_samples.items():
+            self.buffers[name] = x.new_zeros(self.memory_size, *x.shape[1:])
+            self.buffers[name][:x.shape[0], ...] = x
+            self.num_init = x.shape[0]
+        self.weights = x.new_zeros(self.memory_size)
+        self.weights[:self.num_init] = 1 / self.num_init
+        self.num_stored = self.num_init
+        self.previous_replace_ind = None
+
+    def update(self, samples: dict):
+        sw, lr, num_init = self.weights, self.learning_rate, self.num_init
+        init_samp_weight = self.init_samples_minimum_weight
+        s_ind = 0 if init_samp_weight is None else num_init
+
+        if self.num_stored < self.memory_size:
+            r_ind = self.num_stored
+        else:
+            _, r_ind = torch.min(sw[s_ind:], 0)
+            r_ind = r_ind.item() + s_ind
+
+        if self.previous_replace_ind is None:
+            sw /= 1 - lr
+            sw[r_ind] = lr
+        else:
+            sw[r_ind] = sw[self.previous_replace_ind] / (1 - lr)
+
+        sw /= sw.sum()
+        if init_samp_weight is not None and sw[:num_init].sum() < init_samp_weight:
+            sw /= init_samp_weight + sw[num_init:].sum()
+            sw[:num_init] = init_samp_weight / num_init
+        self.previous_replace_ind = r_ind
+
+        for name, x in samples.items():
+            self.buffers[name][r_ind, ...] = x
+        self.num_stored += 1
+
+
+def time_updates(memory, samples, num_updates, device):
+    """ Average time of one memory update in milliseconds, after filling the memory."""
+    for _ in range(memory.memory_size):
+        memory.update(samples)
+
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    tic = time.perf_counter()
+    for _ in range(num_updates):
+        memory.update(samples)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return 1000 * (time.perf_counter() - tic) / num_updates
+
+
+def benchmark_sample_memory(memory_sizes, feature_sz=(512, 18, 18), num_init=13, num_updates=200,
+                            init_samples_minimum_weight=0.25, device='cuda'):
+    """ Time the sample memory update (as done in every update_classifier call) for different memory sizes."""
+    device = torch.device(device if device != 'cuda' or torch.cuda.is_available() else 'cpu')
+    init_samples = {'samples': torch.randn(num_init, *feature_sz, device=device),
+                    'target_boxes': torch.rand(num_init, 4, device=device)}
+    samples = {'samples': torch.randn(1, *feature_sz, device=device),
+               'target_boxes': torch.rand(4, device=device)}
+
+    print('Device: {}, feature size: {}'.format(device, feature_sz))
+    print('{:>12} {:>14} {:>14}'.format('memory size', 'legacy [ms]', 'ring [ms]'))
+    for memory_size in memory_sizes:
+        times = []
+        for memory_class in (LegacySampleMemory, SampleMemory):
+            memory = memory_class(memory_size, 0.01, init_samples_minimum_weight)
+            memory.initialize(init_samples)
+            times.append(time_updates(memory, samples, num_updates, device))
+        print('{:>12} {:>14.3f} {:>14.3f}'.format(memory_size, *times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the update cost of the tracker sample memory.')
+    parser.add_argument('--memory_sizes', type=int, nargs='+', default=[50, 250, 1000, 4000],
+                        help='Values of the sample_memory_size parameter.')
+    parser.add_argument('--num_updates', type=int, default=200, help='Number of timed updates.')
+    parser.add_argument('--device', type=str, default='cuda', help='Device of the memory (cuda or cpu).')
+
+    args = parser.parse_args()
+
+    benchmark_sample_memory(args.memory_sizes, num_updates=args.num_updates, device=args.device)
+
+
+if __name__ == '__main__':
+    main()
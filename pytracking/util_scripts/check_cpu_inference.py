@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+import torch
+
+env_path = os.path.join(os.path.dirname(__file__), '../..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from pytracking.evaluation import Tracker
+from pytracking.analysis.extract_results import calc_iou_overlap
+
+
+def synthetic_sequence(num_frames=60, image_sz=(360, 480), target_sz=(60, 80), seed=0):
+    """ Generates a sequence with a textured target moving over a textured background.
+
+    returns:
+        frames - List of RGB images (uint8 numpy arrays).
+        boxes - Ground truth boxes [x, y, w, h] (num_frames x 4 numpy array).
+    """
+    rng = np.random.RandomState(seed)
+    im_h, im_w = image_sz
+    t_h, t_w = target_sz
+
+    def texture(h, w, cell):
+        coarse = rng.randint(0, 256, (h // cell + 1, w // cell + 1, 3)).astype(np.uint8)
+        return np.repeat(np.repeat(coarse, cell, axis=0), cell, axis=1)[:h, :w]
+
+    background = texture(im_h, im_w, 16)
+    target = texture(t_h, t_w, 6)
+
+    frames, boxes = [], []
+    for i in range(num_frames):
+        phase = 2 * np.pi * i / num_frames
+        x = int((im_w - t_w) * (0.5 + 0.35 * np.sin(phase)))
+        y = int((im_h - t_h) * (0.5 + 0.35 * np.sin(2 * phase)))
+
+        frame = background.copy()
+        frame[y:y + t_h, x:x + t_w] = target
+        frames.append(frame)
+        boxes.append([x, y, t_w, t_h])
+
+    return frames, np.array(boxes, dtype=np.float64)
+
+
+def run_tracker(tracker_name, tracker_param, frames, init_box, seed=0):
+    """ Runs the tracker on the frames. Returns the predicted boxes and the average time per frame."""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    tracker_info = Tracker(tracker_name, tracker_param)
+    params = tracker_info.get_parameters()
+    params.debug = 0
+    params.visualization = False
+    if not torch.cuda.is_available():
+        # Run the reference on CPU as well, without the CPU inference settings
+        params.use_gpu = False
+        params.net.use_gpu = False
+    tracker = tracker_info.create_tracker(params)
+
+    tracker.initialize(frames[0], {'init_bbox': list(init_box)})
+    pred = [list(init_box)]
+
+    start_time = time.time()
+    for frame in frames[1:]:
+        pred.append(tracker.track(frame)['target_bbox'])
+    time_per_frame = (time.time() - start_time) / max(len(frames) - 1, 1)
+
+    return np.array(pred, dtype=np.float64), time_per_frame
+
+
+def check_cpu_inference(tracker_name, reference_param, cpu_param, num_frames=60, min_iou=0.9):
+    """ Runs the reference and the CPU parameter setting of a tracker on a synthetic sequence, and checks that the
+    CPU setting predicts the same boxes as the reference (average IoU between the predictions of at least min_iou).
+
+    args:
+        tracker_name - Name of tracking method.
+        reference_param - Name of the reference parameter file.
+        cpu_param - Name of the CPU parameter file.
+        num_frames - Number of frames of the synthetic sequence.
+        min_iou - Minimum average IoU between the reference and CPU predictions.
+    returns:
+        True if the check passed.
+    """
+    frames, anno = synthetic_sequence(num_frames)
+
+    results = {}
+    for param in (reference_param, cpu_param):
+        pred, time_per_frame = run_tracker(tracker_name, param, frames, anno[0])
+        results[param] = pred
+        iou = calc_iou_overlap(torch.from_numpy(pred), torch.from_numpy(anno))
+        print('{}: average IoU {:.3f}, FPS {:.1f}'.format(param, iou.mean().item(), 1 / time_per_frame))
+
+    iou = calc_iou_overlap(torch.from_numpy(results[reference_param]), torch.from_numpy(results[cpu_param]))
+    passed = iou.mean().item() >= min_iou
+    print('IoU between {} and {}: average {:.3f}, min {:.3f}. {}'.format(reference_param, cpu_param, iou.mean().item(),
+                                                                         iou.min().item(),
+                                                                         'OK' if passed else 'FAILED'))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the accuracy of a CPU inference setting on a synthetic sequence.')
+    parser.add_argument('--tracker_name', type=str, default='dimp', help='Name of tracking method.')
+    parser.add_argument('--reference_param', type=str, default='dimp50', help='Name of reference parameter file.')
+    parser.add_argument('--cpu_param', type=str, default='dimp50_cpu', help='Name of CPU parameter file.')
+    parser.add_argument('--num_frames', type=int, default=60, help='Number of frames of the synthetic sequence.')
+    parser.add_argument('--min_iou', type=float, default=0.9, help='Minimum average IoU between the predictions.')
+
+    args = parser.parse_args()
+
+    passed = check_cpu_inference(args.tracker_name, args.reference_param, args.cpu_param, args.num_frames,
+                                 args.min_iou)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
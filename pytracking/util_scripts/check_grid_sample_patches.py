@@ -0,0 +1,82 @@
+import os
+import sys
+import argparse
+import itertools
+import torch
+
+env_path = os.path.join(os.path.dirname(__file__), '../..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from pytracking.features.preprocessing import sample_patch_multiscale, _sample_patch_coords
+
+
+def random_image(image_sz=(360, 480), seed=0):
+    """ Random image (1 x 3 x H x W float tensor in [0, 255]) with smooth and sharp structures."""
+    gen = torch.Generator().manual_seed(seed)
+    noise = torch.rand(1, 3, image_sz[0], image_sz[1], generator=gen) * 255
+    coarse = torch.rand(1, 3, image_sz[0] // 16 + 1, image_sz[1] // 16 + 1, generator=gen) * 255
+    coarse = torch.nn.functional.interpolate(coarse, size=image_sz, mode='bilinear', align_corners=False)
+    return 0.5 * noise + 0.5 * coarse
+
+
+def check_grid_sample_patches(image_sz=(360, 480), tolerance=1e-2):
+    """ Checks that sample_patch_multiscale gives the same patches and patch coordinates with use_grid_sample=True as
+    with the pad and interpolate path, for several output sizes, scales (covering pre-downsampling factors 1 to 4),
+    positions inside and outside the image, and border modes.
+
+    args:
+        image_sz - Size of the test image.
+        tolerance - Maximum absolute difference of the patch values (image values in [0, 255]).
+    returns:
+        True if the check passed.
+    """
+    im = random_image(image_sz)
+    h, w = image_sz
+
+    output_sizes = [torch.Tensor([288, 288]), torch.Tensor([256, 320]), torch.Tensor([127, 127])]
+    scales = [0.45, 1.0, 1.37, 2.2, 3.05, 4.6]
+    positions = [(h / 2, w / 2), (10.3, 17.8), (h - 4, w - 25.5), (-60, w / 3), (h + 45.2, -30), (h / 3, w + 80)]
+    modes = [('replicate', None), ('inside', 1.5), ('inside_major', 1.5)]
+
+    passed = True
+    num_checked = 0
+    downsampling_factors = set()
+    for output_sz, pos, (mode, max_scale_change) in itertools.product(output_sizes, positions, modes):
+        pos = torch.Tensor(pos)
+        for s in scales:
+            downsampling_factors.add(_sample_patch_coords(im.shape, pos, s * output_sz, output_sz, mode,
+                                                          max_scale_change)[0])
+
+        ref_patches, ref_coords = sample_patch_multiscale(im, pos, scales, output_sz, mode=mode,
+                                                          max_scale_change=max_scale_change, use_grid_sample=False)
+        patches, coords = sample_patch_multiscale(im, pos, scales, output_sz, mode=mode,
+                                                  max_scale_change=max_scale_change, use_grid_sample=True)
+        num_checked += 1
+
+        error = (patches - ref_patches).abs().max().item() if patches.shape == ref_patches.shape else float('inf')
+        if error > tolerance or not torch.equal(coords.float(), ref_coords.float()):
+            passed = False
+            print('FAILED: output_sz {}, pos {}, mode {}: max patch difference {:.4g}, coordinates {}'.format(
+                output_sz.long().tolist(), pos.tolist(), mode, error,
+                'equal' if torch.equal(coords.float(), ref_coords.float()) else 'differ'))
+
+    print('Checked {} settings with pre-downsampling factors {}. {}'.format(num_checked, sorted(downsampling_factors),
+                                                                            'OK' if passed else 'FAILED'))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the grid_sample patch extraction gives the same patches as '
+                                                 'the pad and interpolate path.')
+    parser.add_argument('--tolerance', type=float, default=1e-2, help='Maximum absolute difference of the patches '
+                                                                       '(image values in [0, 255]).')
+
+    args = parser.parse_args()
+
+    passed = check_grid_sample_patches(tolerance=args.tolerance)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
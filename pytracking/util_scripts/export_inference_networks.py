@@ -0,0 +1,47 @@
+import os
+import sys
+import argparse
+
+env_path = os.path.join(os.path.dirname(__file__), '../..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from ltr.admin.loading import export_inference_network
+from pytracking.evaluation.environment import env_settings
+
+
+def export_inference_networks(net_paths):
+    """ Exports the given network checkpoints to inference-only files next to the checkpoints, which are then used by
+    pytracking.utils.loading.load_network instead of the checkpoints (see ltr.admin.loading.export_inference_network).
+
+    args:
+        net_paths - List of checkpoint paths. Relative paths are relative to the network_path in the local.py.
+                    If empty, all .pth and .pth.tar files in the network_path are exported.
+    """
+    network_path = env_settings().network_path
+    network_dirs = network_path if isinstance(network_path, (list, tuple)) else [network_path]
+
+    if not net_paths:
+        net_paths = [os.path.join(d, f) for d in network_dirs if os.path.isdir(d) for f in sorted(os.listdir(d))
+                     if (f.endswith('.pth') or f.endswith('.pth.tar')) and not f.endswith('.inference.pth')]
+
+    for net_path in net_paths:
+        if not os.path.isabs(net_path):
+            candidates = [os.path.join(d, net_path) for d in network_dirs]
+            net_path = next((p for p in candidates if os.path.isfile(p)), candidates[0])
+
+        output_path = export_inference_network(net_path)
+        print('Exported {} to {}'.format(net_path, output_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export network checkpoints for fast loading.')
+    parser.add_argument('net_paths', nargs='*', type=str, help='Checkpoint paths (default: all in network_path).')
+
+    args = parser.parse_args()
+
+    export_inference_networks(args.net_paths)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,23 +3,40 @@ import ltr.admin.loading as ltr_loading
 from pytracking.evaluation.environment import env_settings
 
 
+def _load_network(path_full, **kwargs):
+    """Load the network from the inference file exported with ltr.admin.loading.export_inference_network, if the
+    given path is such a file or if an up-to-date export of the given checkpoint exists next to it. Otherwise load the
+    training checkpoint."""
+    if path_full.endswith(ltr_loading.INFERENCE_NETWORK_SUFFIX):
+        return ltr_loading.load_inference_network(path_full, **kwargs)
+
+    inference_path = ltr_loading.inference_network_path(path_full)
+    if os.path.isfile(inference_path) and os.path.isfile(path_full) and \
+            os.path.getmtime(inference_path) >= os.path.getmtime(path_full):
+        return ltr_loading.load_inference_network(inference_path, **kwargs)
+
+    net, _ = ltr_loading.load_network(path_full, **kwargs)
+    return net
+
+
 def load_network(net_path, **kwargs):
     """Load network for tracking.
     args:
         net_path - Path to network. If it is not an absolute path, it is relative to the network_path in the local.py.
-                   See ltr.admin.loading.load_network for further details.
+                   See ltr.admin.loading.load_network for further details. If an inference file exported with
+                   ltr.admin.loading.export_inference_network exists for the checkpoint, it is loaded instead.
         **kwargs - Additional key-word arguments that are sent to ltr.admin.loading.load_network.
     """
     kwargs['backbone_pretrained'] = False
     if os.path.isabs(net_path):
         path_full = net_path
-        net, _ = ltr_loading.load_network(path_full, **kwargs)
+        net = _load_network(path_full, **kwargs)
     elif isinstance(env_settings().network_path, (list, tuple)):
         net = None
         for p in env_settings().network_path:
             path_full = os.path.join(p, net_path)
             try:
-                net, _ = ltr_loading.load_network(path_full, **kwargs)
+                net = _load_network(path_full, **kwargs)
                 break
             except Exception as e:
                 print(e)
@@ -28,6 +45,6 @@ def load_network(net_path, **kwargs):
         assert net is not None, 'Failed to load network'
     else:
         path_full = os.path.join(env_settings().network_path, net_path)
-        net, _ = ltr_loading.load_network(path_full, **kwargs)
+        net = _load_network(path_full, **kwargs)
 
     return net